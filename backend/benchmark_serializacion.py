@@ -0,0 +1,130 @@
+"""
+Benchmark de serialización de /api/predios
+Compara, sobre una FeatureCollection de filas con la forma de
+predios_completo, el camino anterior (conversión de tipos fila por fila,
+jsonable_encoder y json de la biblioteca estándar) con el actual
+(row_to_geojson_feature sin conversión y RespuestaJSON con orjson).
+
+No usa la base de datos: las filas son sintéticas, con Decimal y fechas
+como las devuelve el driver.
+
+Uso (dentro del contenedor del backend):
+    python benchmark_serializacion.py [--features 100000] [--repeticiones 3]
+"""
+
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+import argparse
+import json
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from main import row_to_geojson_feature
+from serializacion import RespuestaJSON
+
+ESTADOS = ['AL_DIA', 'MOROSO', 'EXONERADO']
+SECTORES = ['Jayllihuaya', 'Salcedo', 'Chanu Chanu', 'Alto Puno']
+
+def fila_sintetica(i: int, rng: random.Random) -> dict:
+    """Fila de predios_completo con los tipos que entrega el driver"""
+    lng = -69.98 + rng.uniform(-0.01, 0.01)
+    lat = -15.875 + rng.uniform(-0.01, 0.01)
+    monto_impuesto = Decimal(rng.randint(5000, 90000)) / 100
+    monto_arbitrios = Decimal(rng.randint(2000, 30000)) / 100
+    pago_impuesto = rng.random() < 0.6
+    pago_arbitrios = rng.random() < 0.6
+    return {
+        'id_predio': i,
+        'codigo_catastral': f"PUN-{i:06d}",
+        'sector': rng.choice(SECTORES),
+        'tipo_vivienda': 'Casa',
+        'autovaluo': Decimal(rng.randint(1000000, 9000000)) / 100,
+        'numero_vivienda': str(rng.randint(1, 999)),
+        'geom_json': {"type": "Point", "coordinates": [lng, lat]},
+        'longitud': lng,
+        'latitud': lat,
+        'id_contribuyente': i,
+        'contribuyente_nombre': f"Contribuyente {i}",
+        'contribuyente_dni': f"{rng.randint(10000000, 79999999)}",
+        'contribuyente_telefono': f"9{rng.randint(10000000, 99999999)}",
+        'id_tributo': i,
+        'estado_pago': rng.choice(ESTADOS),
+        'deuda_total': monto_impuesto * (not pago_impuesto) + monto_arbitrios * (not pago_arbitrios),
+        'monto_impuesto': monto_impuesto,
+        'pago_impuesto': pago_impuesto,
+        'monto_arbitrios': monto_arbitrios,
+        'pago_arbitrios': pago_arbitrios,
+        'ingreso_familiar': Decimal(rng.randint(50000, 500000)) / 100,
+        'cantidad_personas': rng.randint(1, 8),
+        'nivel_educativo_jefe': 'Secundaria',
+        'servicios_basicos': 'Agua, Luz',
+        'fecha_ultimo_pago': date(2024, 1, 1) + timedelta(days=rng.randint(0, 365)),
+        'orden_deuda': Decimal(0)
+    }
+
+def feature_anterior(row: dict) -> dict:
+    """row_to_geojson_feature antes de RespuestaJSON: convierte cada valor en Python"""
+    properties = dict(row)
+    geom_json = properties.pop('geom_json', None)
+    properties.pop('longitud', None)
+    properties.pop('latitud', None)
+    for key, value in properties.items():
+        if isinstance(value, datetime):
+            properties[key] = value.isoformat()
+        elif value is None:
+            properties[key] = None
+        elif isinstance(value, (int, float, str, bool)):
+            continue
+        else:
+            properties[key] = str(value)
+    return {"type": "Feature", "geometry": geom_json, "properties": properties}
+
+def coleccion(features: list) -> dict:
+    return {"type": "FeatureCollection", "features": features, "metadata": {"total": len(features)}}
+
+def serializar_anterior(rows: list) -> bytes:
+    """Diccionarios devueltos al framework: jsonable_encoder + JSONResponse (json estándar)"""
+    contenido = jsonable_encoder(coleccion([feature_anterior(row) for row in rows]))
+    return json.dumps(contenido, ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+def serializar_actual(rows: list) -> bytes:
+    """RespuestaJSON devuelta directamente por el endpoint"""
+    return RespuestaJSON(coleccion([row_to_geojson_feature(row) for row in rows])).body
+
+def medir(nombre: str, funcion, rows: list, repeticiones: int) -> float:
+    """Mejor tiempo de varias repeticiones; imprime bytes por segundo"""
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        cuerpo = funcion(rows)
+        segundos = time.perf_counter() - inicio
+        mejor = segundos if mejor is None else min(mejor, segundos)
+    velocidad = len(cuerpo) / mejor
+    print(f"  {nombre:<10} {len(cuerpo) / 1e6:8.2f} MB  {mejor:7.3f} s  {velocidad / 1e6:8.2f} MB/s")
+    return velocidad
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de serialización de /api/predios')
+    parser.add_argument('--features', type=int, default=100000, help='Features en la FeatureCollection')
+    parser.add_argument('--repeticiones', type=int, default=3, help='Repeticiones por camino (se toma la mejor)')
+    parser.add_argument('--semilla', type=int, default=42, help='Semilla de las filas sintéticas')
+    args = parser.parse_args()
+
+    rng = random.Random(args.semilla)
+    rows = [fila_sintetica(i, rng) for i in range(1, args.features + 1)]
+
+    # Ambos caminos deben producir el mismo documento
+    muestra = rows[:100]
+    if json.loads(serializar_anterior(muestra)) != json.loads(serializar_actual(muestra)):
+        raise SystemExit("[ERROR] Los dos caminos producen JSON distinto")
+
+    print(f"FeatureCollection de {args.features} features (mejor de {args.repeticiones}):")
+    anterior = medir("anterior", serializar_anterior, rows, args.repeticiones)
+    actual = medir("orjson", serializar_actual, rows, args.repeticiones)
+    print(f"\n[OK] {actual / anterior:.1f}x bytes por segundo")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Caché de respuestas en memoria del API Tributario
+LRU con expiración (TTL), límite total en bytes e invalidación por
+generación: cada escritura incrementa la generación y descarta lo guardado.
+
+GenerationCache guarda resultados intermedios (grillas, análisis) que
+valen mientras no cambie la versión con que se calcularon, acotada en
+cantidad de entradas y en tamaño total (filas, celdas...).
+"""
+
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+import hashlib
+import time
+
+class CacheEntry:
+    """Respuesta guardada: cuerpo, tipo de contenido y ETag"""
+
+    __slots__ = ('body', 'media_type', 'etag', 'expires', 'generation')
+
+    def __init__(self, body: bytes, media_type: str, expires: float, generation: int):
+        self.body = body
+        self.media_type = media_type
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        self.expires = expires
+        self.generation = generation
+
+class ResponseCache:
+    """Caché LRU + TTL acotada en bytes"""
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.generation = 0
+        self._entries: "OrderedDict[Tuple, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._stats = {'aciertos': 0, 'fallos': 0, 'invalidaciones': 0, 'expulsiones': 0}
+
+    def get(self, key: Tuple) -> Optional[CacheEntry]:
+        """Entrada vigente para la clave, o None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self._stats['fallos'] += 1
+            return None
+        if entry.generation != self.generation or entry.expires < time.monotonic():
+            self._remove(key)
+            self._stats['fallos'] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._stats['aciertos'] += 1
+        return entry
+
+    def put(self, key: Tuple, body: bytes, media_type: str, generation: int) -> CacheEntry:
+        """
+        Guarda la respuesta si fue calculada en la generación actual
+        (una escritura durante la consulta la deja obsoleta)
+        """
+        entry = CacheEntry(body, media_type, time.monotonic() + self.ttl, generation)
+        if generation != self.generation or len(body) > self.max_bytes // 4:
+            return entry
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._bytes += len(body)
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._stats['expulsiones'] += 1
+        return entry
+
+    def invalidate(self):
+        """Descarta todo lo guardado (llamar tras cada escritura)"""
+        self.generation += 1
+        self._entries.clear()
+        self._bytes = 0
+        self._stats['invalidaciones'] += 1
+
+    def _remove(self, key: Tuple):
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry.body)
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas de la caché para monitoreo"""
+        return {
+            "entradas": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "generacion": self.generation,
+            **self._stats
+        }
+
+class GenerationCache:
+    """Resultados calculados por clave, válidos solo en la generación en que se guardaron"""
+
+    def __init__(self, max_entries: int, max_size: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple, Tuple[Any, Any, int]]" = OrderedDict()
+        self._size = 0
+
+    def get(self, key: Tuple, generation: Any) -> Optional[Any]:
+        """Valor guardado para la clave si sigue vigente, o None"""
+        guardado = self._entries.get(key)
+        if guardado is None or guardado[0] != generation:
+            return None
+        self._entries.move_to_end(key)
+        return guardado[1]
+
+    def put(self, key: Tuple, value: Any, generation: Any, size: int = 1):
+        """
+        Guarda el valor calculado en la generación indicada; `size` cuenta
+        contra max_size (un valor más grande que max_size no se guarda)
+        """
+        if key in self._entries:
+            self._size -= self._entries.pop(key)[2]
+        if self.max_size is not None and size > self.max_size:
+            return
+        self._entries[key] = (generation, value, size)
+        self._size += size
+        while len(self._entries) > self.max_entries or (
+            self.max_size is not None and self._size > self.max_size
+        ):
+            self._size -= self._entries.popitem(last=False)[1][2]
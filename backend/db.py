@@ -0,0 +1,352 @@
+"""
+Capa de acceso a datos del API Tributario
+Pool de conexiones compartido y backends intercambiables:
+  - psycopg  : driver asyncio nativo (psycopg 3) con pool asíncrono
+  - psycopg2 : driver bloqueante, ejecutado en el threadpool de FastAPI
+
+Ambos backends exponen la misma interfaz asíncrona:
+
+    async with db.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT ...", params)
+            rows = await cur.fetchall()
+        await conn.commit()
+
+Las filas se devuelven como diccionarios y el SQL usa marcadores %s en
+ambos casos, por lo que las consultas no dependen del backend elegido.
+"""
+
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any
+import os
+import threading
+import time
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2.extras import RealDictCursor
+
+# Configuración de base de datos
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'postgis'),
+    'port': os.getenv('DB_PORT', '5432'),
+    'database': os.getenv('DB_NAME', 'tributario_db'),
+    'user': os.getenv('DB_USER', 'admin'),
+    'password': os.getenv('DB_PASSWORD', 'admin123'),
+    # Identifica las escrituras del API (ver estadisticas_cambios en init.sql)
+    'application_name': 'api_tributario'
+}
+
+# Backend de acceso a datos: 'psycopg' (asíncrono) o 'psycopg2' (threadpool)
+DB_BACKEND = os.getenv('DB_BACKEND', 'psycopg')
+
+# Configuración del pool de conexiones
+POOL_CONFIG = {
+    'min_size': int(os.getenv('DB_POOL_MIN', '2')),
+    'max_size': int(os.getenv('DB_POOL_MAX', '20')),
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+    'check_idle': float(os.getenv('DB_POOL_CHECK_IDLE', '30'))
+}
+
+class PoolTimeout(Exception):
+    """No se obtuvo una conexión libre dentro del tiempo de espera"""
+
+# =====================================================
+# BACKEND psycopg2 (bloqueante)
+# =====================================================
+
+class ConnectionPool:
+    """
+    Pool de conexiones compartido por todo el proceso.
+    Limita las conexiones abiertas a max_size, espera hasta `timeout`
+    segundos por una conexión libre y verifica cada conexión al prestarla.
+    """
+
+    def __init__(self, min_size, max_size, timeout, check_idle, **db_config):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self._db_config = db_config
+        self._pool = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._last_used = {}
+        self._stats = {'prestamos': 0, 'timeouts': 0, 'descartadas': 0}
+        # Conexiones prestadas y ociosas dentro del pool, contadas aquí
+        self._en_uso = 0
+        self._libres = 0
+
+    def _get_pool(self):
+        # Creación diferida: la API arranca aunque la BD aún no esté lista
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = pg_pool.ThreadedConnectionPool(
+                        self.min_size, self.max_size, **self._db_config
+                    )
+                    self._libres = self.min_size
+        return self._pool
+
+    def _take(self, pool):
+        """getconn del pool: usa una ociosa si la hay, si no abre una nueva"""
+        conn = pool.getconn()
+        with self._lock:
+            self._libres = max(self._libres - 1, 0)
+        return conn
+
+    def _is_healthy(self, conn) -> bool:
+        """Descarta conexiones cerradas y verifica las que estuvieron inactivas"""
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """Presta una conexión sana del pool"""
+        if not self._slots.acquire(timeout=self.timeout):
+            self._stats['timeouts'] += 1
+            raise PoolTimeout(f"Sin conexiones libres tras {self.timeout}s")
+        try:
+            pool = self._get_pool()
+            conn = self._take(pool)
+            while not self._is_healthy(conn):
+                self._stats['descartadas'] += 1
+                self._last_used.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+                conn = self._take(pool)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._en_uso += 1
+        self._stats['prestamos'] += 1
+        return conn
+
+    def putconn(self, conn):
+        """Devuelve la conexión al pool (hace rollback si quedó una transacción abierta)"""
+        try:
+            self._get_pool().putconn(conn, close=bool(conn.closed))
+            # El pool conserva hasta min_size ociosas y cierra las demás
+            with self._lock:
+                if conn.closed:
+                    self._last_used.pop(id(conn), None)
+                else:
+                    self._last_used[id(conn)] = time.monotonic()
+                    self._libres += 1
+        finally:
+            with self._lock:
+                self._en_uso -= 1
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas del pool para monitoreo"""
+        with self._lock:
+            en_uso, libres = self._en_uso, self._libres
+        return {
+            "min": self.min_size,
+            "max": self.max_size,
+            "abiertas": en_uso + libres,
+            "en_uso": en_uso,
+            "libres": libres,
+            **self._stats
+        }
+
+    def close(self):
+        """Cierra todas las conexiones del pool"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+            self._last_used.clear()
+            self._en_uso = 0
+            self._libres = 0
+
+class ThreadedCursor:
+    """Cursor psycopg2 con métodos awaitables ejecutados en el threadpool"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    @property
+    def itersize(self) -> int:
+        return self._cursor.itersize
+
+    @itersize.setter
+    def itersize(self, value: int):
+        self._cursor.itersize = value
+
+    async def execute(self, query, params=None):
+        await run_in_threadpool(self._cursor.execute, query, params)
+
+    async def executemany(self, query, params_seq):
+        await run_in_threadpool(self._cursor.executemany, query, params_seq)
+
+    async def fetchone(self):
+        return await run_in_threadpool(self._cursor.fetchone)
+
+    async def fetchmany(self, size: int):
+        return await run_in_threadpool(self._cursor.fetchmany, size)
+
+    async def fetchall(self):
+        return await run_in_threadpool(self._cursor.fetchall)
+
+    async def close(self):
+        await run_in_threadpool(self._cursor.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def __aiter__(self):
+        while True:
+            rows = await self.fetchmany(self._cursor.itersize)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+
+class ThreadedConnection:
+    """Conexión psycopg2 con la interfaz asíncrona de psycopg 3"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, name: Optional[str] = None) -> ThreadedCursor:
+        return ThreadedCursor(self._conn.cursor(name=name))
+
+    async def commit(self):
+        await run_in_threadpool(self._conn.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self._conn.rollback)
+
+class Psycopg2Database:
+    """Backend bloqueante: pool psycopg2 consumido desde el threadpool"""
+
+    nombre = 'psycopg2'
+
+    def __init__(self):
+        self.pool = ConnectionPool(**POOL_CONFIG, **DB_CONFIG, cursor_factory=RealDictCursor)
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        await run_in_threadpool(self.pool.close)
+
+    @asynccontextmanager
+    async def connection(self):
+        """Presta una conexión del pool durante el bloque"""
+        try:
+            conn = await run_in_threadpool(self.pool.getconn)
+        except PoolTimeout as e:
+            raise HTTPException(status_code=503, detail=f"Base de datos ocupada: {str(e)}")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error de conexión a BD: {str(e)}")
+        try:
+            yield ThreadedConnection(conn)
+        finally:
+            await run_in_threadpool(self.pool.putconn, conn)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.nombre, **self.pool.stats()}
+
+# =====================================================
+# BACKEND psycopg (asyncio nativo)
+# =====================================================
+
+class PsycopgDatabase:
+    """Backend asíncrono: psycopg 3 con AsyncConnectionPool"""
+
+    nombre = 'psycopg'
+
+    def __init__(self):
+        from psycopg.conninfo import make_conninfo
+        from psycopg.rows import dict_row
+        from psycopg_pool import AsyncConnectionPool
+
+        config = dict(DB_CONFIG)
+        config['dbname'] = config.pop('database')
+        self.pool = AsyncConnectionPool(
+            make_conninfo(**config),
+            min_size=POOL_CONFIG['min_size'],
+            max_size=POOL_CONFIG['max_size'],
+            timeout=POOL_CONFIG['timeout'],
+            max_idle=max(POOL_CONFIG['check_idle'], 60),
+            check=AsyncConnectionPool.check_connection,
+            kwargs={'row_factory': dict_row},
+            open=False
+        )
+
+    async def open(self):
+        # wait=False: la API arranca aunque la BD aún no esté lista
+        await self.pool.open(wait=False)
+
+    async def close(self):
+        await self.pool.close()
+
+    @asynccontextmanager
+    async def connection(self):
+        """Presta una conexión del pool durante el bloque"""
+        from psycopg import pq
+        from psycopg_pool import PoolTimeout as AsyncPoolTimeout
+
+        try:
+            conn = await self.pool.getconn()
+        except AsyncPoolTimeout as e:
+            raise HTTPException(status_code=503, detail=f"Base de datos ocupada: {str(e)}")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error de conexión a BD: {str(e)}")
+        try:
+            yield conn
+        finally:
+            # Igual que psycopg2: lo no confirmado se descarta al devolver la conexión
+            if conn.info.transaction_status != pq.TransactionStatus.IDLE:
+                await conn.rollback()
+            await self.pool.putconn(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.pool.get_stats()
+        return {
+            "backend": self.nombre,
+            "min": self.pool.min_size,
+            "max": self.pool.max_size,
+            "abiertas": stats.get('pool_size', 0),
+            "en_uso": stats.get('pool_size', 0) - stats.get('pool_available', 0),
+            "libres": stats.get('pool_available', 0),
+            "prestamos": stats.get('requests_num', 0),
+            "timeouts": stats.get('requests_errors', 0),
+            "descartadas": stats.get('connections_lost', 0)
+        }
+
+# =====================================================
+# SELECCIÓN DE BACKEND
+# =====================================================
+
+BACKENDS = {
+    'psycopg': PsycopgDatabase,
+    'psycopg2': Psycopg2Database
+}
+
+def create_database(backend: str = DB_BACKEND):
+    """Crea la capa de datos para el backend configurado"""
+    if backend not in BACKENDS:
+        raise ValueError(f"DB_BACKEND desconocido: {backend} (opciones: {', '.join(BACKENDS)})")
+    return BACKENDS[backend]()
@@ -3,22 +3,91 @@ Sistema de Gestión Tributaria Municipal - API Backend
 FastAPI + PostGIS
 """
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Body
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional, List, Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import os
+from fastapi.responses import Response, StreamingResponse
+from contextlib import AsyncExitStack
+from typing import Optional, List, Dict, Any, Callable
+from datetime import date
+from decimal import Decimal
+import asyncio
+import base64
+import csv
+import io
 import json
-from datetime import datetime
+import logging
+import math
+import time
+import os
+
+from db import create_database
+from cache import ResponseCache, GenerationCache
+from sugerencias import IndiceSugerencias
+from serializacion import RespuestaJSON, dumps_text
+
+logger = logging.getLogger(__name__)
 
 # Configuración
 app = FastAPI(
     title="API Tributaria Municipal",
     description="API para gestión de predios y tributos con PostGIS",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=RespuestaJSON
 )
 
+# =====================================================
+# CACHÉ DE RESPUESTAS
+# =====================================================
+
+# Lecturas cacheadas hasta la próxima escritura o hasta que venza el TTL
+response_cache = ResponseCache(
+    max_bytes=int(os.getenv('API_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+    ttl=float(os.getenv('API_CACHE_TTL', '60'))
+)
+CACHE_PATHS = {"/api/predios", "/api/predios/morosos", "/api/predios/clusters", "/api/estadisticas", "/api/sectores"}
+CACHE_PREFIXES = ("/api/tiles/",)
+
+def is_cacheable(request: Request) -> bool:
+    """Solo GET de lectura, sin streaming"""
+    if request.method != "GET" or 'stream' in request.query_params:
+        return False
+    path = request.url.path
+    return path in CACHE_PATHS or path.startswith(CACHE_PREFIXES)
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Compara If-None-Match con el ETag guardado"""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    candidatos = [value.strip().removeprefix('W/') for value in header.split(',')]
+    return etag in candidatos or '*' in candidatos
+
+# Registrada antes que CORS para que las respuestas cacheadas también lleven sus cabeceras
+@app.middleware("http")
+async def cache_respuestas(request: Request, call_next):
+    """Sirve lecturas repetidas desde memoria y responde 304 con If-None-Match"""
+    if not is_cacheable(request):
+        return await call_next(request)
+    
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+    entry = response_cache.get(key)
+    estado_cache = "HIT"
+    
+    if entry is None:
+        estado_cache = "MISS"
+        generation = response_cache.generation
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        entry = response_cache.put(key, body, response.headers.get('content-type'), generation)
+    
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache", "X-Cache": estado_cache}
+    if etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, headers=headers, media_type=entry.media_type)
+
 # CORS para permitir requests desde frontend
 app.add_middleware(
     CORSMiddleware,
@@ -28,25 +97,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configuración de base de datos
-DB_CONFIG = {
-    'host': os.getenv('DB_HOST', 'postgis'),
-    'port': os.getenv('DB_PORT', '5432'),
-    'database': os.getenv('DB_NAME', 'tributario_db'),
-    'user': os.getenv('DB_USER', 'admin'),
-    'password': os.getenv('DB_PASSWORD', 'admin123')
-}
+# Capa de acceso a datos (pool compartido, backend configurable con DB_BACKEND)
+db = create_database()
 
-def get_db_connection():
-    """Obtiene conexión a base de datos"""
-    try:
-        conn = psycopg2.connect(**DB_CONFIG, cursor_factory=RealDictCursor)
-        return conn
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error de conexión a BD: {str(e)}")
+@app.on_event("startup")
+async def open_db_pool():
+    """Abre el pool al iniciar la API"""
+    await db.open()
+    app.state.refresco_estadisticas = asyncio.create_task(ciclo_refresco_estadisticas())
+
+@app.on_event("shutdown")
+async def close_db_pool():
+    """Cierra el pool al detener la API"""
+    app.state.refresco_estadisticas.cancel()
+    await db.close()
 
 def row_to_geojson_feature(row: Dict) -> Dict:
-    """Convierte fila de BD a Feature GeoJSON"""
+    """
+    Convierte fila de BD a Feature GeoJSON
+    Fechas y montos quedan como vienen de la BD: los serializa RespuestaJSON
+    """
     properties = dict(row)
     
     # Extraer geometría
@@ -54,60 +124,197 @@ def row_to_geojson_feature(row: Dict) -> Dict:
     properties.pop('longitud', None)
     properties.pop('latitud', None)
     
-    # Convertir tipos no serializables
-    for key, value in properties.items():
-        if isinstance(value, datetime):
-            properties[key] = value.isoformat()
-        elif value is None:
-            properties[key] = None
-        elif isinstance(value, (int, float, str, bool)):
-            continue
-        else:
-            properties[key] = str(value)
-    
     return {
         "type": "Feature",
         "geometry": geom_json,
         "properties": properties
     }
 
+def row_to_map_feature(row: Dict, precision: Optional[int] = None) -> Dict:
+    """
+    Feature de una fila proyectada con `fields`: el punto se arma con
+    longitud/latitud, redondeadas a `precision` decimales si se indica
+    """
+    properties = dict(row)
+    lng = properties.pop('longitud', None)
+    lat = properties.pop('latitud', None)
+    if lng is None or lat is None:
+        geometry = None
+    else:
+        if precision is not None:
+            lng, lat = round(lng, precision), round(lat, precision)
+        geometry = {"type": "Point", "coordinates": [lng, lat]}
+    
+    return {
+        "type": "Feature",
+        "geometry": geometry,
+        "properties": properties
+    }
+
+# Paginación: tamaño por defecto y máximo de página
+PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', '1000'))
+PAGE_SIZE_MAX = int(os.getenv('API_PAGE_SIZE_MAX', '5000'))
+
+def encode_cursor(*values) -> str:
+    """Codifica la clave de la última fila como cursor opaco"""
+    raw = json.dumps([str(v) if isinstance(v, Decimal) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str, *types) -> tuple:
+    """Decodifica un cursor opaco aplicando el tipo esperado a cada valor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if len(values) != len(types):
+            raise ValueError(cursor)
+        return tuple(t(v) for t, v in zip(types, values))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+def next_cursor(rows: List[Dict], limit: int, *keys) -> Optional[str]:
+    """Cursor de la página siguiente, o None si ya no hay más filas"""
+    if len(rows) <= limit:
+        return None
+    last = rows[limit - 1]
+    return encode_cursor(*(last[k] for k in keys))
+
+# Streaming: filas leídas del cursor de servidor por cada bloque enviado
+STREAM_ITERSIZE = int(os.getenv('API_STREAM_ITERSIZE', '2000'))
+STREAM_MEDIA_TYPES = {
+    'geojson': 'application/geo+json',
+    'ndjson': 'application/x-ndjson'
+}
+
+def feature_text(row: Dict, convertir: Callable[[Dict], Dict] = row_to_geojson_feature) -> str:
+    """Feature serializada: la columna `feature` de predios_features o la fila convertida en Python"""
+    if 'feature' in row:
+        return row['feature']
+    return dumps_text(convertir(dict(row)))
+
+def feature_collection_text(features: List[str], metadata: Dict) -> str:
+    """Arma la FeatureCollection a partir de Features ya serializadas"""
+    return (
+        '{"type":"FeatureCollection","features":[' + ",".join(features) +
+        '],"metadata":' + json.dumps(metadata) + '}'
+    )
+
+async def stream_features(query: str, params, formato: str, metadata: Dict,
+                          convertir: Callable[[Dict], Dict] = row_to_geojson_feature) -> StreamingResponse:
+    """
+    Envía el resultado de la consulta como FeatureCollection (geojson) o una
+    Feature por línea (ndjson), leyendo de un cursor de servidor por bloques.
+    `convertir` arma cada Feature a partir de la fila.
+    La consulta se ejecuta antes de responder, así los errores de conexión o
+    SQL siguen devolviendo 503/500 en lugar de cortar el stream.
+    """
+    stack = AsyncExitStack()
+    try:
+        conn = await stack.enter_async_context(db.connection())
+        cur = await stack.enter_async_context(conn.cursor(name="stream_features"))
+        cur.itersize = STREAM_ITERSIZE
+        await cur.execute(query, params)
+    except HTTPException:
+        await stack.aclose()
+        raise
+    except Exception as e:
+        await stack.aclose()
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def generar():
+        try:
+            separador = "\n" if formato == 'ndjson' else ","
+            if formato == 'geojson':
+                yield '{"type":"FeatureCollection","features":['
+            total = 0
+            while True:
+                rows = await cur.fetchmany(cur.itersize)
+                if not rows:
+                    break
+                bloque = separador.join(feature_text(row, convertir) for row in rows)
+                if total and formato == 'geojson':
+                    bloque = separador + bloque
+                elif formato == 'ndjson':
+                    bloque += "\n"
+                total += len(rows)
+                yield bloque
+            if formato == 'geojson':
+                yield '],"metadata":' + json.dumps({**metadata, "total": total}) + '}'
+        finally:
+            await stack.aclose()
+    
+    return StreamingResponse(generar(), media_type=STREAM_MEDIA_TYPES[formato])
+
 # =====================================================
 # ENDPOINTS
 # =====================================================
 
 @app.get("/")
-def root():
+async def root():
     """Endpoint raíz"""
     return {
         "mensaje": "API Tributaria Municipal - Jayllihuaya",
         "version": "1.0.0",
         "endpoints": {
             "predios": "/api/predios",
+            "predio": "/api/predios/{id_predio}",
             "morosos": "/api/predios/morosos",
             "buscar": "/api/buscar?nombre={nombre}",
             "radio": "/api/predios/radio?lat={lat}&lng={lng}&radius={metros}",
+            "teselas": "/api/tiles/{z}/{x}/{y}.mvt",
             "estadisticas": "/api/estadisticas",
             "sectores": "/api/sectores"
         }
     }
 
-@app.get("/api/predios")
-def get_predios(
-    estado: Optional[str] = Query(None, description="Filtrar por estado: AL_DIA, MOROSO, EXONERADO"),
-    deuda_min: Optional[float] = Query(None, description="Deuda mínima"),
-    deuda_max: Optional[float] = Query(None, description="Deuda máxima"),
-    sector: Optional[str] = Query(None, description="Filtrar por sector")
-):
+# Máximo de predios por tesela o vista del mapa según zoom (los de mayor deuda primero)
+TILE_FEATURE_LIMITS = [
+    (10, 500),
+    (12, 2000),
+    (14, 10000)
+]
+TILE_FEATURE_LIMIT_MAX = int(os.getenv('API_TILE_MAX_FEATURES', '50000'))
+
+def tile_feature_limit(z: int) -> int:
+    """Límite de predios por tesela para el zoom dado"""
+    for zoom_max, limite in TILE_FEATURE_LIMITS:
+        if z <= zoom_max:
+            return min(limite, TILE_FEATURE_LIMIT_MAX)
+    return TILE_FEATURE_LIMIT_MAX
+
+def parse_bbox(bbox: str) -> tuple:
+    """Convierte 'minx,miny,maxx,maxy' (lng/lat) en tupla de floats"""
+    try:
+        minx, miny, maxx, maxy = (float(v) for v in bbox.split(','))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox debe ser minx,miny,maxx,maxy")
+    if minx > maxx or miny > maxy:
+        raise HTTPException(status_code=400, detail="bbox con mínimos mayores que máximos")
+    return minx, miny, maxx, maxy
+
+def orden_deuda(estado, deuda_min, deuda_max) -> str:
     """
-    Obtiene todos los predios con información tributaria en formato GeoJSON
+    Expresión de orden por deuda. Si un filtro exige tributo, deuda_total
+    nunca es NULL y se ordena por la columna directamente, lo que permite
+    recorrer idx_tributos_estado_deuda / idx_tributos_deuda en lugar de ordenar
+    todo el resultado; sin esos filtros los predios sin tributo cuentan como 0.
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Construir query con filtros dinámicos
+    if estado or deuda_min is not None or deuda_max is not None:
+        return "deuda_total"
+    return "COALESCE(deuda_total, 0)"
+
+def build_predios_filters(estado, deuda_min, deuda_max, sector, cursor, bbox=None) -> tuple:
+    """Construye el WHERE de predios_completo a partir de los filtros de la API"""
     where_clauses = []
     params = []
     
+    if bbox:
+        # Subconsulta sobre predios.geom para que use idx_predios_geom
+        where_clauses.append("""id_predio IN (
+            SELECT id_predio FROM predios
+            WHERE geom && ST_MakeEnvelope(%s, %s, %s, %s, 4326)
+        )""")
+        params.extend(parse_bbox(bbox))
+    
     if estado:
         where_clauses.append("estado_pago = %s")
         params.append(estado.upper())
@@ -121,281 +328,1052 @@ def get_predios(
         params.append(deuda_max)
     
     if sector:
-        where_clauses.append("sector ILIKE %s")
-        params.append(f"%{sector}%")
+        # Dimensión exacta (tabla sectores), servida por idx_predios_sector
+        where_clauses.append("sector = %s")
+        params.append(sector)
+    
+    if cursor:
+        where_clauses.append(f"({orden_deuda(estado, deuda_min, deuda_max)}, id_predio) < (%s, %s)")
+        params.extend(decode_cursor(cursor, Decimal, int))
     
     where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
+    return where_sql, params
+
+# Columnas de predios_completo que se pueden pedir con `fields`
+PREDIO_CAMPOS = (
+    'id_predio', 'codigo_catastral', 'sector', 'tipo_vivienda', 'autovaluo', 'numero_vivienda',
+    'id_contribuyente', 'contribuyente_nombre', 'contribuyente_dni', 'contribuyente_telefono',
+    'id_tributo', 'estado_pago', 'deuda_total', 'monto_impuesto', 'pago_impuesto',
+    'monto_arbitrios', 'pago_arbitrios', 'ingreso_familiar', 'cantidad_personas',
+    'nivel_educativo_jefe', 'servicios_basicos', 'fecha_ultimo_pago'
+)
+
+# Perfiles de /api/predios: columnas además de id_predio y coordenadas
+PREDIO_PERFILES = {
+    'map': ('estado_pago', 'deuda_total')
+}
+
+def parse_fields(fields: Optional[str], profile: Optional[str], precision: Optional[int]) -> Optional[List[str]]:
+    """
+    Columnas pedidas con `fields` y/o `profile`, o None para la fila completa
+    Con `precision` sola se proyectan todas (las coordenadas salen de longitud/latitud)
+    """
+    if not fields and not profile:
+        return list(PREDIO_CAMPOS) if precision is not None else None
+    
+    campos = ['id_predio', *PREDIO_PERFILES.get(profile, ())]
+    for campo in (fields or "").split(","):
+        campo = campo.strip()
+        if not campo or campo in campos:
+            continue
+        if campo not in PREDIO_CAMPOS:
+            raise HTTPException(status_code=400, detail=f"Campo desconocido: {campo}")
+        campos.append(campo)
+    return campos
+
+def build_predios_query(estado, deuda_min, deuda_max, sector, cursor, bbox=None,
+                        sql_json=False, limit=None, campos=None) -> tuple:
+    """
+    SELECT de predios ordenado por deuda para /api/predios. Con `limit` es
+    una página (pide una fila extra para el cursor y agrega orden_deuda);
+    sin él, el resultado completo para streaming. Con `campos` (de
+    parse_fields, incluye id_predio) solo se leen esas columnas y las coordenadas.
+    """
+    where_sql, params = build_predios_filters(estado, deuda_min, deuda_max, sector, cursor, bbox)
+    if sql_json:
+        columnas = "feature, id_predio"
+    elif campos is not None:
+        columnas = ", ".join([*campos, 'longitud', 'latitud'])
+    else:
+        columnas = "*"
+    vista = "predios_features" if sql_json else "predios_completo"
+    orden = orden_deuda(estado, deuda_min, deuda_max)
+    
+    if limit is None:
+        query = f"""
+            SELECT {columnas} FROM {vista}
+            WHERE {where_sql}
+            ORDER BY {orden} DESC, id_predio DESC
+        """
+        return query, params
     
     query = f"""
-        SELECT * FROM predios_completo
+        SELECT {columnas}, {orden} AS orden_deuda FROM {vista}
         WHERE {where_sql}
-        ORDER BY deuda_total DESC
+        ORDER BY {orden} DESC, id_predio DESC
+        LIMIT %s
     """
+    return query, params + [limit + 1]
+
+@app.get("/api/predios")
+async def get_predios(
+    estado: Optional[str] = Query(None, description="Filtrar por estado: AL_DIA, MOROSO, EXONERADO"),
+    deuda_min: Optional[float] = Query(None, description="Deuda mínima"),
+    deuda_max: Optional[float] = Query(None, description="Deuda máxima"),
+    sector: Optional[str] = Query(None, description="Filtrar por sector (nombre exacto, ver /api/sectores)"),
+    limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_SIZE_MAX, description="Predios por página"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en metadata.next_cursor"),
+    stream: Optional[str] = Query(None, pattern="^(geojson|ndjson)$", description="Enviar todo el resultado en streaming: geojson o ndjson"),
+    sql_json: bool = Query(False, description="Construir las Features en PostGIS (vista predios_features)"),
+    bbox: Optional[str] = Query(None, description="Solo predios visibles: minx,miny,maxx,maxy (lng/lat)"),
+    zoom: Optional[int] = Query(None, ge=0, le=22, description="Zoom del mapa, limita los predios devueltos"),
+    fields: Optional[str] = Query(None, description="Propiedades a incluir, separadas por coma (id_predio siempre va)"),
+    profile: Optional[str] = Query(None, pattern="^map$", description="Perfil compacto: map (id_predio, estado_pago, deuda_total)"),
+    precision: Optional[int] = Query(None, ge=0, le=8, description="Decimales de las coordenadas (5 ≈ 1 m)")
+):
+    """
+    Obtiene los predios con información tributaria en formato GeoJSON
+    Paginado por cursor sobre (deuda_total DESC, id_predio DESC)
+    Con `bbox` solo se devuelven los predios del área visible, y con `zoom`
+    la página se recorta al límite de ese nivel (metadata.truncated)
+    Con `stream` se envía el resultado completo sin paginar, por bloques
+    Con `sql_json` las Features llegan serializadas desde PostGIS y se
+    insertan en la respuesta sin decodificarlas
+    Con `fields` o `profile=map` solo se envían esas propiedades, para
+    clientes que piden el detalle en /api/predios/{id_predio}. El panel de
+    script.js carga el perfil completo: sus filtros locales, estadísticas y
+    exportación usan ingreso y servicios de cada predio
+    """
+    campos = parse_fields(fields, profile, precision)
+    if campos is not None and sql_json:
+        raise HTTPException(status_code=400, detail="sql_json no admite fields, profile ni precision")
+    convertir = row_to_geojson_feature if campos is None else (lambda row: row_to_map_feature(row, precision))
     
-    try:
-        cur.execute(query, params)
-        rows = cur.fetchall()
-        
-        # Convertir a GeoJSON
-        features = [row_to_geojson_feature(dict(row)) for row in rows]
-        
-        geojson = {
-            "type": "FeatureCollection",
-            "features": features,
-            "metadata": {
-                "total": len(features),
-                "filtros_aplicados": {
-                    "estado": estado,
-                    "deuda_min": deuda_min,
-                    "deuda_max": deuda_max,
-                    "sector": sector
-                }
+    filtros_aplicados = {
+        "estado": estado,
+        "deuda_min": deuda_min,
+        "deuda_max": deuda_max,
+        "sector": sector,
+        "bbox": bbox,
+        "zoom": zoom,
+        "campos": campos,
+        "precision": precision
+    }
+    if zoom is not None:
+        limit = min(limit, tile_feature_limit(zoom))
+    
+    if stream:
+        query, params = build_predios_query(estado, deuda_min, deuda_max, sector, cursor, bbox, sql_json, campos=campos)
+        return await stream_features(query, params, stream, {"filtros_aplicados": filtros_aplicados}, convertir)
+    
+    query, params = build_predios_query(estado, deuda_min, deuda_max, sector, cursor, bbox, sql_json, limit, campos)
+    
+    async with db.connection() as conn, conn.cursor() as cur:
+        try:
+            await cur.execute(query, params)
+            rows = await cur.fetchall()
+            cursor_siguiente = next_cursor(rows, limit, 'orden_deuda', 'id_predio')
+            metadata = {
+                "total": len(rows[:limit]),
+                "limit": limit,
+                "next_cursor": cursor_siguiente,
+                "truncated": cursor_siguiente is not None,
+                "filtros_aplicados": filtros_aplicados
             }
-        }
+            
+            if sql_json:
+                body = feature_collection_text([row['feature'] for row in rows[:limit]], metadata)
+                return Response(content=body, media_type="application/json")
+            
+            # Convertir a GeoJSON
+            features = []
+            for row in rows[:limit]:
+                row_dict = dict(row)
+                row_dict.pop('orden_deuda', None)
+                features.append(convertir(row_dict))
+            
+            geojson = {
+                "type": "FeatureCollection",
+                "features": features,
+                "metadata": metadata
+            }
+            
+            return RespuestaJSON(geojson)
         
-        return geojson
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cur.close()
-        conn.close()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/predios/morosos")
-def get_morosos():
+async def get_morosos(
+    limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_SIZE_MAX, description="Predios por página"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en metadata.next_cursor"),
+    stream: Optional[str] = Query(None, pattern="^(geojson|ndjson)$", description="Enviar todo el resultado en streaming: geojson o ndjson"),
+    sql_json: bool = Query(False, description="Construir las Features en PostGIS (vista predios_features)"),
+    fields: Optional[str] = Query(None, description="Propiedades a incluir, separadas por coma (id_predio siempre va)"),
+    profile: Optional[str] = Query(None, pattern="^map$", description="Perfil compacto: map (id_predio, estado_pago, deuda_total)"),
+    precision: Optional[int] = Query(None, ge=0, le=8, description="Decimales de las coordenadas (5 ≈ 1 m)")
+):
     """
     Obtiene solo predios con estado MOROSO
     """
-    return get_predios(estado="MOROSO")
+    return await get_predios(estado="MOROSO", deuda_min=None, deuda_max=None, sector=None,
+                             limit=limit, cursor=cursor, stream=stream, sql_json=sql_json,
+                             bbox=None, zoom=None, fields=fields, profile=profile, precision=precision)
+
+def patron_like(texto: str) -> str:
+    """Escapa los comodines de LIKE en el texto buscado"""
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
 @app.get("/api/buscar")
-def buscar_contribuyente(
-    nombre: str = Query(..., description="Nombre del contribuyente a buscar")
+async def buscar_contribuyente(
+    nombre: str = Query(..., min_length=1, description="Nombre del contribuyente, DNI o código catastral"),
+    limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_SIZE_MAX, description="Predios por página"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en metadata.next_cursor"),
+    stream: Optional[str] = Query(None, pattern="^(geojson|ndjson)$", description="Enviar todo el resultado en streaming: geojson o ndjson")
 ):
     """
-    Busca predios por nombre de contribuyente
+    Busca predios por nombre de contribuyente (aproximado, sin distinguir
+    tildes ni mayúsculas), DNI (prefijo) o código catastral (parcial).
+    Los candidatos salen de los índices de trigramas y se ordenan por
+    similitud; paginado por cursor sobre (puntaje, id_predio).
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
+    termino = nombre.strip()
+    like = patron_like(termino)
+    params = [termino, f"%{like}%", f"{like}%", f"%{like}%"]
     
-    query = """
-        SELECT * FROM predios_completo
-        WHERE contribuyente_nombre ILIKE %s
-        ORDER BY contribuyente_nombre
+    # Candidatos por nombre (similitud o subcadena), DNI y código catastral
+    ranking = """
+        WITH q AS (SELECT normalizar_busqueda(%s) AS termino),
+        candidatos AS (
+            SELECT t.id_predio, similarity(normalizar_busqueda(c.nombres), q.termino) AS puntaje
+            FROM q, contribuyentes c
+            JOIN tributos t ON t.id_contribuyente = c.id_contribuyente
+            WHERE normalizar_busqueda(c.nombres) LIKE normalizar_busqueda(%s)
+               OR normalizar_busqueda(c.nombres) %% q.termino
+            UNION ALL
+            SELECT t.id_predio, 1.0
+            FROM contribuyentes c
+            JOIN tributos t ON t.id_contribuyente = c.id_contribuyente
+            WHERE c.dni LIKE %s
+            UNION ALL
+            SELECT p.id_predio, GREATEST(similarity(normalizar_busqueda(p.codigo_catastral), q.termino), 0.5)
+            FROM q, predios p
+            WHERE normalizar_busqueda(p.codigo_catastral) LIKE normalizar_busqueda(%s)
+        ),
+        ranking AS (
+            SELECT id_predio, MAX(puntaje)::float8 AS puntaje
+            FROM candidatos
+            GROUP BY id_predio
+        )
     """
+    where_sql = "TRUE"
+    if cursor:
+        where_sql = "(r.puntaje, r.id_predio) < (%s, %s)"
+        params.extend(decode_cursor(cursor, float, int))
     
-    try:
-        cur.execute(query, (f"%{nombre}%",))
-        rows = cur.fetchall()
-        
-        features = [row_to_geojson_feature(dict(row)) for row in rows]
-        
-        return {
-            "type": "FeatureCollection",
-            "features": features,
-            "metadata": {
-                "total": len(features),
-                "busqueda": nombre
-            }
-        }
+    query = f"""
+        {ranking}
+        SELECT pc.*, r.puntaje
+        FROM ranking r
+        JOIN predios_completo pc ON pc.id_predio = r.id_predio
+        WHERE {where_sql}
+        ORDER BY r.puntaje DESC, r.id_predio DESC
+    """
     
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cur.close()
-        conn.close()
+    if stream:
+        return await stream_features(query, params, stream, {"busqueda": nombre})
+    
+    query += " LIMIT %s"
+    params.append(limit + 1)
+    
+    async with db.connection() as conn, conn.cursor() as cur:
+        try:
+            await cur.execute(query, params)
+            rows = await cur.fetchall()
+            cursor_siguiente = next_cursor(rows, limit, 'puntaje', 'id_predio')
+            
+            features = [row_to_geojson_feature(dict(row)) for row in rows[:limit]]
+            
+            return RespuestaJSON({
+                "type": "FeatureCollection",
+                "features": features,
+                "metadata": {
+                    "total": len(features),
+                    "limit": limit,
+                    "next_cursor": cursor_siguiente,
+                    "busqueda": nombre
+                }
+            })
+        
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+# =====================================================
+# SUGERENCIAS (índice de prefijos en memoria)
+# =====================================================
+
+# Índice de nombres de contribuyentes: se carga al iniciar y lo mantienen
+# los endpoints CRUD; el ciclo de estadísticas lo reconstruye solo tras
+# escrituras externas (estadisticas_cambios.externo)
+indice_sugerencias = IndiceSugerencias()
+
+SUGERENCIAS_QUERY = """
+    SELECT id_predio, contribuyente_nombre AS nombre, codigo_catastral
+    FROM predios_completo
+"""
+
+async def cargar_sugerencias() -> bool:
+    """
+    Reconstruye el índice de sugerencias desde la base de datos. Si un
+    endpoint CRUD lo modificó mientras se leían las filas, la lectura puede
+    no incluir ese cambio y se descarta (devuelve False)
+    """
+    version = indice_sugerencias.version
+    async with db.connection() as conn, conn.cursor() as cur:
+        await cur.execute(SUGERENCIAS_QUERY)
+        rows = await cur.fetchall()
+    if indice_sugerencias.version != version:
+        return False
+    indice_sugerencias.cargar(rows)
+    return True
+
+async def actualizar_sugerencias(cur, ids_predio: List[int]):
+    """
+    Vuelve a leer los predios indicados y los que comparten contribuyente con
+    ellos (renombrar un contribuyente cambia el nombre de todos sus predios)
+    """
+    await cur.execute(f"""
+        {SUGERENCIAS_QUERY}
+        WHERE id_predio = ANY(%s)
+           OR id_contribuyente IN (SELECT id_contribuyente FROM tributos WHERE id_predio = ANY(%s))
+    """, (ids_predio, ids_predio))
+    for row in await cur.fetchall():
+        indice_sugerencias.poner(row['id_predio'], row['nombre'], row['codigo_catastral'])
+
+@app.get("/api/buscar/sugerencias")
+async def buscar_sugerencias(
+    q: str = Query(..., min_length=1, description="Prefijo de alguna palabra del nombre"),
+    limit: int = Query(10, ge=1, le=100, description="Máximo de sugerencias")
+):
+    """
+    Sugerencias para el cuadro de búsqueda: (nombre, id_predio, codigo_catastral)
+    desde el índice en memoria, sin consultar la base de datos
+    """
+    if not indice_sugerencias.cargado:
+        await cargar_sugerencias()
+    return {"sugerencias": indice_sugerencias.buscar(q, limit)}
 
 @app.get("/api/predios/radio")
-def buscar_por_radio(
+async def buscar_por_radio(
     lat: float = Query(..., description="Latitud del centro"),
     lng: float = Query(..., description="Longitud del centro"),
-    radius: float = Query(500, description="Radio en metros")
+    radius: float = Query(500, description="Radio en metros"),
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX, description="Máximo de predios a devolver"),
+    k: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX, description="Modo k vecinos: los k predios más cercanos, sin radio"),
+    estado: Optional[str] = Query(None, description="Filtrar por estado: AL_DIA, MOROSO, EXONERADO")
 ):
     """
     Busca predios dentro de un radio desde un punto
-    Usa ST_DWithin con geography para precisión en metros
+    Usa ST_DWithin con geography para precisión en metros, resuelto con el
+    índice idx_predios_geog sobre predios antes de unir predios_completo.
+    Con `k` devuelve los k predios más cercanos (ORDER BY <-> con el índice)
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
+    centro = "ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography"
+    where_clauses = []
+    params = [lng, lat]
     
-    query = """
-        SELECT p.*, 
-               ST_Distance(
-                   p.geom::geography,
-                   ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography
-               ) AS distancia_metros
-        FROM predios_completo p
-        WHERE ST_DWithin(
-            p.geom::geography,
-            ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography,
-            %s
+    if k is None:
+        where_clauses.append(f"ST_DWithin(p.geom::geography, {centro}, %s)")
+        params.extend([lng, lat, radius])
+    
+    if estado:
+        where_clauses.append("t.estado_pago = %s")
+        params.append(estado.upper())
+    
+    where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
+    
+    if k is not None:
+        orden_sql = f"p.geom::geography <-> {centro}"
+        params.extend([lng, lat, k])
+    else:
+        orden_sql = "distancia_metros"
+        params.append(limit)
+    
+    query = f"""
+        WITH cercanos AS (
+            SELECT p.id_predio,
+                   ST_Distance(p.geom::geography, {centro}) AS distancia_metros
+            FROM predios p
+            LEFT JOIN tributos t ON p.id_predio = t.id_predio
+            WHERE {where_sql}
+            ORDER BY {orden_sql}
+            LIMIT %s
         )
-        ORDER BY distancia_metros
+        SELECT pc.*, c.distancia_metros
+        FROM cercanos c
+        JOIN predios_completo pc ON pc.id_predio = c.id_predio
+        ORDER BY c.distancia_metros, pc.id_predio
     """
     
-    try:
-        cur.execute(query, (lng, lat, lng, lat, radius))
-        rows = cur.fetchall()
+    async with db.connection() as conn, conn.cursor() as cur:
+        try:
+            await cur.execute(query, params)
+            rows = await cur.fetchall()
+            
+            features = []
+            for row in rows:
+                row_dict = dict(row)
+                distancia = row_dict.pop('distancia_metros', 0)
+                feature = row_to_geojson_feature(row_dict)
+                feature['properties']['distancia_metros'] = round(distancia, 2)
+                features.append(feature)
+            
+            return RespuestaJSON({
+                "type": "FeatureCollection",
+                "features": features,
+                "metadata": {
+                    "total": len(features),
+                    "centro": {"lat": lat, "lng": lng},
+                    "radio_metros": radius if k is None else None,
+                    "k": k,
+                    "estado": estado
+                }
+            })
         
-        features = []
-        for row in rows:
-            row_dict = dict(row)
-            distancia = row_dict.pop('distancia_metros', 0)
-            feature = row_to_geojson_feature(row_dict)
-            feature['properties']['distancia_metros'] = round(distancia, 2)
-            features.append(feature)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/tiles/{z}/{x}/{y}.mvt")
+async def get_tile(
+    z: int,
+    x: int,
+    y: int,
+    estado: Optional[str] = Query(None, description="Filtrar por estado: AL_DIA, MOROSO, EXONERADO"),
+    deuda_min: Optional[float] = Query(None, description="Deuda mínima"),
+    deuda_max: Optional[float] = Query(None, description="Deuda máxima"),
+    sector: Optional[str] = Query(None, description="Filtrar por sector (nombre exacto)")
+):
+    """
+    Tesela vectorial (Mapbox Vector Tile) de la capa de predios
+    Atributos: id_predio, estado_pago, deuda_total, sector
+    """
+    if not 0 <= z <= 22 or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+        raise HTTPException(status_code=400, detail=f"Tesela fuera de rango: {z}/{x}/{y}")
+    
+    where_sql, params = build_predios_filters(estado, deuda_min, deuda_max, sector, None)
+    
+    query = f"""
+        WITH bounds AS (
+            SELECT ST_TileEnvelope(%s, %s, %s) AS geom
+        ),
+        mvtgeom AS (
+            SELECT ST_AsMVTGeom(ST_Transform(p.geom, 3857), bounds.geom) AS geom,
+                   p.id_predio,
+                   t.estado_pago,
+                   t.deuda_total::float8 AS deuda_total,
+                   p.sector
+            FROM predios p
+            JOIN tributos t ON p.id_predio = t.id_predio
+            CROSS JOIN bounds
+            WHERE p.geom && ST_Transform(bounds.geom, 4326)
+              AND {where_sql}
+            ORDER BY t.deuda_total DESC
+            LIMIT %s
+        )
+        SELECT ST_AsMVT(mvtgeom.*, 'predios', 4096, 'geom') AS tile FROM mvtgeom
+    """
+    
+    async with db.connection() as conn, conn.cursor() as cur:
+        try:
+            await cur.execute(query, [z, x, y, *params, tile_feature_limit(z)])
+            row = await cur.fetchone()
+            tile = bytes(row['tile']) if row and row['tile'] is not None else b""
+            
+            return Response(content=tile, media_type="application/vnd.mapbox-vector-tile")
         
-        return {
-            "type": "FeatureCollection",
-            "features": features,
-            "metadata": {
-                "total": len(features),
-                "centro": {"lat": lat, "lng": lng},
-                "radio_metros": radius
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+# Clusters: tamaño de celda en píxeles de pantalla (teselas de 256 px)
+CLUSTER_PIXELS = int(os.getenv('API_CLUSTER_PIXELS', '60'))
+
+def cluster_cell_size(z: int) -> float:
+    """Lado de la celda de agrupación en grados para el zoom dado"""
+    return 360.0 / (256 * 2 ** z) * CLUSTER_PIXELS
+
+@app.get("/api/predios/clusters")
+async def get_clusters(
+    zoom: int = Query(..., ge=0, le=22, description="Zoom del mapa, define el tamaño de celda"),
+    bbox: Optional[str] = Query(None, description="Área visible: minx,miny,maxx,maxy (lng/lat)"),
+    estado: Optional[str] = Query(None, description="Filtrar por estado: AL_DIA, MOROSO, EXONERADO"),
+    deuda_min: Optional[float] = Query(None, description="Deuda mínima"),
+    deuda_max: Optional[float] = Query(None, description="Deuda máxima"),
+    sector: Optional[str] = Query(None, description="Filtrar por sector (nombre exacto)")
+):
+    """
+    Predios agrupados en una grilla (ST_SnapToGrid) para vistas alejadas:
+    un punto por celda en el centroide de sus predios, con cantidad, deuda
+    total y cantidad por estado de pago. Mismos filtros que /api/predios.
+    """
+    where_sql, params = build_predios_filters(estado, deuda_min, deuda_max, sector, None, bbox)
+    celda = cluster_cell_size(zoom)
+    
+    query = f"""
+        SELECT COUNT(*) AS cantidad,
+               COALESCE(SUM(deuda_total), 0)::float8 AS deuda_total,
+               COUNT(*) FILTER (WHERE estado_pago = 'AL_DIA') AS al_dia,
+               COUNT(*) FILTER (WHERE estado_pago = 'MOROSO') AS morosos,
+               COUNT(*) FILTER (WHERE estado_pago = 'EXONERADO') AS exonerados,
+               COUNT(*) FILTER (WHERE estado_pago IS NULL) AS sin_tributo,
+               AVG(longitud) AS longitud,
+               AVG(latitud) AS latitud,
+               MIN(id_predio) AS id_predio
+        FROM predios_completo
+        WHERE {where_sql}
+        GROUP BY ST_SnapToGrid(ST_MakePoint(longitud, latitud), %s)
+    """
+    params.append(celda)
+    
+    async with db.connection() as conn, conn.cursor() as cur:
+        try:
+            await cur.execute(query, params)
+            rows = await cur.fetchall()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    features = []
+    for row in rows:
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [row['longitud'], row['latitud']]},
+            "properties": {
+                "cantidad": row['cantidad'],
+                "deuda_total": round(row['deuda_total'], 2),
+                "estados": {
+                    "AL_DIA": row['al_dia'],
+                    "MOROSO": row['morosos'],
+                    "EXONERADO": row['exonerados'],
+                    "SIN_TRIBUTO": row['sin_tributo']
+                },
+                # Celda con un solo predio: se puede abrir su detalle directamente
+                "id_predio": row['id_predio'] if row['cantidad'] == 1 else None
+            }
+        })
+    
+    return {
+        "type": "FeatureCollection",
+        "features": features,
+        "metadata": {
+            "clusters": len(features),
+            "predios": sum(f["properties"]["cantidad"] for f in features),
+            "zoom": zoom,
+            "celda_grados": celda,
+            "filtros_aplicados": {
+                "estado": estado,
+                "deuda_min": deuda_min,
+                "deuda_max": deuda_max,
+                "sector": sector,
+                "bbox": bbox
             }
         }
+    }
+
+# =====================================================
+# MAPA DE CALOR (grilla agregada por resolución)
+# =====================================================
+
+# Grillas completas por resolución, acotadas en cantidad y en celdas totales
+# (a 10 m una grilla completa puede tener tantas celdas como predios)
+HEATMAP_CACHE_MAX = int(os.getenv('API_HEATMAP_CACHE_MAX', '16'))
+HEATMAP_CACHE_CELDAS = int(os.getenv('API_HEATMAP_CACHE_CELDAS', '200000'))
+heatmap_cache = GenerationCache(HEATMAP_CACHE_MAX, HEATMAP_CACHE_CELDAS)
+
+async def version_datos() -> tuple:
+    """
+    Versión de los datos para los resultados calculados en memoria: la
+    generación local (escrituras de este proceso) y el último refresco de
+    estadísticas en la BD, que ve todo proceso o réplica del API tras las
+    escrituras de cualquiera de ellos
+    """
+    generacion = response_cache.generation
+    async with db.connection() as conn, conn.cursor() as cur:
+        await cur.execute("SELECT actualizado_en FROM estadisticas_refresco")
+        refresco = await cur.fetchone()
+    return generacion, refresco['actualizado_en'] if refresco else None
+
+async def heatmap_grid(resolucion: int, version: Optional[tuple] = None) -> List[Dict]:
+    """Celdas de `resolucion` metros (EPSG:3857) con predios, morosos y deuda"""
+    version = version or await version_datos()
+    celdas = heatmap_cache.get((resolucion,), version)
+    if celdas is not None:
+        return celdas
+    
+    query = """
+        SELECT c.i, c.j, c.predios, c.morosos, c.deuda_total,
+               ST_X(centro) AS lng, ST_Y(centro) AS lat
+        FROM (
+            SELECT floor(ST_X(p.g) / %s)::bigint AS i,
+                   floor(ST_Y(p.g) / %s)::bigint AS j,
+                   COUNT(*) AS predios,
+                   COUNT(*) FILTER (WHERE t.estado_pago = 'MOROSO') AS morosos,
+                   COALESCE(SUM(t.deuda_total), 0)::float8 AS deuda_total
+            FROM (SELECT id_predio, ST_Transform(geom, 3857) AS g FROM predios) p
+            LEFT JOIN tributos t ON t.id_predio = p.id_predio
+            GROUP BY 1, 2
+        ) c
+        CROSS JOIN LATERAL ST_Transform(
+            ST_SetSRID(ST_MakePoint((c.i + 0.5) * %s, (c.j + 0.5) * %s), 3857), 4326
+        ) AS centro
+    """
+    async with db.connection() as conn, conn.cursor() as cur:
+        await cur.execute(query, (resolucion,) * 4)
+        celdas = [dict(row) for row in await cur.fetchall()]
     
+    heatmap_cache.put((resolucion,), celdas, version, size=len(celdas))
+    return celdas
+
+@app.get("/api/heatmap")
+async def get_heatmap(
+    resolucion: int = Query(100, ge=10, le=10000, description="Lado de la celda en metros"),
+    bbox: Optional[str] = Query(None, description="Área visible: minx,miny,maxx,maxy (lng/lat)")
+):
+    """
+    Mapa de calor de deuda y morosidad: grilla de celdas con cantidad de
+    predios, morosos, tasa de morosidad, deuda total y peso normalizado
+    (deuda de la celda / máxima deuda del área)
+    """
+    try:
+        celdas = await heatmap_grid(resolucion)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cur.close()
-        conn.close()
+    
+    if bbox:
+        minx, miny, maxx, maxy = parse_bbox(bbox)
+        celdas = [c for c in celdas if minx <= c['lng'] <= maxx and miny <= c['lat'] <= maxy]
+    
+    max_deuda = max((c['deuda_total'] for c in celdas), default=0) or 1
+    return {
+        "celdas": [
+            {
+                "lat": c['lat'],
+                "lng": c['lng'],
+                "predios": c['predios'],
+                "morosos": c['morosos'],
+                "tasa_morosidad": round(c['morosos'] / c['predios'], 4),
+                "deuda_total": round(c['deuda_total'], 2),
+                "peso": round(c['deuda_total'] / max_deuda, 4)
+            }
+            for c in celdas
+        ],
+        "metadata": {
+            "resolucion": resolucion,
+            "celdas": len(celdas),
+            "bbox": bbox,
+            "generacion": response_cache.generation
+        }
+    }
 
-@app.get("/api/estadisticas")
-def get_estadisticas():
+# =====================================================
+# ANÁLISIS ESPACIAL (zonas y puntos calientes)
+# =====================================================
+
+# Resultados de análisis por parámetros; se invalidan con version_datos()
+# (escrituras de este proceso, o refresco tras cambios de cualquier proceso)
+analisis_cache = GenerationCache(
+    int(os.getenv('API_ANALISIS_CACHE_MAX', '16')),
+    int(os.getenv('API_ANALISIS_CACHE_FILAS', '200000'))
+)
+
+# Umbrales de z de Gi* (90%, 95% y 99% de confianza)
+HOTSPOT_NIVELES = [(2.58, "99"), (1.96, "95"), (1.65, "90")]
+
+def getis_ord(valores: Dict[Any, float], vecinos: Dict[Any, List[Any]]) -> Dict[Any, float]:
     """
-    Obtiene estadísticas generales del sistema tributario
+    Puntaje z de Getis-Ord Gi* con pesos binarios: cada unidad se compara
+    con la suma de su vecindario (ella incluida) respecto de la media global
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
+    n = len(valores)
+    if n < 2:
+        return {k: 0.0 for k in valores}
+    media = sum(valores.values()) / n
+    desvio = math.sqrt(max(sum(v * v for v in valores.values()) / n - media * media, 0))
+    if desvio == 0:
+        return {k: 0.0 for k in valores}
     
-    try:
-        # Total de predios
-        cur.execute("SELECT COUNT(*) FROM predios")
-        total_predios = cur.fetchone()[0]
-        
-        # Distribución por estado
-        cur.execute("""
-            SELECT estado_pago, COUNT(*) as cantidad, SUM(deuda_total) as deuda
-            FROM tributos
-            GROUP BY estado_pago
-        """)
-        distribucion_estado = {row['estado_pago']: {
-            'cantidad': row['cantidad'],
-            'deuda_total': float(row['deuda'] or 0)
-        } for row in cur.fetchall()}
-        
-        # Deuda total municipal
-        cur.execute("SELECT SUM(deuda_total) FROM tributos WHERE estado_pago = 'MOROSO'")
-        deuda_total_morosos = float(cur.fetchone()[0] or 0)
-        
-        # Sector con mayor deuda
-        cur.execute("""
-            SELECT p.sector, COUNT(*) as cantidad_morosos, SUM(t.deuda_total) as deuda_sector
-            FROM predios p
-            JOIN tributos t ON p.id_predio = t.id_predio
-            WHERE t.estado_pago = 'MOROSO'
-            GROUP BY p.sector
-            ORDER BY deuda_sector DESC
-            LIMIT 1
-        """)
-        sector_critico = cur.fetchone()
-        
-        # Promedio de ingreso familiar
-        cur.execute("SELECT AVG(ingreso_familiar) FROM tributos WHERE ingreso_familiar IS NOT NULL")
-        promedio_ingreso = float(cur.fetchone()[0] or 0)
-        
-        # Porcentaje de cumplimiento
-        morosos = distribucion_estado.get('MOROSO', {}).get('cantidad', 0)
-        al_dia = distribucion_estado.get('AL_DIA', {}).get('cantidad', 0)
-        exonerados = distribucion_estado.get('EXONERADO', {}).get('cantidad', 0)
-        total_contribuyentes = morosos + al_dia + exonerados
-        
-        porcentaje_cumplimiento = (al_dia / total_contribuyentes * 100) if total_contribuyentes > 0 else 0
+    puntajes = {}
+    for k in valores:
+        vecindario = [k] + [v for v in vecinos.get(k, []) if v in valores]
+        w = len(vecindario)
+        suma = sum(valores[v] for v in vecindario)
+        denominador = desvio * math.sqrt((n * w - w * w) / (n - 1))
+        puntajes[k] = (suma - media * w) / denominador if denominador > 0 else 0.0
+    return puntajes
+
+def clasificar_hotspot(z: float) -> str:
+    """Categoría del puntaje Gi*: caliente_99, frio_95, ... o no_significativo"""
+    for umbral, confianza in HOTSPOT_NIVELES:
+        if z >= umbral:
+            return f"caliente_{confianza}"
+        if z <= -umbral:
+            return f"frio_{confianza}"
+    return "no_significativo"
+
+def indicadores(fila: Dict) -> Dict:
+    """Tasa de morosidad y deuda de una zona o celda"""
+    predios = fila['predios']
+    return {
+        "predios": predios,
+        "morosos": fila['morosos'],
+        "tasa_morosidad": round(fila['morosos'] / predios, 4) if predios else 0.0,
+        "deuda_total": round(float(fila['deuda_total']), 2)
+    }
+
+@app.get("/api/zonas")
+async def get_zonas(
+    tipo: Optional[str] = Query(None, description="Tipo de zona (SECTOR, COBRANZA, ...)")
+):
+    """Polígonos de sectores y zonas como GeoJSON"""
+    query = """
+        SELECT id_zona, nombre, tipo, ST_AsGeoJSON(geom)::json AS geom_json
+        FROM zonas
+    """
+    params = []
+    if tipo:
+        query += " WHERE tipo = %s"
+        params.append(tipo.upper())
+    query += " ORDER BY tipo, nombre"
+    
+    async with db.connection() as conn, conn.cursor() as cur:
+        try:
+            await cur.execute(query, params)
+            rows = await cur.fetchall()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    return RespuestaJSON({
+        "type": "FeatureCollection",
+        "features": [row_to_geojson_feature(dict(row)) for row in rows]
+    })
+
+@app.post("/api/zonas")
+async def cargar_zonas(coleccion: Dict[str, Any] = Body(..., description="FeatureCollection de polígonos con propiedades nombre y tipo")):
+    """
+    Crea o reemplaza zonas desde un FeatureCollection GeoJSON (lng/lat).
+    Una zona se identifica por (tipo, nombre); tipo por defecto SECTOR.
+    """
+    features = coleccion.get("features")
+    if coleccion.get("type") != "FeatureCollection" or not isinstance(features, list) or not features:
+        raise HTTPException(status_code=400, detail="Se esperaba un FeatureCollection con polígonos")
+    if len(features) > BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"El lote excede el máximo de {BATCH_MAX} elementos")
+    for i, feature in enumerate(features):
+        if not (feature.get("properties") or {}).get("nombre"):
+            raise HTTPException(status_code=400, detail=f"La zona {i} no tiene propiedad nombre")
+    
+    async with db.connection() as conn, conn.cursor() as cur:
+        try:
+            await cur.execute("""
+                INSERT INTO zonas (nombre, tipo, geom)
+                SELECT f -> 'properties' ->> 'nombre',
+                       UPPER(COALESCE(f -> 'properties' ->> 'tipo', 'SECTOR')),
+                       ST_Multi(ST_SetSRID(ST_GeomFromGeoJSON(f ->> 'geometry'), 4326))
+                FROM jsonb_array_elements(%s::jsonb) AS f
+                ON CONFLICT (tipo, nombre) DO UPDATE SET geom = EXCLUDED.geom
+                RETURNING id_zona, nombre, tipo
+            """, (json.dumps(features),))
+            rows = await cur.fetchall()
+            await conn.commit()
+            response_cache.invalidate()
+        except Exception as e:
+            await conn.rollback()
+            raise HTTPException(status_code=400, detail=f"Error cargando zonas: {str(e)}")
+    
+    return {"success": True, "zonas": [dict(row) for row in rows]}
+
+async def analisis_zonas(tipo: Optional[str]) -> tuple:
+    """Indicadores por zona (ST_Contains sobre idx_predios_geom) y pares de zonas vecinas"""
+    filtro = "WHERE z.tipo = %s" if tipo else ""
+    params = [tipo.upper()] if tipo else []
+    
+    async with db.connection() as conn, conn.cursor() as cur:
+        await cur.execute(f"""
+            SELECT z.id_zona, z.nombre, z.tipo,
+                   COUNT(p.id_predio) AS predios,
+                   COUNT(*) FILTER (WHERE t.estado_pago = 'MOROSO') AS morosos,
+                   COALESCE(SUM(t.deuda_total), 0)::float8 AS deuda_total
+            FROM zonas z
+            LEFT JOIN predios p ON ST_Contains(z.geom, p.geom)
+            LEFT JOIN tributos t ON t.id_predio = p.id_predio
+            {filtro}
+            GROUP BY z.id_zona
+            ORDER BY z.id_zona
+        """, params)
+        zonas = await cur.fetchall()
         
-        return {
-            "resumen": {
-                "total_predios": total_predios,
-                "total_contribuyentes": total_contribuyentes,
-                "deuda_total_municipal": round(deuda_total_morosos, 2),
-                "promedio_ingreso_familiar": round(promedio_ingreso, 2),
-                "porcentaje_cumplimiento": round(porcentaje_cumplimiento, 2)
-            },
-            "distribucion_estado": distribucion_estado,
-            "sector_critico": {
-                "nombre": sector_critico['sector'] if sector_critico else None,
-                "cantidad_morosos": sector_critico['cantidad_morosos'] if sector_critico else 0,
-                "deuda_total": float(sector_critico['deuda_sector'] or 0) if sector_critico else 0
-            },
-            "indicadores": {
-                "morosos": morosos,
-                "al_dia": al_dia,
-                "exonerados": exonerados
+        await cur.execute(f"""
+            SELECT z.id_zona AS a, b.id_zona AS b
+            FROM zonas z
+            JOIN zonas b ON z.id_zona < b.id_zona AND ST_Intersects(z.geom, b.geom)
+            {filtro}{" AND b.tipo = z.tipo" if tipo else ""}
+        """, params)
+        pares = await cur.fetchall()
+    return zonas, pares
+
+@app.get("/api/analisis/hotspots")
+async def get_hotspots(
+    resolucion: int = Query(250, ge=10, le=10000, description="Lado de la celda de la grilla en metros"),
+    variable: str = Query("morosidad", pattern="^(morosidad|deuda)$", description="Variable analizada: morosidad (tasa) o deuda (total)"),
+    tipo: Optional[str] = Query(None, description="Tipo de zona a analizar (por defecto todas)")
+):
+    """
+    Morosidad y deuda por zona (polígonos) y por celda de grilla, con puntaje
+    Getis-Ord Gi* de la variable elegida: en zonas, vecinas son las que se
+    tocan; en la grilla, las 8 celdas adyacentes con predios.
+    """
+    clave = (resolucion, variable, (tipo or "").upper())
+    try:
+        version = await version_datos()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    resultado = analisis_cache.get(clave, version)
+    if resultado is not None:
+        return resultado
+    
+    inicio = time.perf_counter()
+    try:
+        zonas, pares = await analisis_zonas(tipo)
+        celdas = await heatmap_grid(resolucion, version)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    def valor(fila):
+        if variable == "deuda":
+            return float(fila['deuda_total'])
+        return fila['morosos'] / fila['predios'] if fila['predios'] else 0.0
+    
+    # Zonas: vecindad por contacto entre polígonos
+    vecinos_zonas: Dict[int, List[int]] = {}
+    for par in pares:
+        vecinos_zonas.setdefault(par['a'], []).append(par['b'])
+        vecinos_zonas.setdefault(par['b'], []).append(par['a'])
+    z_zonas = getis_ord({z['id_zona']: valor(z) for z in zonas}, vecinos_zonas)
+    
+    # Grilla: vecindad de reina (8 celdas alrededor)
+    valores_celdas = {(c['i'], c['j']): valor(c) for c in celdas}
+    vecinos_celdas = {
+        (i, j): [(i + di, j + dj) for di in (-1, 0, 1) for dj in (-1, 0, 1) if di or dj]
+        for i, j in valores_celdas
+    }
+    z_celdas = getis_ord(valores_celdas, vecinos_celdas)
+    
+    resultado = {
+        "zonas": [
+            {
+                "id_zona": z['id_zona'],
+                "nombre": z['nombre'],
+                "tipo": z['tipo'],
+                **indicadores(z),
+                "gi_z": round(z_zonas[z['id_zona']], 4),
+                "hotspot": clasificar_hotspot(z_zonas[z['id_zona']])
+            }
+            for z in zonas
+        ],
+        "celdas": [
+            {
+                "lat": c['lat'],
+                "lng": c['lng'],
+                **indicadores(c),
+                "gi_z": round(z_celdas[(c['i'], c['j'])], 4),
+                "hotspot": clasificar_hotspot(z_celdas[(c['i'], c['j'])])
             }
+            for c in celdas
+        ],
+        "metadata": {
+            "resolucion": resolucion,
+            "variable": variable,
+            "tipo": tipo,
+            "generacion": version[0],
+            "segundos": round(time.perf_counter() - inicio, 4)
         }
+    }
+    analisis_cache.put(clave, resultado, version, size=len(zonas) + len(celdas))
+    return resultado
+
+# =====================================================
+# ESTADÍSTICAS PRECALCULADAS
+# =====================================================
+
+# Segundos entre revisiones de cambios pendientes en las estadísticas
+STATS_REFRESH_SECONDS = float(os.getenv('API_STATS_REFRESH_SECONDS', '30'))
+
+async def refrescar_estadisticas(forzar: bool = False) -> tuple:
+    """
+    Refresca estadisticas_sector_estado si hubo escrituras desde el último
+    refresco. Consume solo las marcas de transacciones ya confirmadas (las
+    que sigan abiertas quedan para el próximo ciclo) y en la misma
+    transacción que el refresco: si falla, las marcas vuelven con el rollback.
+    Devuelve (refrescado, hubo escrituras externas al API).
+    """
+    async with db.connection() as conn, conn.cursor() as cur:
+        try:
+            await cur.execute("DELETE FROM estadisticas_cambios RETURNING externo")
+            marcas = await cur.fetchall()
+            if not marcas and not forzar:
+                await conn.rollback()
+                return False, False
+            await cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY estadisticas_sector_estado")
+            await cur.execute("UPDATE estadisticas_refresco SET actualizado_en = NOW()")
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+    response_cache.invalidate()
+    return True, any(marca['externo'] for marca in marcas)
+
+async def ciclo_refresco_estadisticas():
+    """Tarea de fondo: refresca las estadísticas cada STATS_REFRESH_SECONDS"""
+    recargar = True
+    while True:
+        try:
+            _, externos = await refrescar_estadisticas()
+            # Escrituras externas (migraciones, sync, psql) o índice sin cargar;
+            # las del API ya las aplicó el CRUD. Se reintenta si se descartó o falló
+            if externos or not indice_sugerencias.cargado:
+                recargar = True
+            if recargar:
+                recargar = not await cargar_sugerencias()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("No se pudieron refrescar las estadísticas: %s", e)
+        await asyncio.sleep(STATS_REFRESH_SECONDS)
+
+async def leer_estadisticas() -> tuple:
+    """Filas de estadisticas_sector_estado y su frescura"""
+    async with db.connection() as conn, conn.cursor() as cur:
+        await cur.execute("SELECT * FROM estadisticas_sector_estado")
+        rows = await cur.fetchall()
+        await cur.execute("""
+            SELECT actualizado_en, EXISTS (SELECT 1 FROM estadisticas_cambios) AS pendiente
+            FROM estadisticas_refresco
+        """)
+        refresco = await cur.fetchone()
     
+    frescura = {
+        "actualizado_en": refresco['actualizado_en'].isoformat() if refresco and refresco['actualizado_en'] else None,
+        "cambios_pendientes": bool(refresco['pendiente']) if refresco else True
+    }
+    return rows, frescura
+
+@app.get("/api/estadisticas")
+async def get_estadisticas():
+    """
+    Obtiene estadísticas generales del sistema tributario
+    Se leen de la vista materializada estadisticas_sector_estado
+    """
+    try:
+        rows, frescura = await leer_estadisticas()
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cur.close()
-        conn.close()
+    
+    total_predios = sum(row['predios'] for row in rows)
+    
+    # Distribución por estado y sectores con morosos
+    distribucion_estado = {}
+    deuda_morosos_sector = {}
+    ingreso_suma = 0
+    ingreso_cantidad = 0
+    for row in rows:
+        estado = row['estado_pago']
+        if estado == 'SIN_TRIBUTO':
+            continue
+        dist = distribucion_estado.setdefault(estado, {'cantidad': 0, 'deuda_total': 0.0})
+        dist['cantidad'] += row['cantidad']
+        dist['deuda_total'] += float(row['deuda_total'])
+        ingreso_suma += float(row['ingreso_suma'])
+        ingreso_cantidad += row['ingreso_cantidad']
+        if estado == 'MOROSO':
+            deuda_morosos_sector[row['sector']] = (row['cantidad'], float(row['deuda_total']))
+    
+    # Deuda total municipal
+    deuda_total_morosos = distribucion_estado.get('MOROSO', {}).get('deuda_total', 0)
+    
+    # Sector con mayor deuda
+    sector_critico = max(deuda_morosos_sector.items(), key=lambda item: item[1][1], default=None)
+    
+    # Promedio de ingreso familiar
+    promedio_ingreso = ingreso_suma / ingreso_cantidad if ingreso_cantidad else 0
+    
+    # Porcentaje de cumplimiento
+    morosos = distribucion_estado.get('MOROSO', {}).get('cantidad', 0)
+    al_dia = distribucion_estado.get('AL_DIA', {}).get('cantidad', 0)
+    exonerados = distribucion_estado.get('EXONERADO', {}).get('cantidad', 0)
+    total_contribuyentes = morosos + al_dia + exonerados
+    
+    porcentaje_cumplimiento = (al_dia / total_contribuyentes * 100) if total_contribuyentes > 0 else 0
+    
+    return {
+        "resumen": {
+            "total_predios": total_predios,
+            "total_contribuyentes": total_contribuyentes,
+            "deuda_total_municipal": round(deuda_total_morosos, 2),
+            "promedio_ingreso_familiar": round(promedio_ingreso, 2),
+            "porcentaje_cumplimiento": round(porcentaje_cumplimiento, 2)
+        },
+        "distribucion_estado": distribucion_estado,
+        "sector_critico": {
+            "nombre": sector_critico[0] if sector_critico else None,
+            "cantidad_morosos": sector_critico[1][0] if sector_critico else 0,
+            "deuda_total": sector_critico[1][1] if sector_critico else 0
+        },
+        "indicadores": {
+            "morosos": morosos,
+            "al_dia": al_dia,
+            "exonerados": exonerados
+        },
+        "frescura": frescura
+    }
 
 @app.get("/api/sectores")
-def get_sectores():
+async def get_sectores():
     """
     Obtiene lista de sectores con estadísticas
+    Se leen de la vista materializada estadisticas_sector_estado
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    query = """
-        SELECT 
-            p.sector,
-            COUNT(*) as total_predios,
-            COUNT(CASE WHEN t.estado_pago = 'MOROSO' THEN 1 END) as morosos,
-            COUNT(CASE WHEN t.estado_pago = 'AL_DIA' THEN 1 END) as al_dia,
-            SUM(CASE WHEN t.estado_pago = 'MOROSO' THEN t.deuda_total ELSE 0 END) as deuda_total
-        FROM predios p
-        LEFT JOIN tributos t ON p.id_predio = t.id_predio
-        GROUP BY p.sector
-        ORDER BY deuda_total DESC
-    """
-    
     try:
-        cur.execute(query)
-        rows = cur.fetchall()
-        
-        sectores = []
-        for row in rows:
-            sectores.append({
-                "sector": row['sector'],
-                "total_predios": row['total_predios'],
-                "morosos": row['morosos'],
-                "al_dia": row['al_dia'],
-                "deuda_total": float(row['deuda_total'] or 0),
-                "porcentaje_morosidad": round((row['morosos'] / row['total_predios'] * 100) if row['total_predios'] > 0 else 0, 2)
-            })
-        
-        return {"sectores": sectores}
-    
+        rows, frescura = await leer_estadisticas()
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cur.close()
-        conn.close()
+    
+    por_sector = {}
+    for row in rows:
+        sector = por_sector.setdefault(row['sector'], {
+            "sector": row['sector'],
+            "total_predios": 0,
+            "morosos": 0,
+            "al_dia": 0,
+            "deuda_total": 0.0
+        })
+        sector['total_predios'] += row['cantidad']
+        if row['estado_pago'] == 'MOROSO':
+            sector['morosos'] += row['cantidad']
+            sector['deuda_total'] += float(row['deuda_total'])
+        elif row['estado_pago'] == 'AL_DIA':
+            sector['al_dia'] += row['cantidad']
+    
+    sectores = sorted(por_sector.values(), key=lambda sector: sector['deuda_total'], reverse=True)
+    for sector in sectores:
+        sector['porcentaje_morosidad'] = round((sector['morosos'] / sector['total_predios'] * 100) if sector['total_predios'] > 0 else 0, 2)
+    
+    return {"sectores": sectores, "frescura": frescura}
 
 @app.get("/health")
-def health_check():
+async def health_check():
     """Endpoint de salud para monitoreo"""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT 1")
-        cur.close()
-        conn.close()
-        return {"status": "healthy", "database": "connected"}
-    except:
-        return {"status": "unhealthy", "database": "disconnected"}
+        async with db.connection() as conn, conn.cursor() as cur:
+            await cur.execute("SELECT 1")
+        return {"status": "healthy", "database": "connected", "pool": db.stats(), "cache": response_cache.stats(), "sugerencias": indice_sugerencias.stats()}
+    except Exception:
+        return {"status": "unhealthy", "database": "disconnected", "pool": db.stats(), "cache": response_cache.stats(), "sugerencias": indice_sugerencias.stats()}
 
 # =====================================================
 # ENDPOINTS CRUD
@@ -437,230 +1415,803 @@ class PredioUpdate(BaseModel):
     latitud: Optional[float] = None
     longitud: Optional[float] = None
 
-@app.post("/api/predios")
-def crear_predio(predio: PredioCreate):
+class PredioUpdateLote(PredioUpdate):
+    """Actualización de un predio dentro de un lote"""
+    id_predio: int
+
+# =====================================================
+# ENDPOINTS DE LOTE (muchos predios en una transacción)
+# =====================================================
+
+# Máximo de elementos por lote
+BATCH_MAX = int(os.getenv('API_BATCH_MAX', '5000'))
+
+# Modos de lote: 'todo' confirma solo si todos los elementos son válidos;
+# 'parcial' aplica los válidos e informa el error de los demás
+BATCH_MODOS = "^(todo|parcial)$"
+
+# Límites de las columnas (init.sql) que la validación previa revisa por
+# elemento, para que un valor fuera de rango no haga fallar todo el lote
+LOTE_LONGITUDES = {
+    'codigo_catastral': 50,
+    'sector': 100,
+    'tipo_vivienda': 50,
+    'numero_vivienda': 20,
+    'contribuyente_nombre': 200
+}
+LOTE_DECIMALES = ('autovaluo', 'monto_impuesto', 'monto_arbitrios', 'ingreso_familiar')
+DECIMAL_MAX = 10 ** 8  # DECIMAL(10,2)
+INT_MAX = 2 ** 31 - 1
+
+def validar_elemento(item: BaseModel) -> Optional[str]:
+    """Primer valor del elemento que no cabe en su columna, o None"""
+    for campo, maximo in LOTE_LONGITUDES.items():
+        valor = getattr(item, campo, None)
+        if valor is not None and len(valor) > maximo:
+            return f"{campo} excede {maximo} caracteres"
+    for campo in ('latitud', 'longitud', *LOTE_DECIMALES):
+        valor = getattr(item, campo, None)
+        if valor is not None and not math.isfinite(valor):
+            return f"{campo} no es un número válido"
+    for campo in LOTE_DECIMALES:
+        valor = getattr(item, campo, None)
+        if valor is not None and abs(round(valor, 2)) >= DECIMAL_MAX:
+            return f"{campo} excede el máximo de {DECIMAL_MAX - 0.01:.2f}"
+    # deuda_total (trigger) suma impuesto y arbitrios impagos
+    deuda = abs(getattr(item, 'monto_impuesto', None) or 0) + abs(getattr(item, 'monto_arbitrios', None) or 0)
+    if round(deuda, 2) >= DECIMAL_MAX:
+        return f"La deuda total excede el máximo de {DECIMAL_MAX - 0.01:.2f}"
+    cantidad = getattr(item, 'cantidad_personas', None)
+    if cantidad is not None and not 0 <= cantidad <= INT_MAX:
+        return "cantidad_personas fuera de rango"
+    return None
+
+def primera_linea(error: Exception) -> str:
+    """Mensaje de un error de la BD sin el detalle de contexto"""
+    return (str(error).strip().splitlines() or [type(error).__name__])[0]
+
+async def aplicar_lote(cur, aplicar, validos: List[int], errores: Dict[int, str]) -> Dict[int, Any]:
     """
-    Crea un nuevo predio con su contribuyente y tributo
+    Ejecuta `aplicar(indices)` sobre todo el lote con sentencias por conjunto.
+    Si fallan (un valor que la validación previa no detectó), reintenta cada
+    elemento bajo su propio SAVEPOINT y anota en `errores` el de los que fallan.
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
+    await cur.execute("SAVEPOINT lote")
     try:
-        # 1. Verificar si código catastral ya existe
-        cur.execute("SELECT id_predio FROM predios WHERE codigo_catastral = %s", (predio.codigo_catastral,))
-        if cur.fetchone():
-            raise HTTPException(status_code=400, detail=f"Código catastral {predio.codigo_catastral} ya existe")
-        
-        # 2. Buscar o crear contribuyente
-        cur.execute("SELECT id_contribuyente FROM contribuyentes WHERE nombres = %s", (predio.contribuyente_nombre,))
-        existing_contrib = cur.fetchone()
-        
-        if existing_contrib:
-            id_contribuyente = existing_contrib['id_contribuyente']
+        return await aplicar(validos)
+    except Exception:
+        await cur.execute("ROLLBACK TO SAVEPOINT lote")
+    
+    aplicados = {}
+    for i in validos:
+        await cur.execute("SAVEPOINT elemento")
+        try:
+            aplicados.update(await aplicar([i]))
+            await cur.execute("RELEASE SAVEPOINT elemento")
+        except Exception as e:
+            await cur.execute("ROLLBACK TO SAVEPOINT elemento")
+            errores[i] = primera_linea(e)
+    return aplicados
+
+def lote_json(items: List[Any]) -> str:
+    """Elementos del lote como arreglo JSON con su índice, para jsonb_to_recordset"""
+    if len(items) > BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"El lote excede el máximo de {BATCH_MAX} elementos")
+    # NaN/Infinity no son JSON válido para jsonb: se envían como null y
+    # validar_elemento marca el error de ese elemento
+    return json.dumps([
+        {
+            **{
+                campo: None if isinstance(valor, float) and not math.isfinite(valor) else valor
+                for campo, valor in jsonable_encoder(item).items()
+            },
+            "i": i
+        }
+        for i, item in enumerate(items)
+    ])
+
+async def cerrar_lote(conn, modo: str, total: int, aplicados: Dict[int, Any], errores: Dict[int, str]) -> Dict:
+    """
+    Confirma o descarta la transacción del lote y arma el resultado por elemento
+    (en modo 'todo' cualquier error descarta el lote completo)
+    """
+    if errores and modo == "todo":
+        await conn.rollback()
+        aplicados = {}
+    elif aplicados:
+        await conn.commit()
+        response_cache.invalidate()
+    
+    resultados = []
+    for i in range(total):
+        if i in errores:
+            resultados.append({"indice": i, "ok": False, "error": errores[i]})
+        elif i in aplicados:
+            resultados.append({"indice": i, "ok": True, "id_predio": aplicados[i]})
         else:
-            cur.execute("""
-                INSERT INTO contribuyentes (nombres, dni, telefono)
-                VALUES (%s, NULL, NULL)
-                RETURNING id_contribuyente
-            """, (predio.contribuyente_nombre,))
-            id_contribuyente = cur.fetchone()['id_contribuyente']
+            resultados.append({"indice": i, "ok": False, "error": "No aplicado: el lote tiene errores"})
+    
+    respuesta = {
+        "success": not errores,
+        "modo": modo,
+        "aplicados": len(aplicados),
+        "errores": len(errores),
+        "resultados": resultados
+    }
+    if errores and modo == "todo":
+        raise HTTPException(status_code=400, detail=respuesta)
+    return respuesta
+
+@app.post("/api/predios/batch")
+async def crear_predios_lote(
+    predios: List[PredioCreate],
+    modo: str = Query("todo", pattern=BATCH_MODOS, description="todo: todo o nada; parcial: aplica los válidos")
+):
+    """
+    Crea muchos predios con sus contribuyentes y tributos en una transacción,
+    con sentencias por conjunto en lugar de una ronda de consultas por predio
+    """
+    datos = lote_json(predios)
+    lote = """
+        jsonb_to_recordset(%s::jsonb) AS x(
+            i INT, latitud FLOAT8, longitud FLOAT8, codigo_catastral TEXT,
+            sector TEXT, tipo_vivienda TEXT, autovaluo NUMERIC, numero_vivienda TEXT,
+            contribuyente_nombre TEXT, monto_impuesto NUMERIC, pago_impuesto BOOLEAN,
+            monto_arbitrios NUMERIC, pago_arbitrios BOOLEAN,
+            ingreso_familiar NUMERIC, cantidad_personas INT
+        )
+    """
+    
+    async with db.connection() as conn, conn.cursor() as cur:
+        try:
+            # 1. Validar códigos catastrales (existentes o repetidos en el lote)
+            await cur.execute(f"""
+                SELECT x.i,
+                       EXISTS (SELECT 1 FROM predios p WHERE p.codigo_catastral = x.codigo_catastral) AS existe,
+                       ROW_NUMBER() OVER (PARTITION BY x.codigo_catastral ORDER BY x.i) > 1 AS repetido
+                FROM {lote}
+            """, (datos,))
+            errores = {}
+            for row in await cur.fetchall():
+                if row['existe']:
+                    errores[row['i']] = f"Código catastral {predios[row['i']].codigo_catastral} ya existe"
+                elif row['repetido']:
+                    errores[row['i']] = f"Código catastral {predios[row['i']].codigo_catastral} repetido en el lote"
+            for i, predio in enumerate(predios):
+                error = i not in errores and validar_elemento(predio)
+                if error:
+                    errores[i] = error
+            
+            async def insertar(indices: List[int]) -> Dict[int, int]:
+                # 2. Contribuyentes nuevos (uno por nombre)
+                await cur.execute(f"""
+                    INSERT INTO contribuyentes (nombres, dni, telefono)
+                    SELECT DISTINCT x.contribuyente_nombre, NULL, NULL
+                    FROM {lote}
+                    WHERE x.i = ANY(%s)
+                      AND NOT EXISTS (
+                          SELECT 1 FROM contribuyentes c WHERE c.nombres = x.contribuyente_nombre
+                      )
+                """, (datos, indices))
+                
+                # 3. Predios y tributos en una sola sentencia
+                await cur.execute(f"""
+                    WITH x AS (
+                        SELECT * FROM {lote} WHERE x.i = ANY(%s)
+                    ),
+                    nuevos AS (
+                        INSERT INTO predios (codigo_catastral, geom, sector, tipo_vivienda, autovaluo, numero_vivienda)
+                        SELECT codigo_catastral, ST_SetSRID(ST_MakePoint(longitud, latitud), 4326),
+                               sector, tipo_vivienda, autovaluo, numero_vivienda
+                        FROM x
+                        ORDER BY i
+                        ON CONFLICT (codigo_catastral) DO NOTHING
+                        RETURNING id_predio, codigo_catastral
+                    ),
+                    contribuyentes_id AS (
+                        SELECT nombres, MIN(id_contribuyente) AS id_contribuyente
+                        FROM contribuyentes
+                        WHERE nombres IN (SELECT contribuyente_nombre FROM x)
+                        GROUP BY nombres
+                    ),
+                    tributos_nuevos AS (
+                        INSERT INTO tributos (
+                            id_predio, id_contribuyente,
+                            monto_impuesto, pago_impuesto,
+                            monto_arbitrios, pago_arbitrios,
+                            ingreso_familiar, cantidad_personas
+                        )
+                        SELECT n.id_predio, c.id_contribuyente,
+                               x.monto_impuesto, x.pago_impuesto,
+                               x.monto_arbitrios, x.pago_arbitrios,
+                               x.ingreso_familiar, x.cantidad_personas
+                        FROM nuevos n
+                        JOIN x ON x.codigo_catastral = n.codigo_catastral
+                        JOIN contribuyentes_id c ON c.nombres = x.contribuyente_nombre
+                    )
+                    SELECT x.i, n.id_predio
+                    FROM nuevos n
+                    JOIN x ON x.codigo_catastral = n.codigo_catastral
+                """, (datos, indices))
+                return {row['i']: row['id_predio'] for row in await cur.fetchall()}
+            
+            validos = [i for i in range(len(predios)) if i not in errores]
+            aplicados = {}
+            if validos and not (errores and modo == "todo"):
+                aplicados = await aplicar_lote(cur, insertar, validos, errores)
+                
+                # Creado por otra transacción entre la validación y el INSERT
+                for i in validos:
+                    if i not in aplicados and i not in errores:
+                        errores[i] = f"Código catastral {predios[i].codigo_catastral} ya existe"
+            
+            respuesta = await cerrar_lote(conn, modo, len(predios), aplicados, errores)
+            for i, id_predio in aplicados.items():
+                indice_sugerencias.poner(id_predio, predios[i].contribuyente_nombre, predios[i].codigo_catastral)
+            return respuesta
         
-        # 3. Insertar predio
-        cur.execute("""
-            INSERT INTO predios (codigo_catastral, geom, sector, tipo_vivienda, autovaluo, numero_vivienda)
-            VALUES (%s, ST_SetSRID(ST_MakePoint(%s, %s), 4326), %s, %s, %s, %s)
-            RETURNING id_predio
-        """, (
-            predio.codigo_catastral,
-            predio.longitud,
-            predio.latitud,
-            predio.sector,
-            predio.tipo_vivienda,
-            predio.autovaluo,
-            predio.numero_vivienda
-        ))
-        id_predio = cur.fetchone()['id_predio']
+        except HTTPException as he:
+            await conn.rollback()
+            raise he
+        except Exception as e:
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail=f"Error creando predios: {str(e)}")
+
+@app.put("/api/predios/batch")
+async def actualizar_predios_lote(
+    predios: List[PredioUpdateLote],
+    modo: str = Query("todo", pattern=BATCH_MODOS, description="todo: todo o nada; parcial: aplica los válidos")
+):
+    """
+    Actualiza muchos predios en una transacción; como en PUT /api/predios/{id},
+    solo se modifican los campos enviados
+    """
+    datos = lote_json(predios)
+    lote = """
+        jsonb_to_recordset(%s::jsonb) AS x(
+            i INT, id_predio INT, codigo_catastral TEXT, sector TEXT, tipo_vivienda TEXT,
+            autovaluo NUMERIC, numero_vivienda TEXT, contribuyente_nombre TEXT,
+            monto_impuesto NUMERIC, pago_impuesto BOOLEAN,
+            monto_arbitrios NUMERIC, pago_arbitrios BOOLEAN,
+            ingreso_familiar NUMERIC, cantidad_personas INT,
+            latitud FLOAT8, longitud FLOAT8
+        )
+    """
+    
+    async with db.connection() as conn, conn.cursor() as cur:
+        try:
+            # 1. Validar: predio existente, no repetido y código catastral libre
+            await cur.execute(f"""
+                SELECT x.i,
+                       EXISTS (SELECT 1 FROM predios p WHERE p.id_predio = x.id_predio) AS existe,
+                       ROW_NUMBER() OVER (PARTITION BY x.id_predio ORDER BY x.i) > 1 AS repetido,
+                       x.codigo_catastral IS NOT NULL AND (
+                           EXISTS (
+                               SELECT 1 FROM predios p
+                               WHERE p.codigo_catastral = x.codigo_catastral AND p.id_predio <> x.id_predio
+                           )
+                           OR COUNT(*) OVER (PARTITION BY x.codigo_catastral) > 1
+                       ) AS codigo_ocupado
+                FROM {lote}
+            """, (datos,))
+            errores = {}
+            for row in await cur.fetchall():
+                if not row['existe']:
+                    errores[row['i']] = f"Predio {predios[row['i']].id_predio} no encontrado"
+                elif row['repetido']:
+                    errores[row['i']] = f"Predio {predios[row['i']].id_predio} repetido en el lote"
+                elif row['codigo_ocupado']:
+                    errores[row['i']] = f"Código catastral {predios[row['i']].codigo_catastral} ya existe"
+            for i, predio in enumerate(predios):
+                error = i not in errores and validar_elemento(predio)
+                if error:
+                    errores[i] = error
+            
+            async def actualizar(indices: List[int]) -> Dict[int, int]:
+                # 2. Predios (los campos no enviados conservan su valor)
+                await cur.execute(f"""
+                    UPDATE predios p SET
+                        codigo_catastral = COALESCE(x.codigo_catastral, p.codigo_catastral),
+                        sector = COALESCE(x.sector, p.sector),
+                        tipo_vivienda = COALESCE(x.tipo_vivienda, p.tipo_vivienda),
+                        autovaluo = COALESCE(x.autovaluo, p.autovaluo),
+                        numero_vivienda = COALESCE(x.numero_vivienda, p.numero_vivienda),
+                        geom = CASE
+                            WHEN x.latitud IS NOT NULL AND x.longitud IS NOT NULL
+                            THEN ST_SetSRID(ST_MakePoint(x.longitud, x.latitud), 4326)
+                            ELSE p.geom
+                        END
+                    FROM {lote}
+                    WHERE p.id_predio = x.id_predio
+                      AND x.i = ANY(%s)
+                      AND (
+                          (x.codigo_catastral, x.sector, x.tipo_vivienda, x.autovaluo, x.numero_vivienda)
+                              IS DISTINCT FROM (NULL, NULL, NULL, NULL, NULL)
+                          OR (x.latitud IS NOT NULL AND x.longitud IS NOT NULL)
+                      )
+                """, (datos, indices))
+                
+                # 3. Tributos
+                await cur.execute(f"""
+                    UPDATE tributos t SET
+                        monto_impuesto = COALESCE(x.monto_impuesto, t.monto_impuesto),
+                        pago_impuesto = COALESCE(x.pago_impuesto, t.pago_impuesto),
+                        monto_arbitrios = COALESCE(x.monto_arbitrios, t.monto_arbitrios),
+                        pago_arbitrios = COALESCE(x.pago_arbitrios, t.pago_arbitrios),
+                        ingreso_familiar = COALESCE(x.ingreso_familiar, t.ingreso_familiar),
+                        cantidad_personas = COALESCE(x.cantidad_personas, t.cantidad_personas)
+                    FROM {lote}
+                    WHERE t.id_predio = x.id_predio
+                      AND x.i = ANY(%s)
+                      AND (x.monto_impuesto, x.pago_impuesto, x.monto_arbitrios,
+                           x.pago_arbitrios, x.ingreso_familiar, x.cantidad_personas)
+                          IS DISTINCT FROM (NULL, NULL, NULL, NULL, NULL, NULL)
+                """, (datos, indices))
+                
+                # 4. Contribuyentes (se renombra el del predio, como en el PUT individual)
+                await cur.execute(f"""
+                    UPDATE contribuyentes c SET nombres = x.contribuyente_nombre
+                    FROM tributos t, {lote}
+                    WHERE c.id_contribuyente = t.id_contribuyente
+                      AND t.id_predio = x.id_predio
+                      AND x.i = ANY(%s)
+                      AND x.contribuyente_nombre IS NOT NULL
+                """, (datos, indices))
+                
+                return {i: predios[i].id_predio for i in indices}
+            
+            validos = [i for i in range(len(predios)) if i not in errores]
+            aplicados = {}
+            if validos and not (errores and modo == "todo"):
+                aplicados = await aplicar_lote(cur, actualizar, validos, errores)
+            
+            respuesta = await cerrar_lote(conn, modo, len(predios), aplicados, errores)
+            cambian_nombres = [
+                id_predio for i, id_predio in aplicados.items()
+                if predios[i].contribuyente_nombre is not None or predios[i].codigo_catastral is not None
+            ]
+            if cambian_nombres:
+                await actualizar_sugerencias(cur, cambian_nombres)
+            return respuesta
         
-        # 4. Insertar tributo
-        cur.execute("""
-            INSERT INTO tributos (
-                id_predio, id_contribuyente,
-                monto_impuesto, pago_impuesto,
-                monto_arbitrios, pago_arbitrios,
-                ingreso_familiar, cantidad_personas
+        except HTTPException as he:
+            await conn.rollback()
+            raise he
+        except Exception as e:
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail=f"Error actualizando predios: {str(e)}")
+
+@app.delete("/api/predios/batch")
+async def eliminar_predios_lote(
+    ids: List[int] = Body(..., description="IDs de los predios a eliminar"),
+    modo: str = Query("todo", pattern=BATCH_MODOS, description="todo: todo o nada; parcial: aplica los válidos")
+):
+    """
+    Elimina muchos predios (y sus tributos) en una sola sentencia
+    """
+    if len(ids) > BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"El lote excede el máximo de {BATCH_MAX} elementos")
+    
+    async with db.connection() as conn, conn.cursor() as cur:
+        try:
+            await cur.execute(
+                "DELETE FROM predios WHERE id_predio = ANY(%s) RETURNING id_predio",
+                (ids,)
             )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            id_predio, id_contribuyente,
-            predio.monto_impuesto, predio.pago_impuesto,
-            predio.monto_arbitrios, predio.pago_arbitrios,
-            predio.ingreso_familiar, predio.cantidad_personas
-        ))
-        
-        conn.commit()
+            eliminados = {row['id_predio'] for row in await cur.fetchall()}
+            
+            aplicados = {}
+            errores = {}
+            vistos = set()
+            for i, id_predio in enumerate(ids):
+                if id_predio in vistos:
+                    errores[i] = f"Predio {id_predio} repetido en el lote"
+                elif id_predio in eliminados:
+                    aplicados[i] = id_predio
+                else:
+                    errores[i] = f"Predio {id_predio} no encontrado"
+                vistos.add(id_predio)
+            
+            respuesta = await cerrar_lote(conn, modo, len(ids), aplicados, errores)
+            for id_predio in aplicados.values():
+                indice_sugerencias.quitar(id_predio)
+            return respuesta
         
-        # 5. Retornar predio creado
-        cur.execute("SELECT * FROM predios_completo WHERE id_predio = %s", (id_predio,))
-        row = cur.fetchone()
-        feature = row_to_geojson_feature(dict(row))
+        except HTTPException as he:
+            await conn.rollback()
+            raise he
+        except Exception as e:
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail=f"Error eliminando predios: {str(e)}")
+
+@app.post("/api/predios")
+async def crear_predio(predio: PredioCreate):
+    """
+    Crea un nuevo predio con su contribuyente y tributo
+    """
+    async with db.connection() as conn, conn.cursor() as cur:
+        try:
+            # 1. Verificar si código catastral ya existe
+            await cur.execute("SELECT id_predio FROM predios WHERE codigo_catastral = %s", (predio.codigo_catastral,))
+            if await cur.fetchone():
+                raise HTTPException(status_code=400, detail=f"Código catastral {predio.codigo_catastral} ya existe")
+            
+            # 2. Buscar o crear contribuyente
+            await cur.execute("SELECT id_contribuyente FROM contribuyentes WHERE nombres = %s", (predio.contribuyente_nombre,))
+            existing_contrib = await cur.fetchone()
+            
+            if existing_contrib:
+                id_contribuyente = existing_contrib['id_contribuyente']
+            else:
+                await cur.execute("""
+                    INSERT INTO contribuyentes (nombres, dni, telefono)
+                    VALUES (%s, NULL, NULL)
+                    RETURNING id_contribuyente
+                """, (predio.contribuyente_nombre,))
+                id_contribuyente = (await cur.fetchone())['id_contribuyente']
+            
+            # 3. Insertar predio
+            await cur.execute("""
+                INSERT INTO predios (codigo_catastral, geom, sector, tipo_vivienda, autovaluo, numero_vivienda)
+                VALUES (%s, ST_SetSRID(ST_MakePoint(%s, %s), 4326), %s, %s, %s, %s)
+                RETURNING id_predio
+            """, (
+                predio.codigo_catastral,
+                predio.longitud,
+                predio.latitud,
+                predio.sector,
+                predio.tipo_vivienda,
+                predio.autovaluo,
+                predio.numero_vivienda
+            ))
+            id_predio = (await cur.fetchone())['id_predio']
+            
+            # 4. Insertar tributo
+            await cur.execute("""
+                INSERT INTO tributos (
+                    id_predio, id_contribuyente,
+                    monto_impuesto, pago_impuesto,
+                    monto_arbitrios, pago_arbitrios,
+                    ingreso_familiar, cantidad_personas
+                )
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """, (
+                id_predio, id_contribuyente,
+                predio.monto_impuesto, predio.pago_impuesto,
+                predio.monto_arbitrios, predio.pago_arbitrios,
+                predio.ingreso_familiar, predio.cantidad_personas
+            ))
+            
+            await conn.commit()
+            response_cache.invalidate()
+            indice_sugerencias.poner(id_predio, predio.contribuyente_nombre, predio.codigo_catastral)
+            
+            # 5. Retornar predio creado
+            await cur.execute("SELECT * FROM predios_completo WHERE id_predio = %s", (id_predio,))
+            row = await cur.fetchone()
+            feature = row_to_geojson_feature(dict(row))
+            
+            return RespuestaJSON({
+                "success": True,
+                "message": "Predio creado exitosamente",
+                "predio": feature
+            })
         
-        return {
-            "success": True,
-            "message": "Predio creado exitosamente",
-            "predio": feature
-        }
+        except HTTPException as he:
+            await conn.rollback()
+            raise he
+        except Exception as e:
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail=f"Error creando predio: {str(e)}")
+
+# Declarado después de las demás rutas GET /api/predios/... (morosos, radio, clusters)
+@app.get("/api/predios/{id_predio}")
+async def get_predio(id_predio: int):
+    """
+    Detalle completo de un predio como Feature GeoJSON
+    (script.js lo pide al abrir la edición, para no usar datos desactualizados;
+    los clientes que cargan profile=map lo usan para el detalle)
+    """
+    async with db.connection() as conn, conn.cursor() as cur:
+        try:
+            await cur.execute("SELECT * FROM predios_completo WHERE id_predio = %s", (id_predio,))
+            row = await cur.fetchone()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
     
-    except HTTPException as he:
-        conn.rollback()
-        raise he
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(status_code=500, detail=f"Error creando predio: {str(e)}")
-    finally:
-        cur.close()
-        conn.close()
+    if not row:
+        raise HTTPException(status_code=404, detail=f"Predio {id_predio} no encontrado")
+    return RespuestaJSON(row_to_geojson_feature(dict(row)))
 
 @app.put("/api/predios/{id_predio}")
-def actualizar_predio(id_predio: int, predio: PredioUpdate):
+async def actualizar_predio(id_predio: int, predio: PredioUpdate):
     """
     Actualiza información de un predio existente
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        # 1. Verificar que predio existe
-        cur.execute("SELECT id_predio FROM predios WHERE id_predio = %s", (id_predio,))
-        if not cur.fetchone():
-            raise HTTPException(status_code=404, detail=f"Predio {id_predio} no encontrado")
-        
-        # 2. Actualizar predio
-        predio_updates = []
-        predio_params = []
-        
-        if predio.codigo_catastral is not None:
-            predio_updates.append("codigo_catastral = %s")
-            predio_params.append(predio.codigo_catastral)
-        if predio.sector is not None:
-            predio_updates.append("sector = %s")
-            predio_params.append(predio.sector)
-        if predio.tipo_vivienda is not None:
-            predio_updates.append("tipo_vivienda = %s")
-            predio_params.append(predio.tipo_vivienda)
-        if predio.autovaluo is not None:
-            predio_updates.append("autovaluo = %s")
-            predio_params.append(predio.autovaluo)
-        if predio.numero_vivienda is not None:
-            predio_updates.append("numero_vivienda = %s")
-            predio_params.append(predio.numero_vivienda)
-        if predio.latitud is not None and predio.longitud is not None:
-            predio_updates.append("geom = ST_SetSRID(ST_MakePoint(%s, %s), 4326)")
-            predio_params.extend([predio.longitud, predio.latitud])
-        
-        if predio_updates:
-            predio_params.append(id_predio)
-            update_sql = f"UPDATE predios SET {', '.join(predio_updates)} WHERE id_predio = %s"
-            cur.execute(update_sql, predio_params)
-        
-        # 3. Actualizar tributo
-        tributo_updates = []
-        tributo_params = []
-        
-        if predio.monto_impuesto is not None:
-            tributo_updates.append("monto_impuesto = %s")
-            tributo_params.append(predio.monto_impuesto)
-        if predio.pago_impuesto is not None:
-            tributo_updates.append("pago_impuesto = %s")
-            tributo_params.append(predio.pago_impuesto)
-        if predio.monto_arbitrios is not None:
-            tributo_updates.append("monto_arbitrios = %s")
-            tributo_params.append(predio.monto_arbitrios)
-        if predio.pago_arbitrios is not None:
-            tributo_updates.append("pago_arbitrios = %s")
-            tributo_params.append(predio.pago_arbitrios)
-        if predio.ingreso_familiar is not None:
-            tributo_updates.append("ingreso_familiar = %s")
-            tributo_params.append(predio.ingreso_familiar)
-        if predio.cantidad_personas is not None:
-            tributo_updates.append("cantidad_personas = %s")
-            tributo_params.append(predio.cantidad_personas)
-        
-        if tributo_updates:
-            tributo_params.append(id_predio)
-            update_sql = f"UPDATE tributos SET {', '.join(tributo_updates)} WHERE id_predio = %s"
-            cur.execute(update_sql, tributo_params)
-        
-        # 4. Actualizar contribuyente si se proporciona nombre
-        if predio.contribuyente_nombre is not None:
-            cur.execute("""
-                UPDATE contribuyentes c
-                SET nombres = %s
-                FROM tributos t
-                WHERE c.id_contribuyente = t.id_contribuyente
-                AND t.id_predio = %s
-            """, (predio.contribuyente_nombre, id_predio))
-        
-        conn.commit()
-        
-        # 5. Retornar predio actualizado
-        cur.execute("SELECT * FROM predios_completo WHERE id_predio = %s", (id_predio,))
-        row = cur.fetchone()
-        feature = row_to_geojson_feature(dict(row))
+    async with db.connection() as conn, conn.cursor() as cur:
+        try:
+            # 1. Verificar que predio existe
+            await cur.execute("SELECT id_predio FROM predios WHERE id_predio = %s", (id_predio,))
+            if not await cur.fetchone():
+                raise HTTPException(status_code=404, detail=f"Predio {id_predio} no encontrado")
+            
+            # 2. Actualizar predio
+            predio_updates = []
+            predio_params = []
+            
+            if predio.codigo_catastral is not None:
+                predio_updates.append("codigo_catastral = %s")
+                predio_params.append(predio.codigo_catastral)
+            if predio.sector is not None:
+                predio_updates.append("sector = %s")
+                predio_params.append(predio.sector)
+            if predio.tipo_vivienda is not None:
+                predio_updates.append("tipo_vivienda = %s")
+                predio_params.append(predio.tipo_vivienda)
+            if predio.autovaluo is not None:
+                predio_updates.append("autovaluo = %s")
+                predio_params.append(predio.autovaluo)
+            if predio.numero_vivienda is not None:
+                predio_updates.append("numero_vivienda = %s")
+                predio_params.append(predio.numero_vivienda)
+            if predio.latitud is not None and predio.longitud is not None:
+                predio_updates.append("geom = ST_SetSRID(ST_MakePoint(%s, %s), 4326)")
+                predio_params.extend([predio.longitud, predio.latitud])
+            
+            if predio_updates:
+                predio_params.append(id_predio)
+                update_sql = f"UPDATE predios SET {', '.join(predio_updates)} WHERE id_predio = %s"
+                await cur.execute(update_sql, predio_params)
+            
+            # 3. Actualizar tributo
+            tributo_updates = []
+            tributo_params = []
+            
+            if predio.monto_impuesto is not None:
+                tributo_updates.append("monto_impuesto = %s")
+                tributo_params.append(predio.monto_impuesto)
+            if predio.pago_impuesto is not None:
+                tributo_updates.append("pago_impuesto = %s")
+                tributo_params.append(predio.pago_impuesto)
+            if predio.monto_arbitrios is not None:
+                tributo_updates.append("monto_arbitrios = %s")
+                tributo_params.append(predio.monto_arbitrios)
+            if predio.pago_arbitrios is not None:
+                tributo_updates.append("pago_arbitrios = %s")
+                tributo_params.append(predio.pago_arbitrios)
+            if predio.ingreso_familiar is not None:
+                tributo_updates.append("ingreso_familiar = %s")
+                tributo_params.append(predio.ingreso_familiar)
+            if predio.cantidad_personas is not None:
+                tributo_updates.append("cantidad_personas = %s")
+                tributo_params.append(predio.cantidad_personas)
+            
+            if tributo_updates:
+                tributo_params.append(id_predio)
+                update_sql = f"UPDATE tributos SET {', '.join(tributo_updates)} WHERE id_predio = %s"
+                await cur.execute(update_sql, tributo_params)
+            
+            # 4. Actualizar contribuyente si se proporciona nombre
+            if predio.contribuyente_nombre is not None:
+                await cur.execute("""
+                    UPDATE contribuyentes c
+                    SET nombres = %s
+                    FROM tributos t
+                    WHERE c.id_contribuyente = t.id_contribuyente
+                    AND t.id_predio = %s
+                """, (predio.contribuyente_nombre, id_predio))
+            
+            await conn.commit()
+            response_cache.invalidate()
+            if predio.contribuyente_nombre is not None or predio.codigo_catastral is not None:
+                await actualizar_sugerencias(cur, [id_predio])
+            
+            # 5. Retornar predio actualizado
+            await cur.execute("SELECT * FROM predios_completo WHERE id_predio = %s", (id_predio,))
+            row = await cur.fetchone()
+            feature = row_to_geojson_feature(dict(row))
+            
+            return RespuestaJSON({
+                "success": True,
+                "message": "Predio actualizado exitosamente",
+                "predio": feature
+            })
         
-        return {
-            "success": True,
-            "message": "Predio actualizado exitosamente",
-            "predio": feature
-        }
-    
-    except HTTPException as he:
-        conn.rollback()
-        raise he
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(status_code=500, detail=f"Error actualizando predio: {str(e)}")
-    finally:
-        cur.close()
-        conn.close()
+        except HTTPException as he:
+            await conn.rollback()
+            raise he
+        except Exception as e:
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail=f"Error actualizando predio: {str(e)}")
 
 @app.delete("/api/predios/{id_predio}")
-def eliminar_predio(id_predio: int):
+async def eliminar_predio(id_predio: int):
     """
     Elimina un predio y sus relaciones (tributos)
     El contribuyente NO se elimina por si tiene otros predios
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        # 1. Verificar que predio existe
-        cur.execute("SELECT codigo_catastral FROM predios WHERE id_predio = %s", (id_predio,))
-        predio_existente = cur.fetchone()
-        
-        if not predio_existente:
-            raise HTTPException(status_code=404, detail=f"Predio {id_predio} no encontrado")
-        
-        # 2. Eliminar predio (CASCADE eliminará tributos automáticamente)
-        cur.execute("DELETE FROM predios WHERE id_predio = %s", (id_predio,))
-        
-        conn.commit()
+    async with db.connection() as conn, conn.cursor() as cur:
+        try:
+            # 1. Verificar que predio existe
+            await cur.execute("SELECT codigo_catastral FROM predios WHERE id_predio = %s", (id_predio,))
+            predio_existente = await cur.fetchone()
+            
+            if not predio_existente:
+                raise HTTPException(status_code=404, detail=f"Predio {id_predio} no encontrado")
+            
+            # 2. Eliminar predio (CASCADE eliminará tributos automáticamente)
+            await cur.execute("DELETE FROM predios WHERE id_predio = %s", (id_predio,))
+            
+            await conn.commit()
+            response_cache.invalidate()
+            indice_sugerencias.quitar(id_predio)
+            
+            return {
+                "success": True,
+                "message": f"Predio {predio_existente['codigo_catastral']} eliminado exitosamente",
+                "id_predio": id_predio
+            }
         
-        return {
-            "success": True,
-            "message": f"Predio {predio_existente['codigo_catastral']} eliminado exitosamente",
-            "id_predio": id_predio
-        }
+        except HTTPException as he:
+            await conn.rollback()
+            raise he
+        except Exception as e:
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail=f"Error eliminando predio: {str(e)}")
+
+
+# =====================================================
+# REGISTRO MASIVO DE PAGOS
+# =====================================================
+
+# Conceptos de pago y los tributos que cancelan
+CONCEPTOS_PAGO = {
+    "impuesto": (True, False),
+    "arbitrios": (False, True),
+    "ambos": (True, True)
+}
+
+def leer_pagos(body: bytes, content_type: str) -> List[Dict[str, Any]]:
+    """
+    Pagos del cuerpo de la petición: CSV (codigo_catastral,concepto,fecha)
+    o arreglo JSON de objetos con esos campos. La fecha es opcional (hoy).
+    """
+    try:
+        if "csv" in content_type:
+            filas = list(csv.DictReader(io.StringIO(body.decode("utf-8-sig"))))
+        else:
+            filas = json.loads(body)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Cuerpo inválido: {str(e)}")
+    if not isinstance(filas, list):
+        raise HTTPException(status_code=400, detail="Se esperaba un arreglo de pagos")
+    if len(filas) > BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"El lote excede el máximo de {BATCH_MAX} elementos")
     
-    except HTTPException as he:
-        conn.rollback()
-        raise he
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(status_code=500, detail=f"Error eliminando predio: {str(e)}")
-    finally:
-        cur.close()
-        conn.close()
+    pagos = []
+    errores = []
+    for i, fila in enumerate(filas):
+        if not isinstance(fila, dict):
+            errores.append({"indice": i, "error": "Se esperaba un objeto"})
+            continue
+        codigo = str(fila.get("codigo_catastral") or "").strip()
+        concepto = str(fila.get("concepto") or "").strip().lower()
+        fecha = str(fila.get("fecha") or "").strip()
+        if not codigo:
+            errores.append({"indice": i, "error": "Falta codigo_catastral"})
+        elif concepto not in CONCEPTOS_PAGO:
+            errores.append({"indice": i, "error": f"Concepto inválido: {concepto or '(vacío)'} (opciones: {', '.join(CONCEPTOS_PAGO)})"})
+        else:
+            try:
+                fecha = date.fromisoformat(fecha).isoformat() if fecha else date.today().isoformat()
+            except ValueError:
+                errores.append({"indice": i, "error": f"Fecha inválida: {fecha} (formato AAAA-MM-DD)"})
+                continue
+            impuesto, arbitrios = CONCEPTOS_PAGO[concepto]
+            pagos.append({"codigo_catastral": codigo, "impuesto": impuesto, "arbitrios": arbitrios, "fecha": fecha})
+    
+    if errores:
+        raise HTTPException(status_code=400, detail={"message": "Pagos inválidos", "errores": errores})
+    return pagos
 
+@app.post("/api/pagos")
+async def registrar_pagos(request: Request):
+    """
+    Registra un lote de pagos (CSV o JSON) con un único UPDATE por conjunto
+    sobre tributos y devuelve la variación de deuda de cada predio afectado.
+    Los pagos de un mismo predio se combinan; la fecha del último pago solo avanza.
+    """
+    inicio = time.perf_counter()
+    pagos = leer_pagos(await request.body(), request.headers.get("content-type", ""))
+    if not pagos:
+        raise HTTPException(status_code=400, detail="El lote no tiene pagos")
+    
+    query = """
+        WITH pagos AS (
+            SELECT codigo_catastral,
+                   bool_or(impuesto) AS impuesto,
+                   bool_or(arbitrios) AS arbitrios,
+                   MAX(fecha) AS fecha
+            FROM jsonb_to_recordset(%s::jsonb)
+                 AS x(codigo_catastral TEXT, impuesto BOOLEAN, arbitrios BOOLEAN, fecha DATE)
+            GROUP BY codigo_catastral
+        ),
+        anteriores AS (
+            SELECT t.id_tributo, t.deuda_total, t.estado_pago
+            FROM tributos t
+            JOIN predios p ON p.id_predio = t.id_predio
+            JOIN pagos pg ON pg.codigo_catastral = p.codigo_catastral
+        ),
+        actualizados AS (
+            UPDATE tributos t SET
+                pago_impuesto = t.pago_impuesto OR pg.impuesto,
+                pago_arbitrios = t.pago_arbitrios OR pg.arbitrios,
+                fecha_ultimo_pago = GREATEST(t.fecha_ultimo_pago, pg.fecha)
+            FROM predios p, pagos pg
+            WHERE p.id_predio = t.id_predio
+              AND pg.codigo_catastral = p.codigo_catastral
+              AND (
+                  (pg.impuesto AND NOT t.pago_impuesto)
+                  OR (pg.arbitrios AND NOT t.pago_arbitrios)
+                  OR t.fecha_ultimo_pago IS NULL OR pg.fecha > t.fecha_ultimo_pago
+              )
+            RETURNING t.id_tributo, t.id_predio, p.codigo_catastral, t.deuda_total, t.estado_pago
+        )
+        SELECT pg.codigo_catastral,
+               a.id_predio,
+               an.deuda_total AS deuda_anterior,
+               a.deuda_total AS deuda_actual,
+               an.estado_pago AS estado_anterior,
+               a.estado_pago AS estado_actual,
+               EXISTS (SELECT 1 FROM predios p WHERE p.codigo_catastral = pg.codigo_catastral) AS existe
+        FROM pagos pg
+        LEFT JOIN actualizados a ON a.codigo_catastral = pg.codigo_catastral
+        LEFT JOIN anteriores an ON an.id_tributo = a.id_tributo
+        ORDER BY pg.codigo_catastral
+    """
+    
+    async with db.connection() as conn, conn.cursor() as cur:
+        try:
+            await cur.execute(query, (json.dumps(pagos),))
+            rows = await cur.fetchall()
+            await conn.commit()
+        except Exception as e:
+            await conn.rollback()
+            raise HTTPException(status_code=500, detail=f"Error registrando pagos: {str(e)}")
+    
+    deltas = []
+    no_encontrados = []
+    sin_cambios = 0
+    for row in rows:
+        if not row['existe']:
+            no_encontrados.append(row['codigo_catastral'])
+        elif row['id_predio'] is None:
+            sin_cambios += 1
+        else:
+            deltas.append({
+                "codigo_catastral": row['codigo_catastral'],
+                "id_predio": row['id_predio'],
+                "deuda_anterior": float(row['deuda_anterior'] or 0),
+                "deuda_actual": float(row['deuda_actual'] or 0),
+                "delta": float((row['deuda_actual'] or 0) - (row['deuda_anterior'] or 0)),
+                "estado_anterior": row['estado_anterior'],
+                "estado_actual": row['estado_actual']
+            })
+    if deltas:
+        response_cache.invalidate()
+    
+    segundos = time.perf_counter() - inicio
+    return {
+        "success": True,
+        "pagos": len(pagos),
+        "actualizados": len(deltas),
+        "sin_cambios": sin_cambios,
+        "no_encontrados": no_encontrados,
+        "deuda_cancelada": round(-sum(d["delta"] for d in deltas), 2),
+        "deltas": deltas,
+        "segundos": round(segundos, 4),
+        "pagos_por_segundo": round(len(pagos) / max(segundos, 1e-9))
+    }
 
 if __name__ == "__main__":
     import uvicorn
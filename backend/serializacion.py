@@ -0,0 +1,34 @@
+"""
+Serialización JSON del API Tributario
+orjson convierte fechas (ISO 8601) de forma nativa; los montos NUMERIC
+(Decimal) se envían como texto, igual que en la vista predios_features.
+
+Los endpoints que devuelven RespuestaJSON directamente evitan además el
+paso de jsonable_encoder que FastAPI aplica a los diccionarios.
+"""
+
+from decimal import Decimal
+from typing import Any
+
+from fastapi.responses import JSONResponse
+import orjson
+
+def _por_defecto(valor: Any) -> Any:
+    """Tipos que orjson no serializa por sí mismo"""
+    if isinstance(valor, Decimal):
+        return str(valor)
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+def dumps(contenido: Any) -> bytes:
+    """JSON compacto en UTF-8"""
+    return orjson.dumps(contenido, default=_por_defecto, option=orjson.OPT_NON_STR_KEYS)
+
+def dumps_text(contenido: Any) -> str:
+    """Igual que dumps, como texto (para armar respuestas por partes)"""
+    return dumps(contenido).decode()
+
+class RespuestaJSON(JSONResponse):
+    """JSONResponse serializada con orjson"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
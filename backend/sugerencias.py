@@ -0,0 +1,102 @@
+"""
+Índice de sugerencias en memoria del API Tributario
+Arreglo ordenado de claves normalizadas (sin tildes, en minúsculas) con
+búsqueda por prefijo mediante bisect. Cada nombre se indexa desde el
+inicio de cada palabra, por lo que "per" sugiere "Juan Pérez".
+"""
+
+from bisect import bisect_left, insort
+from typing import Optional, Dict, Any, List, Tuple
+import time
+import unicodedata
+
+def normalizar(texto: str) -> str:
+    """Texto sin tildes, en minúsculas y con espacios simples"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    sin_tildes = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_tildes.lower().split())
+
+class IndiceSugerencias:
+    """Prefijos de nombres de contribuyentes -> (nombre, id_predio, codigo_catastral)"""
+
+    def __init__(self):
+        self.cargado = False
+        self.actualizado_en: Optional[float] = None
+        # Aumenta con cada poner/quitar, para detectar cambios durante una recarga
+        self.version = 0
+        # Entradas (clave, id_predio) ordenadas; los datos de cada predio van aparte
+        self._claves: List[Tuple[str, int]] = []
+        self._predios: Dict[int, Tuple[str, Optional[str]]] = {}
+
+    @staticmethod
+    def _claves_de(nombre: str, id_predio: int) -> List[Tuple[str, int]]:
+        palabras = normalizar(nombre).split(' ')
+        return [(' '.join(palabras[i:]), id_predio) for i in range(len(palabras)) if palabras[i]]
+
+    def cargar(self, filas: List[Dict[str, Any]]):
+        """Reconstruye el índice con filas (id_predio, nombre, codigo_catastral)"""
+        claves = []
+        predios = {}
+        for fila in filas:
+            if not fila['nombre']:
+                continue
+            predios[fila['id_predio']] = (fila['nombre'], fila['codigo_catastral'])
+            claves.extend(self._claves_de(fila['nombre'], fila['id_predio']))
+        claves.sort()
+        self._claves = claves
+        self._predios = predios
+        self.cargado = True
+        self.actualizado_en = time.time()
+
+    def quitar(self, id_predio: int):
+        """Elimina el predio del índice (si estaba)"""
+        anterior = self._predios.pop(id_predio, None)
+        if anterior is None:
+            return
+        self.version += 1
+        for clave in self._claves_de(anterior[0], id_predio):
+            i = bisect_left(self._claves, clave)
+            if i < len(self._claves) and self._claves[i] == clave:
+                del self._claves[i]
+
+    def poner(self, id_predio: int, nombre: Optional[str], codigo_catastral: Optional[str]):
+        """Agrega o reemplaza el predio en el índice"""
+        self.quitar(id_predio)
+        self.version += 1
+        if not nombre:
+            return
+        self._predios[id_predio] = (nombre, codigo_catastral)
+        for clave in self._claves_de(nombre, id_predio):
+            insort(self._claves, clave)
+
+    def buscar(self, prefijo: str, limite: int) -> List[Dict[str, Any]]:
+        """Hasta `limite` predios cuyo nombre tiene una palabra que empieza con el prefijo"""
+        prefijo = normalizar(prefijo)
+        if not prefijo:
+            return []
+        resultados = []
+        vistos = set()
+        i = bisect_left(self._claves, (prefijo, -1))
+        while i < len(self._claves) and len(resultados) < limite:
+            clave, id_predio = self._claves[i]
+            if not clave.startswith(prefijo):
+                break
+            if id_predio not in vistos:
+                vistos.add(id_predio)
+                nombre, codigo_catastral = self._predios[id_predio]
+                resultados.append({
+                    "nombre": nombre,
+                    "id_predio": id_predio,
+                    "codigo_catastral": codigo_catastral
+                })
+            i += 1
+        return resultados
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas del índice para monitoreo"""
+        return {
+            "cargado": self.cargado,
+            "predios": len(self._predios),
+            "claves": len(self._claves),
+            "actualizado_en": self.actualizado_en
+        }
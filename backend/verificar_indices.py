@@ -0,0 +1,112 @@
+"""
+Verificación de planes de consulta del API Tributario
+Ejecuta EXPLAIN sobre las consultas de /api/predios para las combinaciones
+de filtros que usa script.js (estado, rango de deuda, página siguiente) y
+las de sector y bbox, y falla si alguna recorre predios, tributos o
+contribuyentes con un Seq Scan o con un recorrido completo de índice (sin
+Index Cond): todas filtran, así que el índice debe acotar las filas.
+
+Se planifica con enable_seqscan = off: en tablas pequeñas el planificador
+prefiere Seq Scan aunque exista el índice, y lo que se verifica es que haya
+un camino por índice (si no lo hay, el Seq Scan aparece igual).
+
+Uso (dentro del contenedor del backend):
+    python verificar_indices.py
+"""
+
+import json
+import sys
+
+import psycopg2
+
+from db import DB_CONFIG
+from main import build_predios_query, encode_cursor
+
+TABLAS = {'predios', 'tributos', 'contribuyentes'}
+
+# Nombre, filtros de get_predios
+COMBINACIONES = [
+    ("estado", {'estado': 'MOROSO'}),
+    ("estado + deuda_min", {'estado': 'MOROSO', 'deuda_min': 100}),
+    ("estado + deuda_min + deuda_max", {'estado': 'MOROSO', 'deuda_min': 100, 'deuda_max': 500}),
+    ("deuda_min", {'deuda_min': 100}),
+    ("deuda_max", {'deuda_max': 500}),
+    ("deuda_min + deuda_max", {'deuda_min': 100, 'deuda_max': 500}),
+    ("estado, página siguiente", {'estado': 'AL_DIA', 'cursor': encode_cursor(250, 1000)}),
+    ("deuda_min, página siguiente", {'deuda_min': 100, 'cursor': encode_cursor(250, 1000)}),
+    ("sector", {'sector': 'Jayllihuaya'}),
+    ("estado + sector", {'estado': 'MOROSO', 'sector': 'Jayllihuaya'}),
+    ("bbox", {'bbox': '-69.985,-15.880,-69.975,-15.870'}),
+    ("estado + bbox", {'estado': 'MOROSO', 'bbox': '-69.985,-15.880,-69.975,-15.870'}),
+]
+
+def nodos(plan):
+    """Recorre el árbol del plan"""
+    yield plan
+    for hijo in plan.get('Plans', []):
+        yield from nodos(hijo)
+
+def revisar_plan(plan) -> list:
+    """
+    Fallas del plan: Seq Scan sobre tablas base, y recorridos completos de
+    índice (con enable_seqscan = off el planificador los usa en lugar del
+    Seq Scan, sin que el índice descarte filas)
+    """
+    fallas = []
+    for nodo in nodos(plan):
+        tabla = nodo.get('Relation Name')
+        if tabla not in TABLAS:
+            continue
+        if nodo['Node Type'] == 'Seq Scan':
+            fallas.append(f"Seq Scan en {tabla}")
+        elif nodo['Node Type'] in ('Index Scan', 'Index Only Scan') and 'Index Cond' not in nodo:
+            fallas.append(f"{nodo['Node Type']} completo de {nodo.get('Index Name')} en {tabla}")
+        elif nodo['Node Type'] == 'Bitmap Heap Scan' and 'Recheck Cond' not in nodo:
+            fallas.append(f"Bitmap Heap Scan sin condición en {tabla}")
+    return fallas
+
+def resumen(plan) -> str:
+    """Accesos a tablas del plan, para el reporte"""
+    accesos = []
+    for nodo in nodos(plan):
+        if nodo.get('Relation Name') in TABLAS:
+            indice = f" ({nodo['Index Name']})" if 'Index Name' in nodo else ""
+            accesos.append(f"{nodo['Node Type']} {nodo['Relation Name']}{indice}")
+    return ", ".join(accesos)
+
+def main():
+    conn = psycopg2.connect(**DB_CONFIG)
+    cur = conn.cursor()
+    cur.execute("SET enable_seqscan = off")
+
+    total_fallas = 0
+    for nombre, filtros in COMBINACIONES:
+        for sql_json in (False, True):
+            query, params = build_predios_query(
+                filtros.get('estado'), filtros.get('deuda_min'), filtros.get('deuda_max'),
+                filtros.get('sector'), filtros.get('cursor'), filtros.get('bbox'),
+                sql_json, limit=1000
+            )
+            cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            resultado = cur.fetchone()[0]
+            if isinstance(resultado, str):
+                resultado = json.loads(resultado)
+            plan = resultado[0]['Plan']
+
+            fallas = revisar_plan(plan)
+            etiqueta = f"{nombre}{' [sql_json]' if sql_json else ''}"
+            print(f"[{'FALLA' if fallas else 'OK'}] {etiqueta}: {resumen(plan)}")
+            for falla in fallas:
+                print(f"        {falla}")
+            total_fallas += bool(fallas)
+
+    conn.rollback()
+    conn.close()
+
+    if total_fallas:
+        print(f"\n[ERROR] {total_fallas} consultas usan Seq Scan o recorren un índice completo")
+        sys.exit(1)
+    print("\n[OK] Todas las combinaciones de filtros se acotan con índices")
+
+if __name__ == '__main__':
+    main()
@@ -1,129 +1,315 @@
 """
 Script para generar INSERT statements SQL desde data.json
 Crea archivo con datos precargados para init.sql
+
+Lee los hogares de a uno (arreglo JSON o NDJSON) y escribe el SQL a
+medida que avanza, por lo que la memoria no depende del tamano del archivo.
+
+Formatos de salida:
+  - inserts : un INSERT por contribuyente, predio y tributo
+  - copy    : un bloque COPY ... FROM stdin a una tabla de staging y tres
+              INSERT ... SELECT por conjunto (el mas rapido de cargar)
+  - values  : lo mismo con INSERT multi-fila de --lote filas cada uno
+Con --comprimir la salida se escribe en gzip (.sql.gz), que el entrypoint
+de la imagen postgis ejecuta directamente desde /docker-entrypoint-initdb.d.
 """
 
-import json
+import argparse
+import gzip
 import os
 
-def generar_inserts_sql():
-    """Lee data.json y genera INSERT statements"""
-    
-    # Leer data.json
-    ruta_json = os.path.join(os.path.dirname(__file__), '..', 'data.json')
-    with open(ruta_json, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    print(f"[OK] Leidos {len(data)} registros de data.json")
-    
-    # Generar SQL
-    sql_lines = []
-    sql_lines.append("-- =====================================================")
-    sql_lines.append("-- DATOS PRECARGADOS DESDE data.json")
-    sql_lines.append(f"-- Total de registros: {len(data)}")
-    sql_lines.append("-- =====================================================\n")
-    
-    # Extraer contribuyentes unicos
-    contribuyentes_unicos = {}
-    for hogar in data:
-        nombre = hogar.get('propietario', 'Desconocido')
-        if nombre not in contribuyentes_unicos:
-            contribuyentes_unicos[nombre] = len(contribuyentes_unicos) + 1
-    
-    # INSERT contribuyentes
-    sql_lines.append("-- Insertar contribuyentes")
-    for nombre, id_contrib in contribuyentes_unicos.items():
-        nombre_escaped = nombre.replace("'", "''")
-        sql_lines.append(f"INSERT INTO contribuyentes (id_contribuyente, nombres, dni, telefono) VALUES ({id_contrib}, '{nombre_escaped}', NULL, NULL);")
-    
-    sql_lines.append(f"\n-- Total contribuyentes insertados: {len(contribuyentes_unicos)}\n")
-    
-    # INSERT predios y tributos
-    sql_lines.append("-- Insertar predios y tributos")
-    
-    predios_insertados = 0
-    tributos_insertados = 0
-    
-    for idx, hogar in enumerate(data, start=1):
-        try:
-            # Datos del predio
-            codigo_catastral = hogar.get('id_hogar', f'HOG{idx:04d}')
-            latitud = hogar.get('latitud')
-            longitud = hogar.get('altitud')
-            
-            if latitud is None or longitud is None:
-                continue
-            
-            sector = 'Jayllihuaya'
-            tipo_vivienda = (hogar.get('tipo_vivienda', 'Desconocido') or 'Desconocido').replace("'", "''")
-            numero_vivienda = str(hogar.get('numero_vivienda', '') or '')
-            
-            ingreso_familiar = float(hogar.get('ingreso_familiar', 0))
-            autovaluo = ingreso_familiar * 50
-            
-            # INSERT predio
-            sql_lines.append(f"INSERT INTO predios (id_predio, codigo_catastral, geom, sector, tipo_vivienda, autovaluo, numero_vivienda)")
-            sql_lines.append(f"  VALUES ({idx}, '{codigo_catastral}', ST_SetSRID(ST_MakePoint({longitud}, {latitud}), 4326), '{sector}', '{tipo_vivienda}', {autovaluo}, '{numero_vivienda}');")
-            
-            predios_insertados += 1
-            
-            # Datos tributarios
-            propietario = hogar.get('propietario', 'Desconocido')
-            id_contribuyente = contribuyentes_unicos.get(propietario)
-            
-            if id_contribuyente is None:
-                continue
-            
-            monto_impuesto = float(hogar.get('monto_impuesto', 0))
-            pago_impuesto = 'TRUE' if hogar.get('pago_impuesto', False) else 'FALSE'
-            monto_arbitrios = float(hogar.get('monto_arbitrios', 0))
-            pago_arbitrios = 'TRUE' if hogar.get('pago_arbitrios', False) else 'FALSE'
-            
-            cantidad_personas = hogar.get('cantidad_personas')
-            if cantidad_personas is None:
-                cantidad_personas = 'NULL'
-            
-            nivel_educativo = hogar.get('nivel_educativo_jefe')
-            if nivel_educativo:
-                nivel_educativo = f"'{nivel_educativo.replace(chr(39), chr(39)+chr(39))}'"
+from lector_hogares import LectorHogares, guardar_checkpoint, leer_checkpoint
+
+# Cada cuantos registros se guarda el checkpoint
+INTERVALO_CHECKPOINT = 10000
+
+# Filas por INSERT en formato values
+TAMANO_LOTE = 1000
+
+def texto_sql(valor):
+    """Literal SQL de texto (o NULL)"""
+    if valor is None:
+        return 'NULL'
+    return "'" + str(valor).replace("'", "''") + "'"
+
+def valor_sql(valor):
+    """Literal SQL de cualquier valor de la fila de staging"""
+    if isinstance(valor, bool):
+        return 'TRUE' if valor else 'FALSE'
+    if isinstance(valor, (int, float)):
+        return repr(valor)
+    return texto_sql(valor)
+
+def valor_copy(valor):
+    """Campo de COPY en formato texto (\\N = NULL)"""
+    if valor is None:
+        return '\\N'
+    if isinstance(valor, bool):
+        return 't' if valor else 'f'
+    return (str(valor).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+# =====================================================
+# FORMATOS copy / values (staging + INSERT ... SELECT)
+# =====================================================
+
+COLUMNAS_STAGE = [
+    'idx', 'codigo_catastral', 'propietario', 'longitud', 'latitud',
+    'sector', 'tipo_vivienda', 'numero_vivienda', 'autovaluo',
+    'monto_impuesto', 'pago_impuesto', 'monto_arbitrios', 'pago_arbitrios',
+    'ingreso_familiar', 'cantidad_personas', 'nivel_educativo_jefe', 'servicios_basicos'
+]
+
+SQL_STAGE = """CREATE TEMP TABLE stage_hogares (
+  idx INTEGER,
+  codigo_catastral VARCHAR(50),
+  propietario VARCHAR(200),
+  longitud DOUBLE PRECISION,
+  latitud DOUBLE PRECISION,
+  sector VARCHAR(100),
+  tipo_vivienda VARCHAR(50),
+  numero_vivienda VARCHAR(20),
+  autovaluo DECIMAL(10,2),
+  monto_impuesto DECIMAL(10,2),
+  pago_impuesto BOOLEAN,
+  monto_arbitrios DECIMAL(10,2),
+  pago_arbitrios BOOLEAN,
+  ingreso_familiar DECIMAL(10,2),
+  cantidad_personas INTEGER,
+  nivel_educativo_jefe VARCHAR(100),
+  servicios_basicos VARCHAR(50)
+);"""
+
+# Contribuyentes en orden de aparicion, predios con id = numero de registro
+# y tributos resueltos por nombre, igual que en el formato inserts
+SQL_RESOLVER = """INSERT INTO contribuyentes (nombres, dni, telefono)
+SELECT s.propietario, NULL, NULL
+FROM stage_hogares s
+WHERE NOT EXISTS (SELECT 1 FROM contribuyentes c WHERE c.nombres = s.propietario)
+GROUP BY s.propietario
+ORDER BY MIN(s.idx);
+
+INSERT INTO predios (id_predio, codigo_catastral, geom, sector, tipo_vivienda, autovaluo, numero_vivienda)
+SELECT idx, codigo_catastral, ST_SetSRID(ST_MakePoint(longitud, latitud), 4326), sector, tipo_vivienda, autovaluo, numero_vivienda
+FROM stage_hogares
+ORDER BY idx;
+
+INSERT INTO tributos (id_predio, id_contribuyente, monto_impuesto, pago_impuesto, monto_arbitrios, pago_arbitrios, ingreso_familiar, cantidad_personas, nivel_educativo_jefe, servicios_basicos)
+SELECT s.idx, c.id_contribuyente, s.monto_impuesto, s.pago_impuesto, s.monto_arbitrios, s.pago_arbitrios, s.ingreso_familiar, s.cantidad_personas, s.nivel_educativo_jefe, s.servicios_basicos
+FROM stage_hogares s
+JOIN (SELECT nombres, MIN(id_contribuyente) AS id_contribuyente FROM contribuyentes GROUP BY nombres) c ON c.nombres = s.propietario
+ORDER BY s.idx;
+
+DROP TABLE stage_hogares;"""
+
+def fila_hogar(idx, hogar):
+    """Fila de staging del hogar (None si no tiene coordenadas)"""
+    latitud = hogar.get('latitud')
+    longitud = hogar.get('altitud')
+    if latitud is None or longitud is None:
+        return None
+
+    ingreso_familiar = float(hogar.get('ingreso_familiar', 0))
+    return (
+        idx,
+        hogar.get('id_hogar', f'HOG{idx:04d}'),
+        hogar.get('propietario', 'Desconocido'),
+        float(longitud),
+        float(latitud),
+        'Jayllihuaya',
+        hogar.get('tipo_vivienda', 'Desconocido') or 'Desconocido',
+        str(hogar.get('numero_vivienda', '') or ''),
+        ingreso_familiar * 50,
+        float(hogar.get('monto_impuesto', 0)),
+        bool(hogar.get('pago_impuesto', False)),
+        float(hogar.get('monto_arbitrios', 0)),
+        bool(hogar.get('pago_arbitrios', False)),
+        ingreso_familiar,
+        hogar.get('cantidad_personas'),
+        hogar.get('nivel_educativo_jefe') or None,
+        hogar.get('servicios_basicos') or None
+    )
+
+def generar_inserts_sql(archivo='data.json', salida=None, checkpoint=None,
+                        formato='inserts', tamano_lote=TAMANO_LOTE, comprimir=False):
+    """Lee data.json y genera el SQL de carga en el formato indicado"""
+
+    ruta_json = archivo if os.path.exists(archivo) else os.path.join(os.path.dirname(__file__), '..', archivo)
+    ruta_output = salida or os.path.join(os.path.dirname(__file__), 'data_inserts.sql' + ('.gz' if comprimir else ''))
+
+    # gzip no permite recortar la salida, por lo que no se puede reanudar
+    if comprimir and checkpoint:
+        print("[AVISO] --checkpoint no se usa con --comprimir")
+        checkpoint = None
+
+    # Reanudar: el SQL se recorta al tamano que tenia al guardar el checkpoint
+    punto = leer_checkpoint(checkpoint)
+    if punto:
+        data = LectorHogares(ruta_json, punto['byte'], punto['registro'])
+        predios_insertados = punto['predios']
+        tributos_insertados = punto['tributos']
+        filas_lote = punto.get('filas_lote', 0)
+        f = open(ruta_output, 'r+', encoding='utf-8')
+        f.seek(punto['bytes_salida'])
+        f.truncate()
+        print(f"[OK] Reanudando desde el registro {punto['registro'] + 1} de {archivo}")
+    else:
+        data = LectorHogares(ruta_json)
+        predios_insertados = 0
+        tributos_insertados = 0
+        filas_lote = 0
+        if comprimir:
+            f = gzip.open(ruta_output, 'wt', encoding='utf-8')
+        else:
+            f = open(ruta_output, 'w', encoding='utf-8')
+        print(f"[OK] Leyendo {archivo} ({data.formato}), formato de salida {formato}")
+
+    def escribir(linea=''):
+        f.write(linea + '\n')
+
+    with f:
+        if not punto:
+            escribir("-- =====================================================")
+            escribir("-- DATOS PRECARGADOS DESDE data.json")
+            escribir("-- =====================================================\n")
+
+            if formato == 'inserts':
+                # Los contribuyentes se crean la primera vez que aparecen y los
+                # tributos los resuelven por nombre, sin mantener un mapa en memoria
+                escribir("-- Insertar contribuyentes, predios y tributos")
             else:
-                nivel_educativo = 'NULL'
-            
-            servicios_basicos = hogar.get('servicios_basicos')
-            if servicios_basicos:
-                servicios_basicos = f"'{servicios_basicos.replace(chr(39), chr(39)+chr(39))}'"
+                # Los hogares se cargan a staging y se reparten con tres sentencias por conjunto
+                escribir("-- Cargar hogares a staging")
+                escribir(SQL_STAGE)
+                if formato == 'copy':
+                    escribir(f"COPY stage_hogares ({', '.join(COLUMNAS_STAGE)}) FROM stdin;")
+
+        for hogar in data:
+            idx = data.registro
+            if formato != 'inserts':
+                fila = fila_hogar(idx, hogar)
+                if fila is None:
+                    continue
+                if formato == 'copy':
+                    escribir('\t'.join(valor_copy(valor) for valor in fila))
+                else:
+                    if filas_lote == 0:
+                        escribir(f"INSERT INTO stage_hogares ({', '.join(COLUMNAS_STAGE)}) VALUES")
+                    else:
+                        escribir(",")
+                    f.write("  (" + ", ".join(valor_sql(valor) for valor in fila) + ")")
+                    filas_lote += 1
+                    if filas_lote >= tamano_lote:
+                        escribir(";")
+                        filas_lote = 0
+                predios_insertados += 1
+                tributos_insertados += 1
             else:
-                servicios_basicos = 'NULL'
-            
-            # INSERT tributo
-            sql_lines.append(f"INSERT INTO tributos (id_predio, id_contribuyente, monto_impuesto, pago_impuesto, monto_arbitrios, pago_arbitrios, ingreso_familiar, cantidad_personas, nivel_educativo_jefe, servicios_basicos)")
-            sql_lines.append(f"  VALUES ({idx}, {id_contribuyente}, {monto_impuesto}, {pago_impuesto}, {monto_arbitrios}, {pago_arbitrios}, {ingreso_familiar}, {cantidad_personas}, {nivel_educativo}, {servicios_basicos});")
-            
-            tributos_insertados += 1
-            
-        except Exception as e:
-            print(f"[ERROR] Error procesando {hogar.get('id_hogar', idx)}: {e}")
-            continue
-    
-    sql_lines.append(f"\n-- Total predios insertados: {predios_insertados}")
-    sql_lines.append(f"-- Total tributos insertados: {tributos_insertados}\n")
-    
-    # Actualizar secuencias
-    sql_lines.append("-- Actualizar secuencias")
-    sql_lines.append(f"SELECT setval('contribuyentes_id_contribuyente_seq', {len(contribuyentes_unicos)}, true);")
-    sql_lines.append(f"SELECT setval('predios_id_predio_seq', {predios_insertados}, true);")
-    sql_lines.append(f"SELECT setval('tributos_id_tributo_seq', {tributos_insertados}, true);")
-    
-    # Escribir archivo
-    ruta_output = os.path.join(os.path.dirname(__file__), 'data_inserts.sql')
-    with open(ruta_output, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(sql_lines))
-    
+                try:
+                    # Datos del predio
+                    codigo_catastral = hogar.get('id_hogar', f'HOG{idx:04d}')
+                    latitud = hogar.get('latitud')
+                    longitud = hogar.get('altitud')
+
+                    if latitud is None or longitud is None:
+                        continue
+
+                    sector = 'Jayllihuaya'
+                    tipo_vivienda = (hogar.get('tipo_vivienda', 'Desconocido') or 'Desconocido').replace("'", "''")
+                    numero_vivienda = str(hogar.get('numero_vivienda', '') or '')
+
+                    ingreso_familiar = float(hogar.get('ingreso_familiar', 0))
+                    autovaluo = ingreso_familiar * 50
+
+                    propietario = texto_sql(hogar.get('propietario', 'Desconocido'))
+
+                    # INSERT contribuyente (si es nuevo)
+                    escribir(f"INSERT INTO contribuyentes (nombres, dni, telefono) SELECT {propietario}, NULL, NULL")
+                    escribir(f"  WHERE NOT EXISTS (SELECT 1 FROM contribuyentes WHERE nombres = {propietario});")
+
+                    # INSERT predio
+                    escribir(f"INSERT INTO predios (id_predio, codigo_catastral, geom, sector, tipo_vivienda, autovaluo, numero_vivienda)")
+                    escribir(f"  VALUES ({idx}, '{codigo_catastral}', ST_SetSRID(ST_MakePoint({longitud}, {latitud}), 4326), '{sector}', '{tipo_vivienda}', {autovaluo}, '{numero_vivienda}');")
+
+                    predios_insertados += 1
+
+                    # Datos tributarios
+                    monto_impuesto = float(hogar.get('monto_impuesto', 0))
+                    pago_impuesto = 'TRUE' if hogar.get('pago_impuesto', False) else 'FALSE'
+                    monto_arbitrios = float(hogar.get('monto_arbitrios', 0))
+                    pago_arbitrios = 'TRUE' if hogar.get('pago_arbitrios', False) else 'FALSE'
+
+                    cantidad_personas = hogar.get('cantidad_personas')
+                    if cantidad_personas is None:
+                        cantidad_personas = 'NULL'
+
+                    nivel_educativo = texto_sql(hogar.get('nivel_educativo_jefe') or None)
+                    servicios_basicos = texto_sql(hogar.get('servicios_basicos') or None)
+
+                    # INSERT tributo
+                    escribir(f"INSERT INTO tributos (id_predio, id_contribuyente, monto_impuesto, pago_impuesto, monto_arbitrios, pago_arbitrios, ingreso_familiar, cantidad_personas, nivel_educativo_jefe, servicios_basicos)")
+                    escribir(f"  VALUES ({idx}, (SELECT MIN(id_contribuyente) FROM contribuyentes WHERE nombres = {propietario}), {monto_impuesto}, {pago_impuesto}, {monto_arbitrios}, {pago_arbitrios}, {ingreso_familiar}, {cantidad_personas}, {nivel_educativo}, {servicios_basicos});")
+
+                    tributos_insertados += 1
+
+                except Exception as e:
+                    print(f"[ERROR] Error procesando {hogar.get('id_hogar', idx)}: {e}")
+                    continue
+
+            if checkpoint and idx % INTERVALO_CHECKPOINT == 0:
+                f.flush()
+                guardar_checkpoint(checkpoint, data, bytes_salida=f.tell(), filas_lote=filas_lote,
+                                   predios=predios_insertados, tributos=tributos_insertados)
+                print(f"  Procesados {idx} registros ({predios_insertados} predios)")
+
+        # Cerrar la carga a staging y repartir a las tablas
+        if formato == 'copy':
+            escribir("\\.")
+        elif formato == 'values' and filas_lote:
+            escribir(";")
+        if formato != 'inserts':
+            escribir("\n-- Insertar contribuyentes, predios y tributos")
+            escribir(SQL_RESOLVER)
+
+        escribir(f"\n-- Total de registros: {data.registro}")
+        escribir(f"-- Total predios insertados: {predios_insertados}")
+        escribir(f"-- Total tributos insertados: {tributos_insertados}\n")
+
+        # Actualizar secuencias
+        escribir("-- Actualizar secuencias")
+        escribir("SELECT setval('contribuyentes_id_contribuyente_seq', (SELECT COALESCE(MAX(id_contribuyente), 1) FROM contribuyentes), true);")
+        escribir("SELECT setval('predios_id_predio_seq', (SELECT COALESCE(MAX(id_predio), 1) FROM predios), true);")
+        f.write("SELECT setval('tributos_id_tributo_seq', (SELECT COALESCE(MAX(id_tributo), 1) FROM tributos), true);")
+
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
     print(f"[OK] Generado {ruta_output}")
-    print(f"     {len(contribuyentes_unicos)} contribuyentes")
+    print(f"     {data.registro} registros")
     print(f"     {predios_insertados} predios")
     print(f"     {tributos_insertados} tributos")
-    print("\nAhora agrega este contenido al final de init.sql")
+    if comprimir:
+        print("\nMonta el archivo en /docker-entrypoint-initdb.d/ (despues de init.sql) para cargarlo al crear el contenedor")
+    else:
+        print("\nAhora agrega este contenido al final de init.sql")
+
+def parse_args():
+    """Argumentos de linea de comandos"""
+    parser = argparse.ArgumentParser(description="Genera data_inserts.sql desde data.json")
+    parser.add_argument('--archivo', default='data.json',
+                        help="Hogares en arreglo JSON o NDJSON (por defecto data.json)")
+    parser.add_argument('--salida', help="Archivo SQL de salida (por defecto database/data_inserts.sql)")
+    parser.add_argument('--formato', choices=['inserts', 'copy', 'values'], default='inserts',
+                        help="inserts: un INSERT por fila; copy: bloque COPY FROM stdin; values: INSERT multi-fila")
+    parser.add_argument('--lote', type=int, default=TAMANO_LOTE,
+                        help=f"Filas por INSERT en formato values (por defecto {TAMANO_LOTE})")
+    parser.add_argument('--comprimir', action='store_true',
+                        help="Escribir la salida comprimida con gzip (.sql.gz)")
+    parser.add_argument('--checkpoint',
+                        help="Archivo donde guardar el avance; si existe, se reanuda desde alli")
+    return parser.parse_args()
 
 if __name__ == '__main__':
-    generar_inserts_sql()
+    args = parse_args()
+    generar_inserts_sql(args.archivo, args.salida, args.checkpoint,
+                        args.formato, args.lote, args.comprimir)
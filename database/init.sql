@@ -6,6 +6,34 @@
 -- Habilitar extensión PostGIS
 CREATE EXTENSION IF NOT EXISTS postgis;
 
+-- Búsqueda aproximada por trigramas e insensible a tildes
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() no es IMMUTABLE (depende del diccionario configurado);
+-- esta versión fija el diccionario y puede usarse en índices
+CREATE OR REPLACE FUNCTION f_unaccent(texto TEXT)
+RETURNS TEXT AS $$
+  SELECT public.unaccent('public.unaccent'::regdictionary, texto)
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+
+-- Forma normalizada para búsquedas: sin tildes y en minúsculas
+CREATE OR REPLACE FUNCTION normalizar_busqueda(texto TEXT)
+RETURNS TEXT AS $$
+  SELECT lower(f_unaccent(texto))
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+
+-- =====================================================
+-- TABLA: sectores
+-- Catálogo de sectores; predios.sector es una dimensión exacta
+-- (los sectores nuevos se registran solos, ver trigger_registrar_sector)
+-- =====================================================
+CREATE TABLE sectores (
+  id_sector SERIAL PRIMARY KEY,
+  nombre VARCHAR(100) UNIQUE NOT NULL,
+  created_at TIMESTAMP DEFAULT NOW()
+);
+
 -- =====================================================
 -- TABLA: predios
 -- Almacena información catastral y geoespacial
@@ -14,7 +42,7 @@ CREATE TABLE predios (
   id_predio SERIAL PRIMARY KEY,
   codigo_catastral VARCHAR(50) UNIQUE NOT NULL,
   geom GEOMETRY(Point, 4326) NOT NULL,
-  sector VARCHAR(100),
+  sector VARCHAR(100) REFERENCES sectores(nombre) ON UPDATE CASCADE,
   tipo_vivienda VARCHAR(50),
   autovaluo DECIMAL(10,2) DEFAULT 0,
   numero_vivienda VARCHAR(20),
@@ -66,6 +94,19 @@ CREATE TABLE tributos (
   updated_at TIMESTAMP DEFAULT NOW()
 );
 
+-- =====================================================
+-- TABLA: zonas
+-- Polígonos de sectores y zonas de cobranza para análisis espacial
+-- =====================================================
+CREATE TABLE zonas (
+  id_zona SERIAL PRIMARY KEY,
+  nombre VARCHAR(100) NOT NULL,
+  tipo VARCHAR(50) NOT NULL DEFAULT 'SECTOR',
+  geom GEOMETRY(MultiPolygon, 4326) NOT NULL,
+  created_at TIMESTAMP DEFAULT NOW(),
+  UNIQUE (tipo, nombre)
+);
+
 -- =====================================================
 -- ÍNDICES para optimización de consultas
 -- =====================================================
@@ -73,13 +114,29 @@ CREATE TABLE tributos (
 -- Índice espacial para consultas geográficas
 CREATE INDEX idx_predios_geom ON predios USING GIST(geom);
 
+-- Índice sobre geography para búsquedas por radio en metros (ST_DWithin, <->)
+CREATE INDEX idx_predios_geog ON predios USING GIST((geom::geography));
+
+-- Índice espacial de zonas (ST_Contains con predios, vecindad entre zonas)
+CREATE INDEX idx_zonas_geom ON zonas USING GIST(geom);
+
 -- Índices para filtros comunes
 CREATE INDEX idx_tributos_estado ON tributos(estado_pago);
+
+-- Listado por deuda (orden de /api/predios): filtro por estado y/o rango de
+-- deuda recorriendo el índice en el mismo orden de la página
+CREATE INDEX idx_tributos_estado_deuda ON tributos(estado_pago, deuda_total DESC, id_predio DESC);
+CREATE INDEX idx_tributos_deuda ON tributos(deuda_total DESC, id_predio DESC);
 CREATE INDEX idx_tributos_predio ON tributos(id_predio);
 CREATE INDEX idx_tributos_contribuyente ON tributos(id_contribuyente);
 CREATE INDEX idx_predios_sector ON predios(sector);
 CREATE INDEX idx_contribuyentes_nombres ON contribuyentes(nombres);
 
+-- Índices de trigramas para /api/buscar (LIKE '%...%' y similitud con %)
+CREATE INDEX idx_contribuyentes_nombres_trgm ON contribuyentes USING GIN (normalizar_busqueda(nombres) gin_trgm_ops);
+CREATE INDEX idx_contribuyentes_dni_trgm ON contribuyentes USING GIN (dni gin_trgm_ops);
+CREATE INDEX idx_predios_codigo_trgm ON predios USING GIN (normalizar_busqueda(codigo_catastral) gin_trgm_ops);
+
 -- =====================================================
 -- VISTA: predios_completo
 -- Consulta optimizada para el mapa (JOIN de todas las tablas)
@@ -117,6 +174,49 @@ FROM predios p
 LEFT JOIN tributos t ON p.id_predio = t.id_predio
 LEFT JOIN contribuyentes c ON t.id_contribuyente = c.id_contribuyente;
 
+-- =====================================================
+-- VISTA: predios_features
+-- Feature GeoJSON ya construida por PostGIS para cada predio.
+-- Mismas propiedades que row_to_geojson_feature en el API
+-- (montos como texto, fechas en ISO 8601), sin pasar por Python.
+-- =====================================================
+CREATE OR REPLACE VIEW predios_features AS
+SELECT 
+  pc.id_predio,
+  pc.sector,
+  pc.estado_pago,
+  pc.deuda_total,
+  pc.contribuyente_nombre,
+  json_build_object(
+    'type', 'Feature',
+    'geometry', pc.geom_json,
+    'properties', json_build_object(
+      'id_predio', pc.id_predio,
+      'codigo_catastral', pc.codigo_catastral,
+      'sector', pc.sector,
+      'tipo_vivienda', pc.tipo_vivienda,
+      'autovaluo', pc.autovaluo::text,
+      'numero_vivienda', pc.numero_vivienda,
+      'id_contribuyente', pc.id_contribuyente,
+      'contribuyente_nombre', pc.contribuyente_nombre,
+      'contribuyente_dni', pc.contribuyente_dni,
+      'contribuyente_telefono', pc.contribuyente_telefono,
+      'id_tributo', pc.id_tributo,
+      'estado_pago', pc.estado_pago,
+      'deuda_total', pc.deuda_total::text,
+      'monto_impuesto', pc.monto_impuesto::text,
+      'pago_impuesto', pc.pago_impuesto,
+      'monto_arbitrios', pc.monto_arbitrios::text,
+      'pago_arbitrios', pc.pago_arbitrios,
+      'ingreso_familiar', pc.ingreso_familiar::text,
+      'cantidad_personas', pc.cantidad_personas,
+      'nivel_educativo_jefe', pc.nivel_educativo_jefe,
+      'servicios_basicos', pc.servicios_basicos,
+      'fecha_ultimo_pago', pc.fecha_ultimo_pago::text
+    )
+  )::text AS feature
+FROM predios_completo pc;
+
 -- =====================================================
 -- FUNCIÓN: calcular_estado_pago
 -- Determina automáticamente el estado basado en pagos
@@ -192,6 +292,95 @@ CREATE TRIGGER trigger_tributos_estado
   FOR EACH ROW
   EXECUTE FUNCTION trigger_actualizar_estado();
 
+-- =====================================================
+-- TRIGGER: registrar_sector
+-- Agrega al catálogo los sectores nuevos antes de validar la FK de predios
+-- =====================================================
+CREATE OR REPLACE FUNCTION trigger_registrar_sector()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF NEW.sector IS NOT NULL
+     AND NOT EXISTS (SELECT 1 FROM sectores WHERE nombre = NEW.sector) THEN
+    INSERT INTO sectores (nombre) VALUES (NEW.sector)
+    ON CONFLICT (nombre) DO NOTHING;
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_predios_sector
+  BEFORE INSERT OR UPDATE OF sector ON predios
+  FOR EACH ROW
+  EXECUTE FUNCTION trigger_registrar_sector();
+
+-- =====================================================
+-- VISTA MATERIALIZADA: estadisticas_sector_estado
+-- Agregados por sector y estado de pago para /api/estadisticas
+-- y /api/sectores. El API la refresca con CONCURRENTLY solo
+-- cuando estadisticas_cambios tiene transacciones registradas.
+-- =====================================================
+CREATE MATERIALIZED VIEW estadisticas_sector_estado AS
+SELECT 
+  COALESCE(p.sector, 'Sin sector') AS sector,
+  COALESCE(t.estado_pago, 'SIN_TRIBUTO') AS estado_pago,
+  COUNT(*) AS cantidad,
+  COUNT(DISTINCT p.id_predio) AS predios,
+  COALESCE(SUM(t.deuda_total), 0) AS deuda_total,
+  COALESCE(SUM(t.ingreso_familiar), 0) AS ingreso_suma,
+  COUNT(t.ingreso_familiar) AS ingreso_cantidad
+FROM predios p
+LEFT JOIN tributos t ON p.id_predio = t.id_predio
+GROUP BY 1, 2;
+
+-- Requerido por REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX idx_estadisticas_sector_estado ON estadisticas_sector_estado(sector, estado_pago);
+
+-- Último refresco (solo lo actualiza el API)
+CREATE TABLE estadisticas_refresco (
+  id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+  actualizado_en TIMESTAMP
+);
+
+INSERT INTO estadisticas_refresco (id, actualizado_en) VALUES (1, NOW());
+
+-- Transacciones que escribieron desde el último refresco: una fila por
+-- transacción, así los escritores concurrentes no compiten por una fila
+-- compartida y el refresco solo consume las ya confirmadas.
+-- `externo` distingue las escrituras que no hizo el API (application_name
+-- 'api_tributario'): solo esas obligan a recargar sus índices en memoria
+CREATE TABLE estadisticas_cambios (
+  txid BIGINT PRIMARY KEY DEFAULT txid_current(),
+  externo BOOLEAN NOT NULL DEFAULT (current_setting('application_name') <> 'api_tributario'),
+  registrado_en TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO estadisticas_cambios DEFAULT VALUES;
+
+-- Marca las estadísticas como desactualizadas (una vez por transacción)
+CREATE OR REPLACE FUNCTION trigger_marcar_estadisticas()
+RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO estadisticas_cambios DEFAULT VALUES ON CONFLICT (txid) DO NOTHING;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_tributos_estadisticas
+  AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON tributos
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION trigger_marcar_estadisticas();
+
+CREATE TRIGGER trigger_predios_estadisticas
+  AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON predios
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION trigger_marcar_estadisticas();
+
+-- Los cambios de polígonos también invalidan los análisis espaciales del API
+CREATE TRIGGER trigger_zonas_estadisticas
+  AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON zonas
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION trigger_marcar_estadisticas();
+
 -- =====================================================
 -- DATOS DE EJEMPLO (opcional para testing)
 -- =====================================================
@@ -209,10 +398,16 @@ CREATE TRIGGER trigger_tributos_estado
 --   (1, 1, 1200, false, 500, false),
 --   (2, 2, 800, true, 300, true);
 
+COMMENT ON TABLE sectores IS 'Catálogo de sectores (dimensión exacta de predios.sector)';
 COMMENT ON TABLE predios IS 'Catastro de predios con geometría PostGIS';
 COMMENT ON TABLE contribuyentes IS 'Propietarios y responsables de predios';
+COMMENT ON TABLE zonas IS 'Polígonos de sectores y zonas para análisis de morosidad';
 COMMENT ON TABLE tributos IS 'Información tributaria y estado de pagos';
 COMMENT ON VIEW predios_completo IS 'Vista consolidada para consultas del mapa';
+COMMENT ON VIEW predios_features IS 'Features GeoJSON serializadas en PostGIS para el API';
+COMMENT ON MATERIALIZED VIEW estadisticas_sector_estado IS 'Agregados por sector y estado de pago, refrescados por el API';
+COMMENT ON TABLE estadisticas_refresco IS 'Frescura de estadisticas_sector_estado';
+COMMENT ON TABLE estadisticas_cambios IS 'Transacciones con cambios pendientes de refrescar en las estadísticas';
 -- =====================================================
 -- DATOS PRECARGADOS DESDE data.json
 -- Total de registros: 220
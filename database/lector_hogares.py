@@ -0,0 +1,131 @@
+"""
+Lectura incremental de hogares desde JSON o NDJSON
+Decodifica un registro a la vez, por lo que la memoria no depende del
+tamano del archivo. Acepta:
+  - un arreglo JSON de hogares (formato de data.json)
+  - NDJSON: un hogar por linea
+
+Tras cada registro entregado, `registro` y `byte` indican cuantos
+registros se leyeron y el byte donde termina el ultimo; con esos dos
+valores se puede reanudar la lectura despues de una falla.
+"""
+
+import codecs
+import json
+import os
+
+TAMANO_BLOQUE = 1 << 20
+ESPACIOS = ' \t\r\n'
+
+def detectar_formato(ruta):
+    """'json' si el archivo empieza con '[', 'ndjson' en otro caso"""
+    with open(ruta, 'rb') as f:
+        inicio = f.read(4096).lstrip(codecs.BOM_UTF8).lstrip()
+    return 'json' if inicio.startswith(b'[') else 'ndjson'
+
+class LectorHogares:
+    """Iterable de hogares; cada iteracion vuelve a leer el archivo desde el punto de inicio"""
+
+    def __init__(self, ruta, desde_byte=0, desde_registro=0):
+        self.ruta = ruta
+        self.formato = detectar_formato(ruta)
+        self.desde_byte = desde_byte
+        self.desde_registro = desde_registro
+        self.byte = desde_byte
+        self.registro = desde_registro
+
+    def __iter__(self):
+        # Con desde_byte se continua la numeracion; sin el, se saltan los primeros registros
+        self.registro = self.desde_registro if self.desde_byte else 0
+        self.byte = self.desde_byte
+        registros = self._ndjson() if self.formato == 'ndjson' else self._arreglo()
+        for hogar, fin in registros:
+            self.registro += 1
+            self.byte = fin
+            if self.registro <= self.desde_registro:
+                continue
+            yield hogar
+
+    def _ndjson(self):
+        with open(self.ruta, 'rb') as f:
+            f.seek(self.desde_byte)
+            posicion = self.desde_byte
+            for linea in f:
+                posicion += len(linea)
+                texto = linea.strip()
+                if texto:
+                    yield json.loads(texto), posicion
+
+    def _arreglo(self):
+        decoder = json.JSONDecoder()
+        utf8 = codecs.getincrementaldecoder('utf-8')()
+        # Al reanudar se esta justo despues de un elemento: sigue ',' o ']'
+        estado = 'separador' if self.desde_byte else 'inicio'
+        posicion = self.desde_byte
+        buffer = ''
+        i = 0
+        eof = False
+
+        with open(self.ruta, 'rb') as f:
+            if posicion == 0 and f.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8:
+                posicion = len(codecs.BOM_UTF8)
+            f.seek(posicion)
+            while True:
+                # Saltar espacios
+                j = i
+                while j < len(buffer) and buffer[j] in ESPACIOS:
+                    j += 1
+                posicion += j - i
+                i = j
+
+                if i == len(buffer) or estado == 'elemento':
+                    if estado == 'elemento' and i < len(buffer):
+                        try:
+                            hogar, fin = decoder.raw_decode(buffer, i)
+                        except json.JSONDecodeError:
+                            if eof:
+                                raise
+                        else:
+                            posicion += len(buffer[i:fin].encode('utf-8'))
+                            i = fin
+                            estado = 'separador'
+                            yield hogar, posicion
+                            continue
+                    if eof:
+                        raise ValueError(f"JSON incompleto en {self.ruta} (byte {posicion})")
+                    bloque = f.read(TAMANO_BLOQUE)
+                    eof = not bloque
+                    buffer = buffer[i:] + utf8.decode(bloque, final=eof)
+                    i = 0
+                    continue
+
+                caracter = buffer[i]
+                if estado == 'inicio' and caracter == '[':
+                    estado = 'primero'
+                elif estado == 'primero' and caracter != ']':
+                    estado = 'elemento'
+                    continue
+                elif estado == 'separador' and caracter == ',':
+                    estado = 'elemento'
+                elif estado in ('primero', 'separador') and caracter == ']':
+                    return
+                else:
+                    raise ValueError(f"Caracter inesperado {caracter!r} en {self.ruta} (byte {posicion})")
+                posicion += len(caracter.encode('utf-8'))
+                i += 1
+
+def guardar_checkpoint(ruta, data, **extra):
+    """Registra hasta donde se procesaron datos, para reanudar tras una falla"""
+    if not ruta:
+        return
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump({'archivo': data.ruta, 'byte': data.byte, 'registro': data.registro, **extra}, f)
+    os.replace(temporal, ruta)
+
+def leer_checkpoint(ruta):
+    """Punto de reanudacion guardado por guardar_checkpoint (o None)"""
+    if not ruta or not os.path.exists(ruta):
+        return None
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return json.load(f)
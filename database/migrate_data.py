@@ -3,11 +3,19 @@ Script de migracion de datos JSON a PostGIS
 Convierte data.json existente al modelo tributario
 """
 
-import json
+import argparse
+import csv
+import io
+import multiprocessing
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import os
+import queue
 import sys
+import time
+import zlib
+
+from lector_hogares import LectorHogares, guardar_checkpoint, leer_checkpoint
 
 # Configuracion de encoding para Windows
 if sys.platform == 'win32':
@@ -42,20 +50,23 @@ def conectar_db():
         print(f"[ERROR] Error conectando a BD: {e}")
         sys.exit(1)
 
-def leer_json(archivo='data.json'):
-    """Lee el archivo JSON de datos"""
+def leer_json(archivo='data.json', desde_byte=0, desde_registro=0):
+    """
+    Abre el archivo de hogares (arreglo JSON o NDJSON) para leerlo de a un
+    registro, sin cargarlo completo en memoria
+    """
+    if os.path.isabs(archivo) or os.path.exists(archivo):
+        ruta = archivo
     # Primero intentar en /tmp/ (dentro del contenedor)
-    ruta_tmp = f'/tmp/{archivo}'
-    if os.path.exists(ruta_tmp):
-        ruta = ruta_tmp
+    elif os.path.exists(f'/tmp/{archivo}'):
+        ruta = f'/tmp/{archivo}'
     else:
         # Si no, buscar relativamente (ejecucion local)
         ruta = os.path.join(os.path.dirname(__file__), '..', archivo)
     
     try:
-        with open(ruta, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        print(f"[OK] Leidos {len(data)} registros de {archivo}")
+        data = LectorHogares(ruta, desde_byte, desde_registro)
+        print(f"[OK] Leyendo {archivo} ({data.formato}) desde el registro {desde_registro + 1}")
         return data
     except Exception as e:
         print(f"[ERROR] Error leyendo {archivo}: {e}")
@@ -120,7 +131,8 @@ def migrar_predios_tributos(conn, data, mapa_contribuyentes):
     tributos_insertados = 0
     errores = 0
     
-    for idx, hogar in enumerate(data, start=1):
+    for hogar in data:
+        idx = data.registro
         try:
             # Datos del predio
             codigo_catastral = hogar.get('id_hogar', f'HOG{idx:04d}')
@@ -217,7 +229,7 @@ def migrar_predios_tributos(conn, data, mapa_contribuyentes):
             # Commit cada 25 registros
             if idx % 25 == 0:
                 conn.commit()
-                print(f"  Procesados {idx}/{len(data)} registros ({predios_insertados} predios, {errores} errores)")
+                print(f"  Procesados {idx} registros ({predios_insertados} predios, {errores} errores)")
         
         except Exception as e:
             if idx <= 10:
@@ -239,6 +251,578 @@ def migrar_predios_tributos(conn, data, mapa_contribuyentes):
         print(f"[AVISO] {errores} registros con errores fueron omitidos")
     return predios_insertados, tributos_insertados
 
+# =====================================================
+# CARGA MASIVA (COPY + INSERT ... SELECT)
+# =====================================================
+
+COLUMNAS_STAGE = [
+    'idx', 'codigo_catastral', 'propietario', 'longitud', 'latitud',
+    'sector', 'tipo_vivienda', 'numero_vivienda', 'autovaluo',
+    'monto_impuesto', 'pago_impuesto', 'monto_arbitrios', 'pago_arbitrios',
+    'ingreso_familiar', 'cantidad_personas', 'nivel_educativo_jefe', 'servicios_basicos'
+]
+
+def normalizar_hogar(idx, hogar):
+    """Convierte un hogar de data.json en fila de staging (None si no tiene coordenadas)"""
+    latitud = hogar.get('latitud')
+    longitud = hogar.get('altitud')
+    if latitud is None or longitud is None:
+        return None
+    
+    ingreso_familiar = float(hogar.get('ingreso_familiar', 0))
+    return (
+        idx,
+        hogar.get('id_hogar', f'HOG{idx:04d}'),
+        hogar.get('propietario', 'Desconocido'),
+        float(longitud),
+        float(latitud),
+        'Jayllihuaya',
+        hogar.get('tipo_vivienda', 'Desconocido'),
+        str(hogar.get('numero_vivienda', '')),
+        ingreso_familiar * 50,
+        float(hogar.get('monto_impuesto', 0)),
+        bool(hogar.get('pago_impuesto', False)),
+        float(hogar.get('monto_arbitrios', 0)),
+        bool(hogar.get('pago_arbitrios', False)),
+        ingreso_familiar,
+        hogar.get('cantidad_personas'),
+        hogar.get('nivel_educativo_jefe'),
+        hogar.get('servicios_basicos')
+    )
+
+def crear_staging(cur, tabla='stage_hogares', temporal=True):
+    """
+    Tabla donde COPY deja los hogares antes de resolver IDs: temporal por
+    conexion (modo bulk) o UNLOGGED compartida por los workers (modo paralelo)
+    """
+    tipo = "TEMP TABLE IF NOT EXISTS" if temporal else "UNLOGGED TABLE"
+    al_confirmar = "ON COMMIT DELETE ROWS" if temporal else ""
+    cur.execute(f"""
+        CREATE {tipo} {tabla} (
+            idx INTEGER,
+            codigo_catastral VARCHAR(50),
+            propietario VARCHAR(200),
+            longitud DOUBLE PRECISION,
+            latitud DOUBLE PRECISION,
+            sector VARCHAR(100),
+            tipo_vivienda VARCHAR(50),
+            numero_vivienda VARCHAR(20),
+            autovaluo DECIMAL(10,2),
+            monto_impuesto DECIMAL(10,2),
+            pago_impuesto BOOLEAN,
+            monto_arbitrios DECIMAL(10,2),
+            pago_arbitrios BOOLEAN,
+            ingreso_familiar DECIMAL(10,2),
+            cantidad_personas INTEGER,
+            nivel_educativo_jefe VARCHAR(100),
+            servicios_basicos VARCHAR(50)
+        ) {al_confirmar}
+    """)
+
+def copiar_lote(cur, filas, tabla='stage_hogares'):
+    """Envía el lote a la tabla de staging con COPY FROM STDIN (CSV; vacío sin comillas = NULL)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    writer.writerows(filas)
+    buffer.seek(0)
+    cur.copy_expert(
+        f"COPY {tabla} ({', '.join(COLUMNAS_STAGE)}) FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+
+def resolver_lote(cur, tabla='stage_hogares'):
+    """
+    Inserta contribuyentes, predios y tributos de la tabla de staging con
+    sentencias por conjunto. Devuelve (predios, tributos) insertados.
+    """
+    # Contribuyentes nuevos (uno por nombre)
+    cur.execute(f"""
+        INSERT INTO contribuyentes (nombres, dni, telefono)
+        SELECT DISTINCT s.propietario, NULL, NULL
+        FROM {tabla} s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM contribuyentes c WHERE c.nombres = s.propietario
+        )
+    """)
+    
+    # Predios nuevos y sus tributos en una sola sentencia
+    cur.execute(f"""
+        WITH hogares AS (
+            SELECT DISTINCT ON (codigo_catastral) *
+            FROM {tabla}
+            ORDER BY codigo_catastral, idx
+        ),
+        nuevos AS (
+            INSERT INTO predios (codigo_catastral, geom, sector, tipo_vivienda, autovaluo, numero_vivienda)
+            SELECT codigo_catastral, ST_SetSRID(ST_MakePoint(longitud, latitud), 4326),
+                   sector, tipo_vivienda, autovaluo, numero_vivienda
+            FROM hogares
+            ORDER BY idx
+            ON CONFLICT (codigo_catastral) DO NOTHING
+            RETURNING id_predio, codigo_catastral
+        ),
+        contribuyentes_id AS (
+            SELECT nombres, MIN(id_contribuyente) AS id_contribuyente
+            FROM contribuyentes
+            WHERE nombres IN (SELECT propietario FROM hogares)
+            GROUP BY nombres
+        ),
+        tributos_nuevos AS (
+            INSERT INTO tributos (
+                id_predio, id_contribuyente,
+                monto_impuesto, pago_impuesto,
+                monto_arbitrios, pago_arbitrios,
+                ingreso_familiar, cantidad_personas,
+                nivel_educativo_jefe, servicios_basicos
+            )
+            SELECT n.id_predio, c.id_contribuyente,
+                   h.monto_impuesto, h.pago_impuesto,
+                   h.monto_arbitrios, h.pago_arbitrios,
+                   h.ingreso_familiar, h.cantidad_personas,
+                   h.nivel_educativo_jefe, h.servicios_basicos
+            FROM nuevos n
+            JOIN hogares h ON h.codigo_catastral = n.codigo_catastral
+            JOIN contribuyentes_id c ON c.nombres = h.propietario
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM nuevos) AS predios,
+               (SELECT COUNT(*) FROM tributos_nuevos) AS tributos
+    """)
+    return cur.fetchone()
+
+def migrar_bulk(conn, data, tamano_lote=5000, checkpoint=None):
+    """
+    Migra hogares por lotes: COPY a staging + INSERT ... SELECT, un commit por lote.
+    Tras cada commit se guarda el checkpoint (byte y registro del archivo).
+    Si un lote falla la migracion se detiene sin mover el checkpoint, para
+    que al reanudar se vuelva a intentar ese lote en lugar de saltarlo.
+    """
+    cur = conn.cursor()
+    crear_staging(cur)
+    conn.commit()
+    
+    predios_insertados = 0
+    tributos_insertados = 0
+    omitidos = 0
+    procesados = 0
+    inicio = time.perf_counter()
+    
+    def cargar(filas):
+        nonlocal predios_insertados, tributos_insertados
+        inicio_lote = time.perf_counter()
+        try:
+            copiar_lote(cur, filas)
+            predios, tributos = resolver_lote(cur)
+            conn.commit()
+            guardar_checkpoint(checkpoint, data)
+        except Exception as e:
+            conn.rollback()
+            print(f"[ERROR] Lote de registros {filas[0][0]} a {filas[-1][0]} rechazado: {e}")
+            print(f"[ERROR] Migracion detenida: {predios_insertados} predios y {tributos_insertados} tributos confirmados")
+            if checkpoint:
+                print(f"   El checkpoint {checkpoint} sigue en el ultimo lote confirmado; corregir y reanudar con --checkpoint")
+            cur.close()
+            conn.close()
+            sys.exit(1)
+        predios_insertados += predios
+        tributos_insertados += tributos
+        segundos = time.perf_counter() - inicio_lote
+        print(f"  Lote de {len(filas)} registros en {segundos:.2f}s ({len(filas) / max(segundos, 1e-9):,.0f} filas/s)")
+    
+    lote = []
+    for hogar in data:
+        procesados += 1
+        fila = normalizar_hogar(data.registro, hogar)
+        if fila is None:
+            omitidos += 1
+            continue
+        lote.append(fila)
+        if len(lote) >= tamano_lote:
+            cargar(lote)
+            lote = []
+    if lote:
+        cargar(lote)
+    
+    cur.close()
+    
+    segundos = time.perf_counter() - inicio
+    print(f"\n[OK] Migrados {predios_insertados} predios y {tributos_insertados} tributos "
+          f"en {segundos:.2f}s ({procesados / max(segundos, 1e-9):,.0f} filas/s)")
+    if omitidos > 0:
+        print(f"[AVISO] {omitidos} registros sin coordenadas fueron omitidos")
+    return predios_insertados, tributos_insertados
+
+# =====================================================
+# CARGA PARALELA (un proceso y una conexion por shard)
+# =====================================================
+
+TABLA_PARALELA = 'stage_hogares_paralelo'
+
+# Segundos entre revisiones de los workers mientras se espera una cola
+ESPERA_COLA = 1.0
+
+def shard_de(codigo, workers):
+    """Shard estable del hogar segun el hash de su codigo (id_hogar)"""
+    return zlib.crc32(codigo.encode('utf-8')) % workers
+
+def worker_carga(numero, cola, resultados):
+    """
+    Proceso worker: normaliza los hogares de cada lote que recibe y los copia
+    a staging con su propia conexion. Siempre deja en `resultados` una tupla
+    (numero, filas, omitidos, segundos, error) antes de terminar, tambien si
+    falla, para que el proceso principal no quede esperandolo.
+    """
+    filas = 0
+    omitidos = 0
+    inicio = time.perf_counter()
+    try:
+        conn = conectar_db()
+        cur = conn.cursor()
+        while True:
+            lote = cola.get()
+            if lote is None:
+                break
+            inicio_lote = time.perf_counter()
+            normalizadas = [normalizar_hogar(idx, hogar) for idx, hogar in lote]
+            normalizadas = [fila for fila in normalizadas if fila is not None]
+            omitidos += len(lote) - len(normalizadas)
+            if normalizadas:
+                copiar_lote(cur, normalizadas, TABLA_PARALELA)
+                conn.commit()
+            filas += len(normalizadas)
+            segundos = time.perf_counter() - inicio_lote
+            print(f"  [worker {numero}] {filas} filas ({len(lote) / max(segundos, 1e-9):,.0f} filas/s en el ultimo lote)")
+        cur.close()
+        conn.close()
+    except (Exception, SystemExit) as e:
+        # conectar_db termina con sys.exit si no hay conexion
+        error = "sin conexion a PostgreSQL" if isinstance(e, SystemExit) else f"{type(e).__name__}: {e}"
+        resultados.put((numero, filas, omitidos, time.perf_counter() - inicio, error))
+        return
+    resultados.put((numero, filas, omitidos, time.perf_counter() - inicio, None))
+
+def enviar_a_worker(cola, lote, proceso):
+    """put con espera acotada; False si el worker termino y ya no va a leer la cola"""
+    while True:
+        try:
+            cola.put(lote, timeout=ESPERA_COLA)
+            return True
+        except queue.Full:
+            if not proceso.is_alive():
+                return False
+
+def recibir_resultados(resultados, procesos, esperar_todos=True):
+    """
+    Resultado de cada worker. Deja de esperar si un worker termino sin
+    informar o, con esperar_todos=False, en cuanto la cola queda vacia
+    """
+    recibidos = {}
+    while len(recibidos) < len(procesos):
+        try:
+            resultado = resultados.get(timeout=ESPERA_COLA)
+            recibidos[resultado[0]] = resultado
+        except queue.Empty:
+            sin_informar = [proceso for numero, proceso in enumerate(procesos) if numero not in recibidos]
+            if not esperar_todos or any(not proceso.is_alive() for proceso in sin_informar):
+                break
+    # Lo que haya quedado en camino de un worker que termino justo antes
+    while True:
+        try:
+            resultado = resultados.get(timeout=0.1)
+            recibidos[resultado[0]] = resultado
+        except queue.Empty:
+            return list(recibidos.values())
+
+def abortar_paralelo(conn, cur, procesos, motivo):
+    """Detiene los workers, descarta la tabla de staging y sale con error"""
+    for proceso in procesos:
+        if proceso.is_alive():
+            proceso.terminate()
+        proceso.join()
+    conn.rollback()
+    cur.execute(f"DROP TABLE IF EXISTS {TABLA_PARALELA}")
+    conn.commit()
+    print(f"[ERROR] {motivo}; la tabla de staging no se fusiona")
+    sys.exit(1)
+
+def migrar_paralelo(conn, data, workers, tamano_lote=5000):
+    """
+    Reparte los hogares en `workers` shards por hash de id_hogar; cada worker
+    los normaliza y los copia a una tabla UNLOGGED compartida por su propia
+    conexion, y al final un unico paso por conjunto resuelve IDs y deduplica
+    propietarios. La lectura del archivo y esa fusion final corren en el
+    proceso principal, con una sola conexion.
+    """
+    cur = conn.cursor()
+    cur.execute(f"DROP TABLE IF EXISTS {TABLA_PARALELA}")
+    crear_staging(cur, TABLA_PARALELA, temporal=False)
+    conn.commit()
+    
+    inicio = time.perf_counter()
+    colas = [multiprocessing.Queue(maxsize=4) for _ in range(workers)]
+    resultados = multiprocessing.Queue()
+    procesos = [
+        multiprocessing.Process(target=worker_carga, args=(numero, colas[numero], resultados))
+        for numero in range(workers)
+    ]
+    for proceso in procesos:
+        proceso.start()
+    
+    # Reparto: un buffer de (registro, hogar) por shard, enviado al worker al llenarse
+    buffers = [[] for _ in range(workers)]
+    caido = None
+    try:
+        for hogar in data:
+            idx = data.registro
+            shard = shard_de(hogar.get('id_hogar', f'HOG{idx:04d}'), workers)
+            buffers[shard].append((idx, hogar))
+            if len(buffers[shard]) >= tamano_lote:
+                if not enviar_a_worker(colas[shard], buffers[shard], procesos[shard]):
+                    caido = shard
+                    break
+                buffers[shard] = []
+        if caido is None:
+            for shard in range(workers):
+                pendientes = [buffers[shard]] if buffers[shard] else []
+                if not all(enviar_a_worker(colas[shard], lote, procesos[shard]) for lote in pendientes + [None]):
+                    caido = shard
+                    break
+    except BaseException:
+        for proceso in procesos:
+            proceso.terminate()
+        raise
+    
+    # Si un worker cayo durante el reparto, los demas siguen esperando lotes: no se los espera
+    por_worker = recibir_resultados(resultados, procesos, esperar_todos=caido is None)
+    errores = [(numero, error) for numero, _, _, _, error in por_worker if error]
+    for numero, error in errores:
+        print(f"[ERROR] Worker {numero}: {error}")
+    if caido is not None or errores or len(por_worker) < workers:
+        abortar_paralelo(conn, cur, procesos, "Algun worker fallo")
+    for proceso in procesos:
+        proceso.join()
+    
+    segundos_carga = time.perf_counter() - inicio
+    total = sum(filas for _, filas, _, _, _ in por_worker)
+    omitidos = sum(resultado[2] for resultado in por_worker)
+    for numero, filas, _, segundos, _ in sorted(por_worker):
+        print(f"[OK] Worker {numero}: {filas} filas en {segundos:.2f}s ({filas / max(segundos, 1e-9):,.0f} filas/s)")
+    print(f"[OK] Staging: {total} filas en {segundos_carga:.2f}s ({total / max(segundos_carga, 1e-9):,.0f} filas/s)")
+    
+    # Fusion final: contribuyentes deduplicados por propietario, predios y tributos
+    inicio_fusion = time.perf_counter()
+    predios, tributos = resolver_lote(cur, TABLA_PARALELA)
+    cur.execute(f"DROP TABLE {TABLA_PARALELA}")
+    conn.commit()
+    cur.close()
+    
+    segundos = time.perf_counter() - inicio
+    print(f"[OK] Fusion en {time.perf_counter() - inicio_fusion:.2f}s")
+    print(f"\n[OK] Migrados {predios} predios y {tributos} tributos "
+          f"en {segundos:.2f}s ({total / max(segundos, 1e-9):,.0f} filas/s)")
+    if omitidos > 0:
+        print(f"[AVISO] {omitidos} registros sin coordenadas fueron omitidos")
+    return predios, tributos
+
+# =====================================================
+# SINCRONIZACION INCREMENTAL (diff por hash de contenido)
+# =====================================================
+
+TABLA_SYNC = 'stage_sync'
+
+# Campos que definen el contenido de un hogar (todo salvo idx y el codigo)
+CAMPOS_CONTENIDO = [c for c in COLUMNAS_STAGE if c not in ('idx', 'codigo_catastral')]
+
+def hash_contenido(alias):
+    """Expresion SQL con el hash del contenido de un hogar (staging o tablas actuales)"""
+    return f"md5(ROW({', '.join(f'{alias}.{c}' for c in CAMPOS_CONTENIDO)})::text)"
+
+def migrar_sync(conn, data, tamano_lote=5000):
+    """
+    Sincroniza las tablas con el archivo sin vaciarlas: compara cada hogar
+    con la fila actual de su codigo_catastral por hash de contenido, inserta
+    o actualiza solo los que cambiaron y elimina los que ya no estan.
+    Todo ocurre en una transaccion, por lo que las lecturas siguen viendo
+    los datos anteriores hasta el commit.
+    """
+    cur = conn.cursor()
+    inicio = time.perf_counter()
+    
+    # 1. Cargar el archivo completo a staging
+    crear_staging(cur, TABLA_SYNC)
+    omitidos = 0
+    lote = []
+    for hogar in data:
+        fila = normalizar_hogar(data.registro, hogar)
+        if fila is None:
+            omitidos += 1
+            continue
+        lote.append(fila)
+        if len(lote) >= tamano_lote:
+            copiar_lote(cur, lote, TABLA_SYNC)
+            lote = []
+    if lote:
+        copiar_lote(cur, lote, TABLA_SYNC)
+    
+    cur.execute(f"SELECT COUNT(DISTINCT codigo_catastral) FROM {TABLA_SYNC}")
+    total = cur.fetchone()[0]
+    if total == 0:
+        conn.rollback()
+        print("[ERROR] El archivo no tiene hogares con coordenadas; no se sincroniza (se eliminaria todo)")
+        sys.exit(1)
+    cur.execute(f"CREATE INDEX ON {TABLA_SYNC} (codigo_catastral)")
+    cur.execute(f"ANALYZE {TABLA_SYNC}")
+    print(f"[OK] {total} hogares en staging ({time.perf_counter() - inicio:.2f}s)")
+    
+    # 2. Hogares nuevos o con contenido distinto al actual
+    cur.execute(f"""
+        CREATE TEMP TABLE sync_cambios ON COMMIT DROP AS
+        WITH hogares AS (
+            SELECT DISTINCT ON (codigo_catastral) *
+            FROM {TABLA_SYNC}
+            ORDER BY codigo_catastral, idx
+        ),
+        actuales AS (
+            SELECT DISTINCT ON (p.id_predio)
+                   p.id_predio, t.id_tributo, p.codigo_catastral,
+                   c.nombres AS propietario,
+                   ST_X(p.geom) AS longitud, ST_Y(p.geom) AS latitud,
+                   p.sector, p.tipo_vivienda, p.numero_vivienda, p.autovaluo,
+                   t.monto_impuesto, t.pago_impuesto,
+                   t.monto_arbitrios, t.pago_arbitrios,
+                   t.ingreso_familiar, t.cantidad_personas,
+                   t.nivel_educativo_jefe, t.servicios_basicos
+            FROM predios p
+            LEFT JOIN tributos t ON t.id_predio = p.id_predio
+            LEFT JOIN contribuyentes c ON c.id_contribuyente = t.id_contribuyente
+            ORDER BY p.id_predio, t.id_tributo
+        )
+        SELECT h.*, a.id_predio, a.id_tributo
+        FROM hogares h
+        LEFT JOIN actuales a ON a.codigo_catastral = h.codigo_catastral
+        WHERE a.codigo_catastral IS NULL
+           OR {hash_contenido('h')} <> {hash_contenido('a')}
+    """)
+    cur.execute("SELECT COUNT(*) FROM sync_cambios")
+    cambios = cur.fetchone()[0]
+    
+    # 3. Contribuyentes nuevos (uno por nombre)
+    cur.execute("""
+        INSERT INTO contribuyentes (nombres, dni, telefono)
+        SELECT DISTINCT s.propietario, NULL, NULL
+        FROM sync_cambios s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM contribuyentes c WHERE c.nombres = s.propietario
+        )
+    """)
+    
+    # 4. Predios: upsert por codigo_catastral, sin tocar los que no cambian
+    cur.execute("""
+        WITH upsert AS (
+            INSERT INTO predios (codigo_catastral, geom, sector, tipo_vivienda, autovaluo, numero_vivienda)
+            SELECT codigo_catastral, ST_SetSRID(ST_MakePoint(longitud, latitud), 4326),
+                   sector, tipo_vivienda, autovaluo, numero_vivienda
+            FROM sync_cambios
+            ORDER BY idx
+            ON CONFLICT (codigo_catastral) DO UPDATE SET
+                geom = EXCLUDED.geom,
+                sector = EXCLUDED.sector,
+                tipo_vivienda = EXCLUDED.tipo_vivienda,
+                autovaluo = EXCLUDED.autovaluo,
+                numero_vivienda = EXCLUDED.numero_vivienda
+            WHERE (ST_X(predios.geom), ST_Y(predios.geom), predios.sector,
+                   predios.tipo_vivienda, predios.autovaluo, predios.numero_vivienda)
+                  IS DISTINCT FROM
+                  (ST_X(EXCLUDED.geom), ST_Y(EXCLUDED.geom), EXCLUDED.sector,
+                   EXCLUDED.tipo_vivienda, EXCLUDED.autovaluo, EXCLUDED.numero_vivienda)
+            RETURNING (xmax = 0) AS insertado
+        )
+        SELECT COUNT(*) FILTER (WHERE insertado), COUNT(*) FILTER (WHERE NOT insertado)
+        FROM upsert
+    """)
+    predios_nuevos, predios_actualizados = cur.fetchone()
+    
+    # 5. Tributos: solo se actualizan las filas distintas, asi el trigger de
+    #    estado (trigger_tributos_estado) corre unicamente para ellas
+    contribuyentes_id = """
+        SELECT nombres, MIN(id_contribuyente) AS id_contribuyente
+        FROM contribuyentes
+        WHERE nombres IN (SELECT propietario FROM sync_cambios)
+        GROUP BY nombres
+    """
+    cur.execute(f"""
+        UPDATE tributos t SET
+            id_contribuyente = c.id_contribuyente,
+            monto_impuesto = s.monto_impuesto,
+            pago_impuesto = s.pago_impuesto,
+            monto_arbitrios = s.monto_arbitrios,
+            pago_arbitrios = s.pago_arbitrios,
+            ingreso_familiar = s.ingreso_familiar,
+            cantidad_personas = s.cantidad_personas,
+            nivel_educativo_jefe = s.nivel_educativo_jefe,
+            servicios_basicos = s.servicios_basicos
+        FROM sync_cambios s
+        JOIN ({contribuyentes_id}) c ON c.nombres = s.propietario
+        WHERE t.id_tributo = s.id_tributo
+          AND (t.id_contribuyente, t.monto_impuesto, t.pago_impuesto,
+               t.monto_arbitrios, t.pago_arbitrios, t.ingreso_familiar,
+               t.cantidad_personas, t.nivel_educativo_jefe, t.servicios_basicos)
+              IS DISTINCT FROM
+              (c.id_contribuyente, s.monto_impuesto, s.pago_impuesto,
+               s.monto_arbitrios, s.pago_arbitrios, s.ingreso_familiar,
+               s.cantidad_personas, s.nivel_educativo_jefe, s.servicios_basicos)
+    """)
+    tributos_actualizados = cur.rowcount
+    
+    cur.execute(f"""
+        INSERT INTO tributos (
+            id_predio, id_contribuyente,
+            monto_impuesto, pago_impuesto,
+            monto_arbitrios, pago_arbitrios,
+            ingreso_familiar, cantidad_personas,
+            nivel_educativo_jefe, servicios_basicos
+        )
+        SELECT p.id_predio, c.id_contribuyente,
+               s.monto_impuesto, s.pago_impuesto,
+               s.monto_arbitrios, s.pago_arbitrios,
+               s.ingreso_familiar, s.cantidad_personas,
+               s.nivel_educativo_jefe, s.servicios_basicos
+        FROM sync_cambios s
+        JOIN predios p ON p.codigo_catastral = s.codigo_catastral
+        JOIN ({contribuyentes_id}) c ON c.nombres = s.propietario
+        WHERE s.id_tributo IS NULL
+    """)
+    tributos_nuevos = cur.rowcount
+    
+    # 6. Eliminar predios ausentes del archivo (sus tributos caen en cascada)
+    #    y contribuyentes que quedaron sin tributos
+    cur.execute(f"""
+        DELETE FROM predios p
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {TABLA_SYNC} s WHERE s.codigo_catastral = p.codigo_catastral
+        )
+    """)
+    predios_eliminados = cur.rowcount
+    cur.execute("""
+        DELETE FROM contribuyentes c
+        WHERE NOT EXISTS (
+            SELECT 1 FROM tributos t WHERE t.id_contribuyente = c.id_contribuyente
+        )
+    """)
+    contribuyentes_eliminados = cur.rowcount
+    
+    conn.commit()
+    cur.close()
+    
+    segundos = time.perf_counter() - inicio
+    print(f"\n[OK] Sincronizacion en {segundos:.2f}s: {total - cambios} hogares sin cambios")
+    print(f"  Predios: {predios_nuevos} nuevos, {predios_actualizados} actualizados, {predios_eliminados} eliminados")
+    print(f"  Tributos: {tributos_nuevos} nuevos, {tributos_actualizados} actualizados")
+    print(f"  Contribuyentes sin tributos eliminados: {contribuyentes_eliminados}")
+    if omitidos > 0:
+        print(f"[AVISO] {omitidos} registros sin coordenadas fueron omitidos (y sus predios, eliminados)")
+    return predios_nuevos + predios_actualizados, tributos_nuevos + tributos_actualizados
+
 def verificar_migracion(conn):
     """Verifica estadisticas de la migracion"""
     cur = conn.cursor()
@@ -273,32 +857,79 @@ def verificar_migracion(conn):
     cur.close()
     print("="*50 + "\n")
 
+def parse_args():
+    """Argumentos de linea de comandos"""
+    parser = argparse.ArgumentParser(description="Migra data.json a PostGIS")
+    parser.add_argument('--archivo', default='data.json',
+                        help="Hogares en arreglo JSON o NDJSON (por defecto data.json)")
+    parser.add_argument('--modo', choices=['bulk', 'fila', 'sync'], default='bulk',
+                        help="bulk: COPY + INSERT ... SELECT por lotes; fila: un INSERT por registro; "
+                             "sync: actualiza solo lo que cambio, sin vaciar las tablas")
+    parser.add_argument('--lote', type=int, default=5000,
+                        help="Registros por lote/commit en modo bulk (por defecto 5000)")
+    parser.add_argument('--desde-byte', type=int, default=0,
+                        help="Reanudar desde este byte del archivo (fin de un registro ya cargado)")
+    parser.add_argument('--desde-registro', type=int, default=0,
+                        help="Registros ya cargados; con --desde-byte continua la numeracion, sin el se saltan")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Procesos de carga en paralelo (modo bulk); cada uno usa su propia conexion")
+    parser.add_argument('--checkpoint',
+                        help="Archivo donde guardar el avance tras cada lote; si existe, se reanuda desde alli")
+    return parser.parse_args()
+
 def main():
     """Funcion principal de migracion"""
+    args = parse_args()
+    
     print("\n" + "="*50)
     print("MIGRACION DE DATOS A POSTGIS")
     print("="*50 + "\n")
     
+    # Reanudar desde checkpoint o posicion indicada
+    punto = leer_checkpoint(args.checkpoint)
+    if punto:
+        args.desde_byte, args.desde_registro = punto['byte'], punto['registro']
+        print(f"[OK] Reanudando desde checkpoint: registro {punto['registro']}, byte {punto['byte']}")
+    reanudando = args.desde_byte > 0 or args.desde_registro > 0
+    
     # 1. Leer JSON
-    data = leer_json()
+    data = leer_json(args.archivo, args.desde_byte, args.desde_registro)
     
     # 2. Conectar a BD
     conn = conectar_db()
     
-    # 3. Limpiar tablas
-    limpiar_tablas(conn)
-    
-    # 4. Migrar contribuyentes
-    mapa_contribuyentes = migrar_contribuyentes(conn, data)
+    # 3. Limpiar tablas (no al reanudar: ya hay datos confirmados; no al sincronizar)
+    if not reanudando and args.modo != 'sync':
+        limpiar_tablas(conn)
     
-    # 5. Migrar predios y tributos
-    migrar_predios_tributos(conn, data, mapa_contribuyentes)
+    if args.modo == 'sync':
+        # 4-5. Sincronizar contra las filas actuales
+        if reanudando or args.checkpoint or args.workers > 1:
+            print("[AVISO] --checkpoint, --desde-* y --workers no aplican a --modo sync: se compara el archivo completo")
+            data = leer_json(args.archivo)
+        migrar_sync(conn, data, args.lote)
+    elif args.modo == 'bulk' and args.workers > 1:
+        # 4-5. Cargar en paralelo por shards y fusionar
+        if args.checkpoint:
+            print("[AVISO] --checkpoint no se usa con --workers: la fusion es un unico paso al final")
+        migrar_paralelo(conn, data, args.workers, args.lote)
+    elif args.modo == 'bulk':
+        # 4-5. Migrar contribuyentes, predios y tributos por lotes
+        migrar_bulk(conn, data, args.lote, args.checkpoint)
+    else:
+        # 4. Migrar contribuyentes
+        mapa_contribuyentes = migrar_contribuyentes(conn, data)
+        
+        # 5. Migrar predios y tributos
+        migrar_predios_tributos(conn, data, mapa_contribuyentes)
     
     # 6. Verificar migracion
     verificar_migracion(conn)
     
     # 7. Cerrar conexion
     conn.close()
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
     print("[OK] Migracion completada exitosamente\n")
 
 if __name__ == '__main__':
@@ -19,6 +19,8 @@ const capasBaseConfig = {
 // Estado global
 let prediosLayer = null;
 let heatLayer = null;
+let clustersLayer = null;
+let filtrosActuales = {};
 let chartServicios = null;
 let chartDeuda = null;
 let currentGeojson = null;
@@ -185,6 +187,7 @@ function performSearch() {
 async function cargarPredios(filtros = {}) {
   try {
     showLoading(true);
+    filtrosActuales = filtros;
 
     // Construir URL con filtros
     const params = new URLSearchParams();
@@ -198,12 +201,22 @@ async function cargarPredios(filtros = {}) {
       params.append('deuda_max', filtros.deuda_max);
     }
 
-    const url = `${API_URL}/api/predios${params.toString() ? '?' + params.toString() : ''}`;
-
-    const response = await fetch(url);
-    if (!response.ok) throw new Error('Error al cargar predios');
-
-    const geojson = await response.json();
+    // La API pagina por cursor: seguir metadata.next_cursor hasta el final
+    const geojson = { type: 'FeatureCollection', features: [], metadata: {} };
+    let cursor = null;
+    do {
+      if (cursor) params.set('cursor', cursor);
+      const url = `${API_URL}/api/predios${params.toString() ? '?' + params.toString() : ''}`;
+
+      const response = await fetch(url);
+      if (!response.ok) throw new Error('Error al cargar predios');
+
+      const pagina = await response.json();
+      geojson.features.push(...pagina.features);
+      geojson.metadata = pagina.metadata;
+      cursor = pagina.metadata.next_cursor;
+    } while (cursor);
+    geojson.metadata.total = geojson.features.length;
     currentGeojson = geojson;
 
     // Aplicar filtros locales adicionales (servicios básicos, ingreso)
@@ -279,6 +292,77 @@ function renderizarPredios(geojson) {
   if (geojson.features.length > 0 && prediosLayer.getBounds().isValid()) {
     map.fitBounds(prediosLayer.getBounds(), { padding: [50, 50], maxZoom: 16 });
   }
+  actualizarVistaClusters();
+}
+
+// =====================================================
+// CLUSTERS (vistas alejadas)
+// =====================================================
+
+// Por debajo de este zoom se muestran grupos calculados en el servidor
+const ZOOM_CLUSTERS = 15;
+
+async function actualizarVistaClusters() {
+  if (!map) return;
+
+  if (map.getZoom() >= ZOOM_CLUSTERS) {
+    if (clustersLayer) {
+      map.removeLayer(clustersLayer);
+      clustersLayer = null;
+    }
+    if (prediosLayer && !map.hasLayer(prediosLayer)) {
+      prediosLayer.addTo(map);
+    }
+    return;
+  }
+
+  if (prediosLayer && map.hasLayer(prediosLayer)) {
+    map.removeLayer(prediosLayer);
+  }
+
+  const params = new URLSearchParams();
+  params.append('zoom', map.getZoom());
+  params.append('bbox', map.getBounds().toBBoxString());
+  if (filtrosActuales.estado && filtrosActuales.estado !== 'all') {
+    params.append('estado', filtrosActuales.estado);
+  }
+  if (filtrosActuales.deuda_min) {
+    params.append('deuda_min', filtrosActuales.deuda_min);
+  }
+  if (filtrosActuales.deuda_max) {
+    params.append('deuda_max', filtrosActuales.deuda_max);
+  }
+
+  try {
+    const response = await fetch(`${API_URL}/api/predios/clusters?${params.toString()}`);
+    if (!response.ok) throw new Error('Error al cargar clusters');
+    const geojson = await response.json();
+
+    if (clustersLayer) {
+      map.removeLayer(clustersLayer);
+    }
+    clustersLayer = L.geoJSON(geojson, {
+      pointToLayer: function (feature, latlng) {
+        const p = feature.properties;
+        // Color del estado predominante en el grupo
+        const estado = Object.keys(p.estados).reduce((a, b) => p.estados[a] >= p.estados[b] ? a : b);
+        return L.circleMarker(latlng, {
+          radius: Math.min(8 + Math.log2(p.cantidad) * 3, 30),
+          fillColor: getColorByEstado(estado),
+          color: '#fff',
+          weight: 2,
+          opacity: 1,
+          fillOpacity: 0.7
+        }).bindPopup(
+          `<strong>${p.cantidad} predios</strong><br>` +
+          `Deuda total: S/ ${p.deuda_total.toFixed(2)}<br>` +
+          `Morosos: ${p.estados.MOROSO} · Al día: ${p.estados.AL_DIA} · Exonerados: ${p.estados.EXONERADO}`
+        );
+      }
+    }).addTo(map);
+  } catch (error) {
+    console.error('Error cargando clusters:', error);
+  }
 }
 
 // =====================================================
@@ -293,7 +377,7 @@ async function buscarContribuyente(nombre) {
 
   try {
     showLoading(true);
-    const url = `${API_URL}/api/buscar?nombre=${encodeURIComponent(nombre)}`;
+    const url = `${API_URL}/api/buscar?nombre=${encodeURIComponent(nombre)}&limit=50`;
     const response = await fetch(url);
 
     if (!response.ok) throw new Error('Error en búsqueda');
@@ -519,28 +603,29 @@ function actualizarGraficoDeuda(features) {
 // MAPA DE CALOR
 // =====================================================
 
-function construirHeatmap(features) {
+async function construirHeatmap() {
   if (heatLayer) {
     map.removeLayer(heatLayer);
     heatLayer = null;
   }
 
-  const points = [];
-  let maxDeuda = 0;
-
-  features.forEach(f => {
-    const deuda = parseFloat(f.properties.deuda_total) || 0;
-    if (deuda > 0 && f.geometry.coordinates) {
-      const coords = f.geometry.coordinates;
-      points.push([coords[1], coords[0], deuda]);
-      if (deuda > maxDeuda) maxDeuda = deuda;
-    }
-  });
+  // Grilla agregada en el servidor para el área visible (celdas de ~50 m)
+  let data;
+  try {
+    const params = new URLSearchParams({ resolucion: 50, bbox: map.getBounds().toBBoxString() });
+    const response = await fetch(`${API_URL}/api/heatmap?${params.toString()}`);
+    if (!response.ok) throw new Error('Error al cargar mapa de calor');
+    data = await response.json();
+  } catch (error) {
+    console.error('Error cargando mapa de calor:', error);
+    return;
+  }
 
-  if (points.length === 0) return;
+  const heatPoints = data.celdas
+    .filter(c => c.deuda_total > 0)
+    .map(c => [c.lat, c.lng, c.peso]);
 
-  // Normalizar pesos
-  const heatPoints = points.map(p => [p[0], p[1], p[2] / (maxDeuda || 1)]);
+  if (heatPoints.length === 0) return;
 
   heatLayer = L.heatLayer(heatPoints, {
     radius: 25,
@@ -728,9 +813,7 @@ document.addEventListener('DOMContentLoaded', () => {
   // Mapa de calor
   document.getElementById('toggle-heatmap')?.addEventListener('change', (e) => {
     if (e.target.checked) {
-      if (currentGeojson) {
-        construirHeatmap(currentGeojson.features);
-      }
+      construirHeatmap();
     } else {
       if (heatLayer) {
         map.removeLayer(heatLayer);
@@ -761,11 +844,49 @@ function configurarBusqueda() {
         buscarContribuyente(inputSearch.value);
       }
     });
+
+    // 3. Sugerencias mientras se escribe (índice en memoria del API)
+    configurarSugerencias(inputSearch);
   } else {
     console.warn('Elementos de búsqueda no encontrados en el DOM');
   }
 }
 
+// Sugerencias: lista de nombres bajo el cuadro de búsqueda
+function configurarSugerencias(inputSearch) {
+  const lista = document.createElement('datalist');
+  lista.id = 'search-sugerencias';
+  inputSearch.after(lista);
+  inputSearch.setAttribute('list', lista.id);
+
+  let temporizador = null;
+  inputSearch.addEventListener('input', () => {
+    clearTimeout(temporizador);
+    const texto = inputSearch.value.trim();
+    if (!texto) {
+      lista.innerHTML = '';
+      return;
+    }
+    temporizador = setTimeout(async () => {
+      try {
+        const url = `${API_URL}/api/buscar/sugerencias?q=${encodeURIComponent(texto)}&limit=10`;
+        const response = await fetch(url);
+        if (!response.ok) return;
+        const data = await response.json();
+        const nombres = [...new Set(data.sugerencias.map(s => s.nombre))];
+        lista.innerHTML = '';
+        nombres.forEach(nombre => {
+          const opcion = document.createElement('option');
+          opcion.value = nombre;
+          lista.appendChild(opcion);
+        });
+      } catch (error) {
+        console.warn('Sugerencias no disponibles:', error);
+      }
+    }, 150);
+  });
+}
+
 // Llamar a configuración
 configurarBusqueda();
 
@@ -806,6 +927,14 @@ function initMap() {
 
   // Evento CLICK para Crear Predio
   map.on('click', onMapClick);
+
+  // Clusters del servidor al alejar el mapa
+  map.on('moveend', actualizarVistaClusters);
+
+  // El mapa de calor se pide para el área visible
+  map.on('moveend', () => {
+    if (heatLayer) construirHeatmap();
+  });
 }
 
 
@@ -854,9 +983,18 @@ function abrirModalCreacion(lat, lng) {
 }
 
 // Función global para ser llamada desde el popup
-window.editarPredio = function (id) {
+window.editarPredio = async function (id) {
   currentPredioId = id;
-  const feature = currentGeojson.features.find(f => f.properties.id_predio === id);
+
+  // Detalle completo desde la API; si falla, el predio cargado en el mapa
+  let feature = null;
+  try {
+    const response = await fetch(`${API_URL}/api/predios/${id}`);
+    if (response.ok) feature = await response.json();
+  } catch (error) {
+    console.error('Error cargando detalle del predio:', error);
+  }
+  feature = feature || currentGeojson.features.find(f => f.properties.id_predio === id);
   if (!feature) return;
 
   const p = feature.properties;